@@ -1,22 +1,33 @@
-from flask import Flask, render_template, request, jsonify, send_file, g, url_for
+if __name__ == '__main__':
+    # Start through server.py: image pool workers are spawned, and spawn re-imports the
+    # launching script in every worker, where this module's setup must not run
+    import runpy
+    runpy.run_module('server', run_name='__main__', alter_sys=True)
+    raise SystemExit
+
+# First, so MDR_STARTUP_REPORT=1 can time every other import
+import startup
+from flask import Flask, Response, render_template, request, jsonify, g, url_for
 import json
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
 import re
+import asyncio
 import hashlib
+import threading
+from urllib.parse import unquote, urlparse
 import time
 from functools import wraps
 from collections import defaultdict
+from limits import RateLimitItemPerSecond
 from werkzeug.utils import secure_filename
-from PIL import Image
-import pandas as pd
-import openai
 from dotenv import load_dotenv
 import base64
-from io import BytesIO
-import httpx
+import importlib
+
+startup.mark('imports')
 
 # Load environment variables and profiles
 load_dotenv()
@@ -35,38 +46,113 @@ with open(profiles_path) as f:
 
 
 # API Response Caching
-metadata_cache = {}
+from cache import create_cache, start_sweeper
+from storage import StorageFull, UploadCatalog, UploadStore, hash_file
+from imaging import PayloadCache, build_payload, create_image_pool, payload_key
+from near_duplicates import NearDuplicateIndex, dhash
+from exporters import export_filename, stream_export, FORMATS as EXPORT_FORMATS
+import metrics
+from backends import SQLiteManager, SQLiteStorage  # noqa: F401 (registers sqlite:// rate-limit storage)
+metadata_cache = create_cache(config)
+start_sweeper(metadata_cache, config.cache_sweep_interval)
+# Encoded JPEG payloads, so other profiles and retries of the same image skip Pillow work
+payload_cache = None
+if config.payload_cache_max_bytes:
+    payload_cache = PayloadCache(os.path.join(config.data_folder, 'payloads'), config.payload_cache_max_bytes)
+    # Also picks up payloads written by image pool workers
+    start_sweeper(payload_cache, config.cache_sweep_interval, label='Payloads')
+# CPU-bound preprocessing runs in its own processes, sized independently of API concurrency
+image_pool = None
+if config.image_workers:
+    image_pool = create_image_pool(
+        config.image_workers,
+        cache_dir=payload_cache.directory if payload_cache else None,
+        cache_max_bytes=config.payload_cache_max_bytes
+    )
 CACHE_TTL = config.cache_ttl
 
 
+# Perceptual hashes let re-exports of the same artwork reuse cached metadata
+near_duplicate_index = None
+if config.near_duplicate_threshold > 0:
+    near_duplicate_index = NearDuplicateIndex(
+        os.path.join(config.data_folder, 'near_duplicates.db'),
+        threshold=config.near_duplicate_threshold
+    )
+
+# Uploads are stored by content hash under the upload folder
+upload_store = UploadStore(config.upload_folder, chunk_size=config.upload_chunk_size)
+# Disk use of the upload folder; exported images are evicted to stay within the quota
+upload_catalog = UploadCatalog(
+    upload_store, config.uploads_path,
+    max_bytes=config.upload_max_bytes,
+    max_files=config.upload_max_files,
+    min_idle=config.upload_evict_min_idle
+)
+threading.Thread(target=upload_catalog.scan, name='upload-scan', daemon=True).start()
+start_sweeper(upload_catalog, config.cache_sweep_interval, label='Uploads')
+
+
 def get_image_hash(image_path):
     """Generate consistent hash for image content."""
+    # Content-addressed uploads carry their hash in the path; no need to re-read them
+    content_hash = upload_store.hash_from_path(image_path)
+    if content_hash:
+        return content_hash
     try:
-        with open(image_path, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+        return hash_file(image_path)
     except Exception:
         return None
 
 
+def profile_fingerprint(profile):
+    """Short hash of the profile settings that shape AI output.
+
+    Included in cache keys so editing a profile's prompt, fields,
+    categories or model invalidates only that profile's entries.
+    """
+    settings = {
+        'prompt': profile.get('prompt', ''),
+        'required_fields': profile.get('required_fields', []),
+        'categories': profile.get('categories', []),
+        'model': profile.get('model', config.openai_model)
+    }
+    encoded = json.dumps(settings, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+def get_cache_key(image_hash, profile_name):
+    """Build the cache key for an image under the current profile version."""
+    return f"{image_hash}:{profile_name}:{profile_fingerprint(PROFILES[profile_name])}"
+
+
 def get_cached_metadata(image_hash, profile_name):
     """Retrieve cached metadata if available and not expired."""
-    cache_key = f"{image_hash}:{profile_name}"
-    if cache_key in metadata_cache:
-        entry = metadata_cache[cache_key]
-        if time.time() - entry['timestamp'] < CACHE_TTL:
-            return entry['metadata']
-        # Cache expired, remove it
-        del metadata_cache[cache_key]
-    return None
+    cache_key = get_cache_key(image_hash, profile_name)
+    try:
+        return metadata_cache.get(cache_key)
+    except Exception as e:
+        print(f"Cache read failed for {cache_key}: {e}", flush=True)
+        return None
 
 
 def cache_metadata(image_hash, profile_name, metadata):
     """Store metadata in cache with timestamp."""
-    cache_key = f"{image_hash}:{profile_name}"
-    metadata_cache[cache_key] = {
-        'metadata': metadata,
-        'timestamp': time.time()
-    }
+    cache_key = get_cache_key(image_hash, profile_name)
+    try:
+        metadata_cache.set(cache_key, metadata)
+    except Exception as e:
+        print(f"Cache write failed for {cache_key}: {e}", flush=True)
+
+
+def get_profile_cache_keys(profile_name):
+    """Group cached keys for a profile by the profile version they were built with."""
+    versions = defaultdict(list)
+    for key in metadata_cache.keys():
+        parts = key.split(':')
+        if len(parts) == 3 and parts[1] == profile_name:
+            versions[parts[2]].append(key)
+    return versions
 
 
 # Security: Validation helpers
@@ -79,27 +165,44 @@ def validate_api_key_format(key):
     return bool(re.match(r'^sk-[a-zA-Z0-9_-]{20,}$', key))
 
 
+def validate_job_id(job_id):
+    """Validate a client-chosen job id (letters, digits, '-' and '_')."""
+    return isinstance(job_id, str) and bool(re.match(r'^[A-Za-z0-9_-]{8,64}$', job_id))
+
+
 def validate_profile_name(profile_name):
     """Validate profile name exists in configuration."""
     return profile_name in PROFILES
 
 
+def valid_group_size(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= config.max_group_size
+
+
 def validate_file_path(file_path, base_dir):
     """Prevent path traversal attacks by ensuring path is within base directory."""
     if not file_path or not isinstance(file_path, str):
         return False
     # Normalize paths
     base_dir = os.path.realpath(base_dir)
-    full_path = os.path.realpath(os.path.join(base_dir, os.path.basename(file_path)))
+    full_path = os.path.realpath(os.path.join(base_dir, file_path))
     # Ensure path is within base directory
-    return full_path.startswith(base_dir)
+    return full_path != base_dir and os.path.commonpath([base_dir, full_path]) == base_dir
 
 
 def classify_error(exception):
     """Classify exception into user-friendly category with actionable guidance."""
     error_str = str(exception).lower()
 
-    if 'unauthorized' in error_str or 'invalid api key' in error_str or '401' in error_str:
+    if isinstance(exception, (Cancelled, CancelledError)):
+        return {
+            'category': 'cancelled',
+            'title': 'Cancelled',
+            'message': 'Generation was cancelled',
+            'action': 'Generate again when needed',
+            'retry_allowed': True
+        }
+    elif 'unauthorized' in error_str or 'invalid api key' in error_str or '401' in error_str:
         return {
             'category': 'auth',
             'title': 'Authentication Error',
@@ -149,6 +252,14 @@ def classify_error(exception):
         }
 
 
+def classify_failure(exception):
+    """classify_error for an image that has finally failed; counts it in the metrics."""
+    error_info = classify_error(exception)
+    metrics.errors_total.inc(category=error_info['category'])
+    metrics.images_total.inc(outcome='failed')
+    return error_info
+
+
 def check_api_key(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -167,28 +278,22 @@ limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=config.default_rate_limits,
-    storage_uri="memory://",
+    storage_uri=config.rate_limit_storage_uri,
     strategy="fixed-window"
 )
 
-# Socket.IO rate limiting (simple in-memory tracker)
-socket_rate_limits = defaultdict(lambda: {'count': 0, 'reset_time': 0})
+# Socket.IO rate limiting, counted in the same store as the HTTP limits
 SOCKET_RATE_LIMIT = config.socket_rate_limit
 SOCKET_RATE_WINDOW = config.socket_rate_window
 
 
-def check_socket_rate_limit(sid):
-    """Check if socket client has exceeded rate limit."""
-    now = time.time()
-    client = socket_rate_limits[sid]
+def socket_rate_item():
+    return RateLimitItemPerSecond(SOCKET_RATE_LIMIT, SOCKET_RATE_WINDOW)
 
-    # Reset counter if window has passed
-    if now >= client['reset_time']:
-        client['count'] = 0
-        client['reset_time'] = now + SOCKET_RATE_WINDOW
 
-    client['count'] += 1
-    return client['count'] <= SOCKET_RATE_LIMIT
+def check_socket_rate_limit(sid):
+    """Check if socket client has exceeded rate limit."""
+    return limiter.limiter.hit(socket_rate_item(), 'socket', sid)
 
 
 # Security: Use config for SECRET_KEY
@@ -198,10 +303,19 @@ app.config['SECRET_KEY'] = config.secret_key
 for warning in config.validate():
     print(warning, flush=True)
 
+# With several worker processes, emits are relayed through a shared message queue
+socketio_queue = {}
+if config.socketio_message_queue:
+    if config.socketio_message_queue.startswith('sqlite:'):
+        socketio_queue['client_manager'] = SQLiteManager(config.socketio_message_queue)
+    else:
+        socketio_queue['message_queue'] = config.socketio_message_queue
+
 socketio = SocketIO(app,
                   cors_allowed_origins=config.allowed_origins,
                   async_mode='threading',
-                  max_http_buffer_size=100 * 1024 * 1024)  # 100MB max for base64 images
+                  max_http_buffer_size=100 * 1024 * 1024,  # 100MB max for base64 images
+                  **socketio_queue)
 
 # Use config for upload folder
 app.config['UPLOAD_FOLDER'] = config.upload_folder
@@ -232,7 +346,8 @@ def add_security_headers(response):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    socket_options = {'transports': ['websocket']} if config.socketio_websocket_only else {}
+    return render_template('index.html', socket_options=socket_options)
 
 @app.route('/api/profiles')
 def get_profiles():
@@ -281,6 +396,13 @@ def create_profile():
         'categories': data.get('categories', []),
         'csv_columns': ['full_path'] + required_fields
     }
+    if data.get('model'):
+        PROFILES[profile_id]['model'] = data['model']
+    if data.get('group_size'):
+        if not valid_group_size(data['group_size']):
+            del PROFILES[profile_id]
+            return jsonify({'error': f'group_size must be between 1 and {config.max_group_size}'}), 400
+        PROFILES[profile_id]['group_size'] = data['group_size']
 
     if save_profiles_to_file():
         return jsonify({'id': profile_id, 'profile': PROFILES[profile_id]})
@@ -312,6 +434,19 @@ def update_profile(profile_id):
         'categories': data.get('categories', old_profile.get('categories', [])),
         'csv_columns': ['full_path'] + required_fields
     })
+    if 'model' in data:
+        if data['model']:
+            PROFILES[profile_id]['model'] = data['model']
+        else:
+            PROFILES[profile_id].pop('model', None)
+    if 'group_size' in data:
+        if data['group_size'] and not valid_group_size(data['group_size']):
+            PROFILES[profile_id] = old_profile
+            return jsonify({'error': f'group_size must be between 1 and {config.max_group_size}'}), 400
+        if data['group_size'] and data['group_size'] > 1:
+            PROFILES[profile_id]['group_size'] = data['group_size']
+        else:
+            PROFILES[profile_id].pop('group_size', None)
 
     if save_profiles_to_file():
         return jsonify({'id': profile_id, 'profile': PROFILES[profile_id]})
@@ -321,6 +456,54 @@ def update_profile(profile_id):
         return jsonify({'error': 'Failed to save profile'}), 500
 
 
+@app.route('/api/cache/profiles/<profile_id>')
+def get_profile_cache(profile_id):
+    """Report cached entry counts per version of a profile."""
+    if profile_id not in PROFILES:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    current = profile_fingerprint(PROFILES[profile_id])
+    versions = get_profile_cache_keys(profile_id)
+    return jsonify({
+        'profile': profile_id,
+        'current_version': current,
+        'versions': [
+            {'version': version, 'entries': len(keys), 'current': version == current}
+            for version, keys in versions.items()
+        ]
+    })
+
+
+@app.route('/api/cache/profiles/<profile_id>', methods=['DELETE'])
+def purge_profile_cache(profile_id):
+    """Purge cached entries for one profile version, stale versions, or all versions."""
+    if profile_id not in PROFILES:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    # version may be a fingerprint, 'stale' (every non-current version) or 'all'
+    version = request.args.get('version', 'stale')
+    current = profile_fingerprint(PROFILES[profile_id])
+    versions = get_profile_cache_keys(profile_id)
+
+    if version == 'all':
+        targets = [key for keys in versions.values() for key in keys]
+    elif version == 'stale':
+        targets = [key for v, keys in versions.items() if v != current for key in keys]
+    else:
+        targets = versions.get(version, [])
+
+    removed = metadata_cache.delete_many(targets)
+    return jsonify({'profile': profile_id, 'version': version, 'removed': removed})
+
+
+def verify_image(path):
+    """Raise if the file at path is not a readable image."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.verify()
+
+
 @app.route('/upload', methods=['POST'])
 @limiter.limit(config.upload_rate_limit)
 def upload():
@@ -330,6 +513,7 @@ def upload():
             return jsonify({'error': 'No files selected'}), 400
         
         image_data = []
+        storage_full = 0
         allowed_extensions = set(config.allowed_extensions)
 
         for image in images:
@@ -352,29 +536,30 @@ def upload():
 
             if file_size > config.max_file_size:
                 continue
-                
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            # Ensure upload directory exists
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            
+
             try:
-                image.save(filepath)
-                # Verify it's a valid image
-                with Image.open(filepath) as img:
-                    img.verify()
-            except Exception as e:
-                # Remove invalid file if it was saved
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+                # Stream to disk once, hashing as the bytes arrive. New content must fit the
+                # quota (evicting exported images if needed); duplicates need no new space
+                content_hash, filepath, duplicate = upload_store.save(
+                    image.stream, filename, config.max_file_size, verify=verify_image,
+                    reserve=lambda size: upload_catalog.make_room(size, 1)
+                )
+            except StorageFull:
+                storage_full += 1
                 continue
-        
+            except Exception:
+                continue
+            upload_catalog.record(filepath)
+
             # Use url_for to generate proper URL for the image
-            image_url = url_for('static', filename=f'images/{filename}')
-            
+            relative_path = os.path.relpath(filepath, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+            image_url = url_for('static', filename=f'images/{relative_path}')
+
             image_data.append({
                 'full_path': image_url,  # Use URL instead of filesystem path
                 'file_path': filepath,   # Keep internal filesystem path for processing
+                'hash': content_hash,
+                'duplicate': duplicate,
                 'title': '',
                 'description': '',
                 'tags': '',
@@ -382,15 +567,133 @@ def upload():
             })
 
         if not image_data:
+            if storage_full:
+                return jsonify({'error': 'Upload storage is full. Export finished images so they can be cleared, then try again.'}), 507
             return jsonify({'error': 'No valid images uploaded. Please ensure files are images under 10MB.'}), 400
-            
-        return jsonify({'images': image_data})
+
+        return jsonify({'images': image_data, 'storage_full': storage_full})
         
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
-from concurrent.futures import ThreadPoolExecutor
-processing_executor = ThreadPoolExecutor(max_workers=4)
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from bulk import BulkJob, BulkRunner
+from clients import OpenAIClientPool
+from jobs import BatchJob, JobManager
+from job_queue import JobQueue
+from results import ResultStore
+from rate_scheduler import RateLimitScheduler, estimate_request_tokens
+from grouping import RequestGrouper
+from singleflight import SingleFlight
+from fair_queue import Cancelled, FairQueue, check_cancelled
+processing_executor = ThreadPoolExecutor(max_workers=config.processing_workers)
+# Every generated result, keyed by job, so exports and reloads need no browser upload
+result_store = ResultStore(config.results_path, retention=config.results_retention_days * 86400)
+start_sweeper(result_store, config.cache_sweep_interval, label='Results')
+# Batch items survive a restart: unfinished jobs are recovered when the server starts
+job_queue = JobQueue(config.job_queue_path, retention=config.job_retention)
+start_sweeper(job_queue, config.cache_sweep_interval, label='Queue')
+# Per-key request/token budgets, adaptive concurrency and retries for OpenAI calls.
+# Explicit budgets are split between worker processes; learned ones come from each response.
+rate_scheduler = RateLimitScheduler(
+    classify_error,
+    requests_per_minute=config.openai_requests_per_minute // config.server_workers,
+    tokens_per_minute=config.openai_tokens_per_minute // config.server_workers,
+    initial_concurrency=config.openai_initial_concurrency,
+    max_concurrency=config.openai_max_concurrency,
+    max_retries=config.openai_max_retries,
+    backoff_base=config.openai_backoff_base,
+    backoff_max=config.openai_backoff_max
+)
+# Shared keep-alive OpenAI clients, one per API key
+client_pool = OpenAIClientPool(
+    timeout=config.openai_timeout,
+    max_connections=config.openai_max_connections,
+    max_keepalive=config.openai_max_keepalive,
+    keepalive_expiry=config.openai_keepalive_expiry,
+    idle_ttl=config.openai_client_idle_ttl,
+    http2=config.openai_http2,
+    max_retries=0,  # rate_scheduler owns retries
+    base_url=config.openai_base_url
+)
+# Offline Batch API runs for large catalogs
+def bulk_client(api_key):
+    """Client for one Batch API run: not pooled, so it is never closed as idle, and retried by the SDK."""
+    import openai
+
+    return openai.OpenAI(api_key=api_key, base_url=config.openai_base_url, timeout=config.openai_timeout,
+                         max_retries=config.openai_max_retries)
+
+
+bulk_runner = BulkRunner(
+    work_dir=os.path.join(config.data_folder, 'bulk'),
+    poll_interval=config.bulk_poll_interval,
+    max_file_bytes=config.bulk_max_file_bytes,
+    max_requests_per_file=config.bulk_max_requests_per_file,
+    client_factory=bulk_client
+)
+# Optional asyncio engine: many OpenAI calls in flight without a thread each
+async_engine = None
+if config.processing_engine == 'async':
+    from async_engine import AsyncEngine
+    async_engine = AsyncEngine(
+        concurrency=config.async_concurrency,
+        encode_workers=config.encode_workers,
+        timeout=config.openai_timeout,
+        scheduler=rate_scheduler,
+        base_url=config.openai_base_url,
+        keepalive_expiry=config.openai_keepalive_expiry,
+        idle_ttl=config.openai_client_idle_ttl
+    )
+
+
+def emit_queue_position(waiter, info):
+    """Tell a waiting client (socket or batch job room) how much work is ahead of it."""
+    room, job_id = waiter
+    socketio.emit('queue_position', {**info, 'job_id': job_id} if job_id else info, room=room)
+
+
+def fairness_key(api_key, fallback):
+    """Clients bringing their own API key count as one client across sockets and jobs."""
+    if api_key and api_key != os.getenv('OPENAI_API_KEY'):
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return fallback
+
+
+# Processing work waits here, shared fairly between clients, instead of in the executor's FIFO queue
+processing_capacity = config.async_concurrency if async_engine else config.processing_workers
+fair_queue = FairQueue(
+    async_engine or processing_executor,
+    capacity=processing_capacity,
+    client_limit=config.client_max_in_flight or max(1, processing_capacity // 2),
+    max_waiting=config.queue_max_waiting,
+    on_wait=emit_queue_position,
+    update_interval=config.batch_flush_interval
+)
+job_manager = JobManager(
+    processing_executor,
+    max_in_flight=config.async_concurrency if async_engine else config.batch_max_in_flight,
+    flush_interval=config.batch_flush_interval,
+    # Progress goes to the job's room, which clients on any worker can join
+    emit=lambda event, payload, sid: socketio.emit(event, payload, room=job_room(payload['job_id'])),
+    store=result_store,
+    queue=job_queue
+)
+
+
+def dispatch_group(context, images):
+    """Send one grouped request on the configured engine; returns a Future of per-image outcomes."""
+    profile, api_key = context
+    if async_engine:
+        return async_engine.submit(request_group_async, profile, images, api_key)
+    return group_executor.submit(request_group, profile, images, api_key)
+
+
+# Profiles with group_size > 1 share one chat completion between several images
+group_executor = ThreadPoolExecutor(max_workers=config.processing_workers, thread_name_prefix='group')
+request_grouper = RequestGrouper(dispatch_group, linger=config.group_linger_ms / 1000)
+# Duplicate submissions of an image that is still being generated wait for the first call
+in_flight_requests = SingleFlight()
 
 @socketio.on('generate_metadata')
 def handle_generate_metadata(data):
@@ -423,230 +726,1051 @@ def handle_generate_metadata(data):
         emit('error', {'image': full_path, 'message': f'Invalid profile: {profile_name}'})
         return
 
+    api_key, key_error = resolve_api_key(data)
+    if key_error:
+        emit('error', {'image': full_path, 'message': key_error})
+        return
+
+    if 'job_id' in data and not validate_job_id(data['job_id']):
+        emit('error', {'image': full_path, 'message': 'Invalid job id'})
+        return
+
+    # Backpressure: keep queued work (and its memory and API cost) bounded
+    if fair_queue.full():
+        emit('error', {
+            'image': full_path,
+            'message': 'The server is busy. Please try again shortly.',
+            'category': 'quota',
+            'title': 'Server Busy',
+            'action': 'Wait a moment before generating more metadata',
+            'retry_allowed': True
+        })
+        return
+
+    # Queue in the interactive lane, ahead of batch items, with explicit API key
+    queued_at = time.perf_counter()
+    fair_queue.submit(fairness_key(api_key, request.sid), 'interactive',
+                      process_image_coro if async_engine else process_image_async,
+                      data, request.sid, profile_name, api_key, queued_at,
+                      waiter=(request.sid, None), tag=full_path)
+
+
+@socketio.on('generate_batch')
+def handle_generate_batch(data):
+    """Queue a list of images for one profile as a single server-side job."""
+    if not check_socket_rate_limit(request.sid):
+        emit('error', {
+            'message': 'Rate limit exceeded. Please wait before sending more requests.',
+            'category': 'quota',
+            'title': 'Too Many Requests',
+            'action': 'Wait a moment before generating more metadata',
+            'retry_allowed': True
+        })
+        return
+
+    # Security: Validate request data structure
+    if not isinstance(data, dict) or not isinstance(data.get('images'), list):
+        emit('error', {'message': 'Invalid batch request format'})
+        return
+
+    items = []
+    for entry in data['images']:
+        # Accept bare URLs or {full_path, file_path} objects
+        if isinstance(entry, str):
+            entry = {'full_path': entry}
+        if isinstance(entry, dict) and isinstance(entry.get('full_path'), str) and entry['full_path']:
+            items.append({k: entry[k] for k in ('full_path', 'file_path') if isinstance(entry.get(k), str)})
+
+    if not items:
+        emit('error', {'message': 'Batch contains no valid image paths'})
+        return
+    if len(items) > config.batch_max_images:
+        emit('error', {'message': f'Batch too large: limit is {config.batch_max_images} images per request'})
+        return
+
+    profile_name = data.get('profile', 'zedge')
+    if not validate_profile_name(profile_name):
+        emit('error', {'message': f'Invalid profile: {profile_name}'})
+        return
+
+    api_key, key_error = resolve_api_key(data)
+    if key_error:
+        emit('error', {'message': key_error})
+        return
+
+    # A client-chosen job id lets several runs share one result set
+    job_id = data.get('job_id')
+    if job_id is not None and not validate_job_id(job_id):
+        emit('error', {'message': 'Invalid job id'})
+        return
+
+    job = BatchJob(request.sid, profile_name, api_key, items, results_id=job_id)
+    join_room(job_room(job.id))
+    run_batch(job)
+    print(f"Batch job {job.id} queued with {job.total} images for profile {profile_name}", flush=True)
+    emit('batch_started', job.summary())
+
+
+@socketio.on('attach_job')
+def handle_attach_job(data):
+    """Route a batch job's progress to this client, e.g. after a reload or server restart.
+
+    Jobs recovered without a server-side API key stay paused until a
+    client attaches with one.
+    """
+    job_id = data.get('job_id') if isinstance(data, dict) else None
+    if not validate_job_id(job_id):
+        emit('job_not_found', {'job_id': job_id})
+        return
+    job = job_manager.get(job_id)
+    if not job:
+        # Possibly running in another worker process; its events reach this client through the room
+        summary = job_queue.summary(job_id)
+        if not summary:
+            emit('job_not_found', {'job_id': job_id})
+            return
+        join_room(job_room(job_id))
+        emit('job_attached', summary)
+        return
+
+    job.sid = request.sid
+    join_room(job_room(job_id))
+    if job.status == 'paused':
+        api_key, key_error = resolve_api_key(data)
+        if key_error:
+            emit('error', {'message': key_error})
+            return
+        job.api_key = api_key
+        if run_batch(job, resume=True):
+            print(f"Batch job {job.id} resumed by reattached client", flush=True)
+    emit('job_attached', job.summary())
+
+
+@socketio.on('cancel')
+def handle_cancel(data):
+    """Cancel this client's queued and running work.
+
+    {'job_id': id} stops a batch job, {'images': [full_path, ...]} cancels
+    those single-image requests, and an empty payload cancels all of
+    this socket's single-image requests.
+    """
+    data = data if isinstance(data, dict) else {}
+    job_id = data.get('job_id')
+    images = data.get('images')
+    if job_id is not None and not validate_job_id(job_id):
+        emit('error', {'message': 'Invalid job id'})
+        return
+    if images is not None and not isinstance(images, list):
+        emit('error', {'message': 'Invalid image list'})
+        return
+
+    cancelled = {'job_id': job_id, 'queued': 0, 'running': 0}
+    if job_id is not None:
+        job = job_manager.get(job_id)
+        cancelled['job_cancelled'] = bool(job) and job_manager.cancel(job)
+    if job_id is None or images is not None:
+        tags = {path for path in images if isinstance(path, str)} if images is not None else None
+        cancelled.update(fair_queue.cancel((request.sid, None), tags))
+    print(f"Cancelled for {request.sid}: {cancelled}", flush=True)
+    emit('cancelled', cancelled)
+
+
+def cancel_abandoned_work(sid):
+    """Cancel a disconnected socket's requests, and its batch jobs unless another client attached."""
+    counts = fair_queue.cancel((sid, None))
+    jobs = [job for job in job_manager.running() if job.sid == sid and job_manager.cancel(job)]
+    if counts['queued'] or counts['running'] or jobs:
+        print(f"Cancelled work abandoned by {sid}: {counts}, {len(jobs)} batch job(s)", flush=True)
+
+
+def job_room(job_id):
+    return f'job:{job_id}'
+
+
+def run_batch(job, resume=False):
+    """Hand a batch job to the job manager, feeding the fair queue's bulk lane."""
+    run = job_manager.resume if resume else job_manager.submit
+    lane = fair_queue.client(fairness_key(job.api_key, job.sid or job.id), 'bulk',
+                             waiter=(job_room(job.id), job.id))
+    worker = process_batch_item_async if async_engine else process_batch_item
+    return run(job, worker, classify_failure, executor=lane)
+
+
+def recover_batch_jobs(before=None):
+    """Re-queue batch jobs left unfinished by a previous server process.
+
+    before limits recovery to jobs created earlier, so that with several
+    workers the recovering one leaves its siblings' new jobs alone.
+    """
+    api_key = os.getenv('OPENAI_API_KEY')
+    for record in job_queue.recover(config.job_max_attempts, before):
+        job = BatchJob.recovered(record, api_key)
+        job_manager.hold(job)
+        if api_key:
+            run_batch(job, resume=True)
+        print(f"Recovered batch job {job.id}: {len(record['items'])} of {job.total} images left"
+              f"{'' if api_key else ', paused until a client reattaches'}", flush=True)
+
+
+def resolve_api_key(data):
+    """Pick the API key for a socket request, returning (key, error message)."""
     # Check for API key in this order:
     # 1. Environment variable (.env file)
     # 2. Settings passed from frontend (localStorage)
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key:
-        api_key = data.get('settings', {}).get('apiKey')
+        settings = data.get('settings')
+        api_key = settings.get('apiKey') if isinstance(settings, dict) else None
 
     if not api_key:
-        emit('error', {'image': full_path, 'message': 'No API key provided. Please set OPENAI_API_KEY in .env file or provide it in Settings.'})
-        return
+        return None, 'No API key provided. Please set OPENAI_API_KEY in .env file or provide it in Settings.'
 
     # Security: Validate API key format (basic check)
     if not validate_api_key_format(api_key):
-        emit('error', {'image': full_path, 'message': 'Invalid API key format. OpenAI keys should start with "sk-".'})
-        return
+        return None, 'Invalid API key format. OpenAI keys should start with "sk-".'
 
-    # Submit to thread pool with explicit API key
-    processing_executor.submit(process_image_async, data, request.sid, profile_name, api_key)
+    return api_key, None
 
-def process_image_async(data, sid, profile_name, api_key):
-    profile = PROFILES[profile_name]
+
+def process_batch_item(job, item):
+    """Generate metadata for one batch item, raising on failure."""
+    image_path = resolve_image_path(item)
+    if not image_path:
+        raise ValueError('Invalid file path')
+    return generate_metadata(item, job.profile_name, job.api_key, image_path, item.get('queued_at'))
+
+
+async def process_batch_item_async(job, item):
+    """Async-engine version of process_batch_item."""
+    image_path = resolve_image_path(item)
+    if not image_path:
+        raise ValueError('Invalid file path')
+    return await generate_metadata_async(item, job.profile_name, job.api_key, image_path, item.get('queued_at'))
+
+
+def resolve_image_path(data):
+    """Return the validated upload-folder path for a request, or None if it escapes the folder."""
     # Use file_path if available, otherwise reconstruct from full_path
     image_path = data.get('file_path')
     if not image_path:
-        # Extract filename from the URL and construct proper path
-        filename = os.path.basename(data['full_path'])
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        image_path = upload_path_from_url(data['full_path'])
 
     # Security: Validate file path is within upload folder (prevent path traversal)
     if not validate_file_path(image_path, app.config['UPLOAD_FOLDER']):
-        with app.app_context():
-            socketio.emit('error', {
-                'image': data['full_path'],
-                'message': 'Invalid file path'
-            }, room=sid)
-        return
+        return None
+    image_path = os.path.realpath(os.path.join(app.config['UPLOAD_FOLDER'], image_path))
+    upload_catalog.touch(image_path)
+    return image_path
+
+
+def upload_path_from_url(url):
+    """Map a /static/images/... URL back to its file under the upload folder."""
+    path = unquote(urlparse(url).path)
+    marker = '/static/images/'
+    # Legacy flat uploads only need the filename
+    relative = path.split(marker, 1)[1] if marker in path else os.path.basename(path)
+    return os.path.join(app.config['UPLOAD_FOLDER'], relative)
+
+
+def encode_image(image_path, image_hash=None, timings=None):
+    """Return the base64 JPEG payload for an image, reusing a cached encode when possible."""
+    key = None
+    if image_hash and payload_cache:
+        key = payload_key(image_hash, config.max_image_dimension, config.jpeg_quality, config.image_preset)
+        with metrics.stage('payload_cache', timings):
+            cached = payload_cache.get(key)
+        if cached is not None:
+            return base64.b64encode(cached).decode('utf-8')
+
+    args = (image_path, config.max_image_dimension, config.jpeg_quality, config.image_preset, key)
+    with metrics.stage('encode', timings):
+        if image_pool:
+            # Decode/resize/encode in a worker process so it does not hold the GIL here
+            return image_pool.submit(build_payload, *args).result()
+        return build_payload(*args, cache=payload_cache)
+
+
+def build_messages(profile, img_base64):
+    """Build the chat messages for a single-image metadata request."""
+    return [
+        {
+            "role": "system",
+            "content": profile['prompt']
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "Generate metadata for this image following the provided rules"},
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{img_base64}"
+                    }
+                }
+            ]
+        }
+    ]
+
 
+def parse_metadata_response(content, profile):
+    """Parse the model's JSON reply and validate it against the profile."""
     try:
-        with app.app_context():
-            print(f"\nAI processing started for {data['full_path']}", flush=True)
-            socketio.emit('processing_start', {'image': data['full_path']}, room=sid)
+        if not content:
+            raise ValueError("Empty response from AI model")
+        metadata = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON response from AI: {str(e)}")
+    return validate_metadata(metadata, profile)
+
+
+def validate_metadata(metadata, profile):
+    """Check required fields and categories, returning only the profile's fields."""
+    if not isinstance(metadata, dict):
+        raise ValueError("Malformed response structure: expected a JSON object")
+
+    required_fields = profile['required_fields']
+    missing_fields = [field for field in required_fields if field not in metadata or not metadata[field]]
+    if missing_fields:
+        raise ValueError(f"Missing required fields in AI response: {', '.join(missing_fields)}")
+
+    # Only validate category if the profile has categories defined
+    valid_categories = set(profile.get('categories', []))
+    if valid_categories and 'category' in metadata:
+        if metadata['category'] not in valid_categories:
+            # Instead of raising an error, set category to "Other"
+            metadata['category'] = "Other"
+
+    return {k: metadata[k] for k in required_fields}
+
+
+def build_group_messages(profile, images):
+    """Build the chat messages for one request covering several (image id, base64) pairs."""
+    field_list = ', '.join(f'"{field}"' for field in profile['required_fields'])
+    content = [{
+        "type": "text",
+        "text": (
+            f"Generate metadata for each of the following {len(images)} images following the provided rules. "
+            f"Return a JSON object {{\"results\": [...]}} with one entry per image, each containing "
+            f"\"id\" (the image ID given before it) and {field_list}."
+        )
+    }]
+    for image_id, img_base64 in images:
+        content.append({"type": "text", "text": f"Image ID: {image_id}"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}})
+    return [
+        {
+            "role": "system",
+            "content": profile['prompt']
+        },
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
 
-            if not api_key:
-                raise ValueError("No API key provided for OpenAI request")
 
-            # Check cache first
-            image_hash = get_image_hash(image_path)
-            if image_hash:
-                cached = get_cached_metadata(image_hash, profile_name)
-                if cached:
-                    print(f"Cache hit for {data['full_path']}", flush=True)
-                    response_data = {
-                        'image': data['full_path'],
-                        'status': 'complete',
-                        'cached': True,
-                        'metadata': cached
-                    }
-                    socketio.emit('metadata_update', response_data, room=sid)
-                    return
-
-            # Encode image to base64
-            with Image.open(image_path) as img:
-                # Convert to RGB if necessary (for PNG with transparency, etc.)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    # Create white background
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize intelligently - maintain aspect ratio
-                max_dimension = 1024
-                if max(img.size) > max_dimension:
-                    img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
-                
-                # Optimize for API transmission
-                buffered = BytesIO()
-                img.save(buffered, format='JPEG', quality=85, optimize=True, progressive=True)
-                
-                img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-        with app.app_context():
-            # Call OpenAI API using a custom httpx client to avoid httpx>=0.28 proxies incompatibility
-            http_timeout = httpx.Timeout(60.0)
-            # Do not pass deprecated 'proxies' arg; env vars will be respected by httpx automatically
-            http_client = httpx.Client(timeout=http_timeout, follow_redirects=True)
-            client = openai.OpenAI(api_key=api_key, http_client=http_client)
-            # Use profile-specific configuration
-            system_message = profile['prompt']
-        # Only validate categories if the profile has them defined
-        valid_categories = set(profile.get('categories', []))
-
-        response = client.chat.completions.create(
-            model="gpt-5-nano-2025-08-07",
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_message
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Generate metadata for this image following the provided rules"},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{img_base64}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            response_format={"type": "json_object"}
-        )
+def parse_group_response(content, profile, image_ids):
+    """Split a grouped reply into per-image outcomes: validated metadata, or the ValueError for that image.
 
-        # Parse and validate response
+    Accepts {"results": [{"id": ..., ...}]}, a bare list of such entries,
+    or an object keyed by image id.
+    """
+    try:
+        if not content:
+            raise ValueError("Empty response from AI model")
+        reply = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON response from AI: {str(e)}")
+
+    entries = reply.get('results', reply) if isinstance(reply, dict) else reply
+    if isinstance(entries, dict):
+        by_id = {str(key): value for key, value in entries.items()}
+    elif isinstance(entries, list):
+        by_id = {str(entry['id']): entry for entry in entries if isinstance(entry, dict) and 'id' in entry}
+    else:
+        raise ValueError("Malformed response structure: expected a list of results")
+
+    outcomes = []
+    for image_id in image_ids:
+        entry = by_id.get(image_id)
+        if entry is None:
+            outcomes.append(ValueError(f"Missing result for image {image_id} in grouped response"))
+            continue
         try:
-            content = response.choices[0].message.content
-            if not content:
-                raise ValueError("Empty response from AI model")
-            metadata = json.loads(content)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON response from AI: {str(e)}")
-        except (IndexError, AttributeError) as e:
-            raise ValueError(f"Malformed response structure: {str(e)}")
-            
-        required_fields = profile['required_fields']
-        missing_fields = [field for field in required_fields if field not in metadata or not metadata[field]]
-        if missing_fields:
-            raise ValueError(f"Missing required fields in AI response: {', '.join(missing_fields)}")
-            
-        # Only validate category if the profile has categories defined
-        if valid_categories and 'category' in metadata:
-            if metadata['category'] not in valid_categories:
-                # Instead of raising an error, set category to "Other"
-                metadata['category'] = "Other"
-
-        print(f"AI processing completed for {data['full_path']}", flush=True)
-
-        # Cache the successful response
-        response_metadata = {k: metadata[k] for k in profile['required_fields']}
-        if image_hash:
-            cache_metadata(image_hash, profile_name, response_metadata)
-            print(f"Cached metadata for {data['full_path']}", flush=True)
+            outcomes.append(validate_metadata(entry, profile))
+        except ValueError as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def group_size(profile):
+    """Images per request for a profile (1 disables grouping)."""
+    return max(1, min(int(profile.get('group_size') or 1), config.max_group_size))
+
+
+def group_fallback(exception):
+    """Whether an image that failed inside a group should be retried on its own.
+
+    Bad or missing entries and server errors are worth a single-image call;
+    auth, quota and model errors would only fail again.
+    """
+    return classify_error(exception)['category'] in ('server', 'timeout', 'network')
+
+
+def submit_to_group(profile, img_base64, api_key):
+    key = (api_key, profile_fingerprint(profile))
+    return request_grouper.add(key, group_size(profile), (profile, api_key), img_base64)
+
+
+def group_request_kwargs(profile, images):
+    image_ids = [f'img{i + 1}' for i in range(len(images))]
+    kwargs = {
+        'model': profile.get('model', config.openai_model),
+        'messages': build_group_messages(profile, list(zip(image_ids, images))),
+        'response_format': {"type": "json_object"}
+    }
+    metrics.request_bytes_total.inc(sum(len(image) for image in images) + len(profile['prompt'].encode('utf-8')))
+    return image_ids, kwargs
+
+
+def estimate_group_tokens(profile, count):
+    return estimate_request_tokens(profile['prompt'], images=count, completion_tokens=300 * count)
+
+
+def request_group(profile, images, api_key):
+    """Call OpenAI once for several base64 images; returns per-image metadata or exceptions."""
+    completions = client_pool.get(api_key).chat.completions
+    image_ids, request_kwargs = group_request_kwargs(profile, images)
+    response = rate_scheduler.call(
+        api_key,
+        estimate_group_tokens(profile, len(images)),
+        lambda: completions.with_raw_response.create(**request_kwargs)
+    )
+    metrics.observe_usage(response)
+    return parse_group_response(extract_content(response), profile, image_ids)
+
+
+async def request_group_async(profile, images, api_key):
+    """Async counterpart of request_group using the async engine."""
+    image_ids, request_kwargs = group_request_kwargs(profile, images)
+    response = await async_engine.create_completion(
+        api_key, estimated_tokens=estimate_group_tokens(profile, len(images)), **request_kwargs
+    )
+    metrics.observe_usage(response)
+    return parse_group_response(extract_content(response), profile, image_ids)
+
+
+def extract_content(response):
+    """Pull the message text out of a chat completion response."""
+    try:
+        return response.choices[0].message.content
+    except (IndexError, AttributeError) as e:
+        raise ValueError(f"Malformed response structure: {str(e)}")
+
 
+def request_metadata(profile, img_base64, api_key, timings=None):
+    """Call OpenAI for one image and return the validated metadata.
+
+    For profiles with a group_size the image shares a request with others
+    and is only sent alone if its entry in the grouped reply fails.
+    """
+    if group_size(profile) > 1:
+        try:
+            with metrics.stage('openai', timings):
+                return submit_to_group(profile, img_base64, api_key).result()
+        except Exception as e:
+            if not group_fallback(e):
+                raise
+            print(f"Grouped request failed for one image ({e}); retrying it alone", flush=True)
+    completions = client_pool.get(api_key).chat.completions
+    request_kwargs = {
+        'model': profile.get('model', config.openai_model),
+        'messages': build_messages(profile, img_base64),
+        'response_format': {"type": "json_object"}
+    }
+    metrics.request_bytes_total.inc(len(img_base64) + len(profile['prompt'].encode('utf-8')))
+
+    def attempt():
+        # A blocking call cannot be interrupted, so stop before each attempt instead
+        check_cancelled()
+        return completions.with_raw_response.create(**request_kwargs)
+
+    with metrics.stage('openai', timings):
+        response = rate_scheduler.call(api_key, estimate_request_tokens(profile['prompt']), attempt)
+    metrics.observe_usage(response)
+    with metrics.stage('parse', timings):
+        return parse_metadata_response(extract_content(response), profile)
+
+
+async def request_metadata_async(profile, img_base64, api_key, timings=None):
+    """Async counterpart of request_metadata using the async engine."""
+    if group_size(profile) > 1:
         try:
-            print(f"Emitting metadata_update for {data['full_path']} to room {sid}", flush=True)
-            # Profile-specific response formatting
-            response_data = {
+            with metrics.stage('openai', timings):
+                return await asyncio.shield(asyncio.wrap_future(submit_to_group(profile, img_base64, api_key)))
+        except Exception as e:
+            if not group_fallback(e):
+                raise
+            print(f"Grouped request failed for one image ({e}); retrying it alone", flush=True)
+    metrics.request_bytes_total.inc(len(img_base64) + len(profile['prompt'].encode('utf-8')))
+    with metrics.stage('openai', timings):
+        response = await async_engine.create_completion(
+            api_key,
+            estimated_tokens=estimate_request_tokens(profile['prompt']),
+            model=profile.get('model', config.openai_model),
+            messages=build_messages(profile, img_base64),
+            response_format={"type": "json_object"}
+        )
+    metrics.observe_usage(response)
+    with metrics.stage('parse', timings):
+        return parse_metadata_response(extract_content(response), profile)
+
+
+def check_cache(data, profile_name, image_path, timings=None):
+    """Hash the image and look it up, returning (image_hash, cached payload or None)."""
+    with metrics.stage('hash', timings):
+        image_hash = get_image_hash(image_path)
+    if image_hash:
+        with metrics.stage('cache_lookup', timings):
+            cached = get_cached_metadata(image_hash, profile_name)
+        if cached:
+            print(f"Cache hit for {data['full_path']}", flush=True)
+            return image_hash, {
                 'image': data['full_path'],
                 'status': 'complete',
-                'cached': False,
-                'metadata': response_metadata
+                'cached': True,
+                'metadata': cached
             }
-            socketio.emit('metadata_update', response_data, room=sid)
-            print("Metadata_update emission completed", flush=True)
-        except Exception as e:
-            print(f"Error emitting metadata_update: {str(e)}", flush=True)
+        with metrics.stage('near_duplicate', timings):
+            near_duplicate = find_near_duplicate(image_hash, image_path, profile_name)
+        if near_duplicate:
+            source_hash, metadata = near_duplicate
+            print(f"Near-duplicate hit for {data['full_path']} (matches {source_hash})", flush=True)
+            # Cache under this image's own hash so the next lookup is an exact hit
+            cache_metadata(image_hash, profile_name, metadata)
+            return image_hash, {
+                'image': data['full_path'],
+                'status': 'complete',
+                'cached': True,
+                'near_duplicate_of': source_hash,
+                'metadata': metadata
+            }
+    return image_hash, None
 
+
+def find_near_duplicate(image_hash, image_path, profile_name):
+    """Return (source hash, metadata) from a visually near-identical image cached for this profile."""
+    if not near_duplicate_index:
+        return None
+    try:
+        if image_pool:
+            candidates = near_duplicate_index.lookup(
+                image_hash, image_path, hash_fn=lambda path: image_pool.submit(dhash, path).result()
+            )
+        else:
+            candidates = near_duplicate_index.lookup(image_hash, image_path)
     except Exception as e:
-        try:
-            print(f"Emitting error for {data['full_path']} to room {sid}", flush=True)
-            # Use categorized error handling for better UX
-            error_info = classify_error(e)
-            socketio.emit('error', {
-                'image': data['full_path'],
-                **error_info
-            }, room=sid)
-            print(f"Error emission completed: {error_info['category']}", flush=True)
-        except Exception as emit_err:
-            print(f"Error emitting error event: {str(emit_err)}", flush=True)
+        print(f"Near-duplicate lookup failed for {image_path}: {e}", flush=True)
+        return None
+    for candidate in candidates:
+        metadata = get_cached_metadata(candidate, profile_name)
+        if metadata:
+            return candidate, metadata
+    return None
+
+
+def finish_generation(data, profile_name, image_hash, response_metadata, timings=None):
+    """Cache freshly generated metadata and build the metadata_update payload."""
+    print(f"AI processing completed for {data['full_path']}", flush=True)
+
+    # Cache the successful response
+    if image_hash:
+        with metrics.stage('cache_store', timings):
+            cache_metadata(image_hash, profile_name, response_metadata)
+        print(f"Cached metadata for {data['full_path']}", flush=True)
+
+    return {
+        'image': data['full_path'],
+        'status': 'complete',
+        'cached': False,
+        'metadata': response_metadata
+    }
+
+
+def generate_metadata(data, profile_name, api_key, image_path, queued_at=None):
+    """Run the cache lookup, encode and OpenAI call for one image.
+
+    Returns the metadata_update payload; raises on failure so callers can
+    report through classify_failure. queued_at (a perf_counter value) is
+    when the request was handed to the executor, for queue-wait timing.
+    """
+    if not api_key:
+        raise ValueError("No API key provided for OpenAI request")
+
+    timings = {}
+    if queued_at is not None:
+        metrics.observe_stage('queue_wait', time.perf_counter() - queued_at, timings)
+    metrics.images_in_flight.inc()
+    try:
+        with metrics.stage('total', timings):
+            # Check cache first
+            check_cancelled()
+            image_hash, result = check_cache(data, profile_name, image_path, timings)
+            while not result:
+                check_cancelled()
+                flight_key, flight, leader = claim_flight(image_hash, profile_name)
+                if not leader:
+                    # The same image and profile version is already being generated
+                    try:
+                        with metrics.stage('coalesced', timings):
+                            result = coalesced_result(data, flight.result())
+                    except Cancelled:
+                        # Its own client cancelled it; generate here instead
+                        continue
+                else:
+                    try:
+                        # Encode image to base64
+                        img_base64 = encode_image(image_path, image_hash, timings)
+                        check_cancelled()
+                        response_metadata = request_metadata(PROFILES[profile_name], img_base64, api_key, timings)
+                        result = finish_generation(data, profile_name, image_hash, response_metadata, timings)
+                    except BaseException as e:
+                        in_flight_requests.finish(flight_key, exception=flight_exception(e))
+                        raise
+                    in_flight_requests.finish(flight_key, result)
     finally:
-        try:
-            if 'http_client' in locals():
-                http_client.close()
-        except Exception:
-            pass
+        metrics.images_in_flight.dec()
+    return count_result(result, timings)
+
+
+async def generate_metadata_async(data, profile_name, api_key, image_path, queued_at=None):
+    """Async counterpart of generate_metadata; encoding runs on the engine's CPU pool."""
+    if not api_key:
+        raise ValueError("No API key provided for OpenAI request")
+
+    timings = {}
+    if queued_at is not None:
+        metrics.observe_stage('queue_wait', time.perf_counter() - queued_at, timings)
+    metrics.images_in_flight.inc()
+    try:
+        with metrics.stage('total', timings):
+            check_cancelled()
+            image_hash, result = await async_engine.run_blocking(check_cache, data, profile_name, image_path, timings)
+            while not result:
+                flight_key, flight, leader = claim_flight(image_hash, profile_name)
+                if not leader:
+                    try:
+                        with metrics.stage('coalesced', timings):
+                            # Shielded so cancelling this task leaves the leader's future alone
+                            result = coalesced_result(data, await asyncio.shield(asyncio.wrap_future(flight)))
+                    except Cancelled:
+                        continue
+                else:
+                    try:
+                        img_base64 = await async_engine.run_cpu(encode_image, image_path, image_hash, timings)
+                        response_metadata = await request_metadata_async(
+                            PROFILES[profile_name], img_base64, api_key, timings
+                        )
+                        result = await async_engine.run_blocking(
+                            finish_generation, data, profile_name, image_hash, response_metadata, timings
+                        )
+                    except BaseException as e:
+                        in_flight_requests.finish(flight_key, exception=flight_exception(e))
+                        raise
+                    in_flight_requests.finish(flight_key, result)
+    finally:
+        metrics.images_in_flight.dec()
+    return count_result(result, timings)
+
+
+def flight_exception(exception):
+    """What followers see when their leader fails; a cancelled leader tells them to take over."""
+    if isinstance(exception, (Cancelled, asyncio.CancelledError)):
+        return Cancelled('Leader cancelled')
+    return exception
+
+
+def claim_flight(image_hash, profile_name):
+    """Join or start the in-flight generation for this image and profile version.
+
+    Returns (key, future, is_leader). Without a content hash there is
+    nothing to coalesce on, so the caller always leads.
+    """
+    if not image_hash:
+        return None, None, True
+    key = get_cache_key(image_hash, profile_name)
+    future, leader = in_flight_requests.claim(key)
+    return key, future, leader
+
+
+def coalesced_result(data, leader_result):
+    """Re-address the leader's payload to this request's image."""
+    result = {k: v for k, v in leader_result.items() if k != 'timings'}
+    result.update({'image': data['full_path'], 'cached': True, 'coalesced': True})
+    return result
+
+
+def count_result(result, timings):
+    """Count a finished image by outcome, attaching its stage timings when debug timing is on."""
+    if not result['cached']:
+        outcome = 'generated'
+    elif result.get('coalesced'):
+        outcome = 'coalesced'
+    elif 'near_duplicate_of' in result:
+        outcome = 'near_duplicate'
+    else:
+        outcome = 'cached'
+    metrics.images_total.inc(outcome=outcome)
+    if config.debug_timings:
+        return {**result, 'timings': timings}
+    return result
+
+
+def result_job_id(data, sid):
+    """Result-store job id for a single-image request: the client's job_id, else the socket id."""
+    return data.get('job_id') or sid
+
+
+def emit_result(data, sid, response_data):
+    """Send a metadata_update payload to the requesting client."""
+    try:
+        print(f"Emitting metadata_update for {data['full_path']} to room {sid}", flush=True)
+        socketio.emit('metadata_update', response_data, room=sid)
+        print("Metadata_update emission completed", flush=True)
+    except Exception as e:
+        print(f"Error emitting metadata_update: {str(e)}", flush=True)
+
+
+def emit_failure(data, sid, exception):
+    """Send a categorized error event to the requesting client."""
+    try:
+        print(f"Emitting error for {data['full_path']} to room {sid}", flush=True)
+        # Use categorized error handling for better UX
+        error_info = classify_failure(exception)
+        socketio.emit('error', {
+            'image': data['full_path'],
+            **error_info
+        }, room=sid)
+        print(f"Error emission completed: {error_info['category']}", flush=True)
+    except Exception as emit_err:
+        print(f"Error emitting error event: {str(emit_err)}", flush=True)
+
+
+def emit_invalid_path(data, sid):
+    with app.app_context():
+        socketio.emit('error', {
+            'image': data['full_path'],
+            'message': 'Invalid file path'
+        }, room=sid)
+
+
+def process_image_async(data, sid, profile_name, api_key, queued_at=None):
+    image_path = resolve_image_path(data)
+    if not image_path:
+        emit_invalid_path(data, sid)
+        return
+
+    try:
+        print(f"\nAI processing started for {data['full_path']}", flush=True)
+        socketio.emit('processing_start', {'image': data['full_path']}, room=sid)
+        result = generate_metadata(data, profile_name, api_key, image_path, queued_at)
+    except (Cancelled, CancelledError):
+        # The client asked for this; it gets no error event
+        print(f"Cancelled {data['full_path']}", flush=True)
+        return
+    except Exception as e:
+        result_store.add_error(result_job_id(data, sid), profile_name, data['full_path'], str(e))
+        emit_failure(data, sid, e)
+        return
+    result_store.add_result(result_job_id(data, sid), profile_name, result)
+    emit_result(data, sid, result)
+
+
+async def process_image_coro(data, sid, profile_name, api_key, queued_at=None):
+    """Async-engine version of process_image_async with the same event contract."""
+    image_path = resolve_image_path(data)
+    if not image_path:
+        emit_invalid_path(data, sid)
+        return
+
+    try:
+        print(f"\nAI processing started for {data['full_path']}", flush=True)
+        socketio.emit('processing_start', {'image': data['full_path']}, room=sid)
+        result = await generate_metadata_async(data, profile_name, api_key, image_path, queued_at)
+    except (Cancelled, CancelledError):
+        print(f"Cancelled {data['full_path']}", flush=True)
+        return
+    except asyncio.CancelledError:
+        print(f"Cancelled {data['full_path']}", flush=True)
+        raise
+    except Exception as e:
+        result_store.add_error(result_job_id(data, sid), profile_name, data['full_path'], str(e))
+        emit_failure(data, sid, e)
+        return
+    result_store.add_result(result_job_id(data, sid), profile_name, result)
+    emit_result(data, sid, result)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    """Clean up rate limit tracking when client disconnects."""
-    sid = request.sid
-    if sid in socket_rate_limits:
-        del socket_rate_limits[sid]
+    """Clean up rate limit tracking and, after a grace period, the client's unfinished work."""
+    limiter.limiter.clear(socket_rate_item(), 'socket', request.sid)
+    # Long enough for a page reload to reattach to its batch job
+    if config.disconnect_grace_period > 0:
+        timer = threading.Timer(config.disconnect_grace_period, cancel_abandoned_work, args=(request.sid,))
+        timer.daemon = True
+        timer.start()
 
 
 @app.route('/export', methods=['POST'])
 @limiter.limit(config.export_rate_limit)
 def export():
-    """Export metadata to CSV with input validation."""
-    metadata = request.json.get('data', [])
-    profile_name = request.json.get('profile', 'zedge')
-    base_path = request.json.get('base_path', '').strip()
+    """Stream metadata as CSV, JSONL or Parquet, optionally gzipped."""
+    data = request.get_json(silent=True) or {}
+    metadata = data.get('data', [])
+    profile_name = data.get('profile', 'zedge')
+    base_path = data.get('base_path', '').strip()
+    fmt = data.get('format', 'csv')
+    compress = bool(data.get('gzip'))
 
     # Security: Validate profile name
     if not validate_profile_name(profile_name):
         return jsonify({'error': f'Invalid profile: {profile_name}'}), 400
+    if not isinstance(metadata, list):
+        return jsonify({'error': 'data must be a list'}), 400
 
     profile = PROFILES[profile_name]
-    
-    # Process metadata with optional base path
-    processed_metadata = []
-    for item in metadata:
-        processed_item = {}
-        for col in profile['csv_columns']:
-            value = item.get(col, '')
-            # If this is the full_path column and we have a base path, prepend it
-            if col == 'full_path' and base_path:
-                # Convert /static/images/file.jpg to base_path/file.jpg
-                filename = os.path.basename(value)
-                value = os.path.join(base_path, filename)
-            processed_item[col] = value
-        processed_metadata.append(processed_item)
-    
-    # Create DataFrame with processed metadata
-    df = pd.DataFrame(processed_metadata)
-    
-    csv_path = f'metadata_{profile_name}.csv'
-    df.to_csv(csv_path, index=False)
-    return send_file(csv_path, as_attachment=True)
+    items = track_exported((item for item in metadata if isinstance(item, dict)), profile['csv_columns'], profile_name)
+    try:
+        body = stream_export(items, profile['csv_columns'], base_path, fmt, compress)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return export_response(body, profile_name, fmt, compress)
+
+
+def track_exported(items, columns, profile_name=None):
+    """Pass items through to an export; once it has streamed, their uploads may be evicted.
+
+    Only items with metadata filled in count, so exporting an unfinished
+    list does not free images still being worked on. For client-supplied
+    lists pass profile_name: only images the server stored a completed
+    result for under that profile are marked.
+    """
+    urls = []
+    for item in items:
+        path = item.get('full_path')
+        if isinstance(path, str) and any(item.get(col) for col in columns if col != 'full_path'):
+            urls.append(path)
+        yield item
+    if profile_name is not None:
+        urls = result_store.completed_images(urls, profile_name)
+    upload_catalog.mark_exported([upload_path_from_url(url) for url in urls])
+
+
+def export_response(body, profile_name, fmt, compress):
+    """Wrap an export stream in a download response."""
+    mimetype = 'application/gzip' if compress else EXPORT_FORMATS[fmt][0]
+    filename = export_filename(profile_name, fmt, compress)
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
+
+def bulk_requests(job, items):
+    """Yield Batch API request bodies for items, skipping ones already cached."""
+    profile = PROFILES[job.profile_name]
+    for item in items:
+        image_path = resolve_image_path(item)
+        try:
+            image_hash, cached = check_cache(item, job.profile_name, image_path)
+            if cached:
+                yield None, item['full_path'], None
+                continue
+            if not image_hash:
+                raise ValueError('Image could not be read')
+            body = {
+                'model': profile.get('model', config.openai_model),
+                'messages': build_messages(profile, encode_image(image_path, image_hash)),
+                'response_format': {"type": "json_object"}
+            }
+        except Exception as e:
+            job.record_error([item['full_path']], str(e))
+            continue
+        yield image_hash, item['full_path'], body
+
+
+@app.route('/api/bulk', methods=['POST'])
+@check_api_key
+def create_bulk_job():
+    """Start an offline Batch API run; results land in the metadata cache."""
+    data = request.get_json(silent=True) or {}
+    profile_name = data.get('profile', 'zedge')
+    if not validate_profile_name(profile_name):
+        return jsonify({'error': f'Invalid profile: {profile_name}'}), 400
+    if not validate_api_key_format(g.api_key):
+        return jsonify({'error': 'Invalid API key format. OpenAI keys should start with "sk-".'}), 400
+
+    items = []
+    for entry in data.get('images') or []:
+        if isinstance(entry, str):
+            entry = {'full_path': entry}
+        if isinstance(entry, dict) and isinstance(entry.get('full_path'), str) and resolve_image_path(entry):
+            items.append({k: entry[k] for k in ('full_path', 'file_path') if isinstance(entry.get(k), str)})
+    if not items:
+        return jsonify({'error': 'No valid image paths provided'}), 400
+
+    profile = PROFILES[profile_name]
+
+    def finish(image_hash, content):
+        metadata = parse_metadata_response(content, profile)
+        cache_metadata(image_hash, profile_name, metadata)
+        return metadata
+
+    job = BulkJob(profile_name)
+    bulk_runner.start(job, g.api_key, bulk_requests(job, items), finish)
+    print(f"Bulk job {job.id} started with {len(items)} images for profile {profile_name}", flush=True)
+    return jsonify(job.summary()), 202
+
+
+@app.route('/api/bulk/<job_id>')
+def get_bulk_job(job_id):
+    """Return bulk job status; pass ?results=1 for per-image results."""
+    job = bulk_runner.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.summary(include_results=request.args.get('results') == '1'))
+
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Return progress counters for a batch job, falling back to stored results."""
+    if not validate_job_id(job_id):
+        return jsonify({'error': 'Invalid job id'}), 400
+    job = job_manager.get(job_id)
+    if job:
+        return jsonify(job.summary())
+    # Running in another worker process
+    summary = job_queue.summary(job_id) if config.server_workers > 1 else None
+    if summary and summary['status'] == 'running':
+        return jsonify(summary)
+    summary = result_store.summary(job_id)
+    if not summary:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({**summary, 'status': 'stored'})
+
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET', 'DELETE'])
+def job_results(job_id):
+    """Page through stored results for a job (?after=<cursor>&limit=&status=&profile=), or delete them."""
+    if not validate_job_id(job_id):
+        return jsonify({'error': 'Invalid job id'}), 400
+    if request.method == 'DELETE':
+        if not result_store.summary(job_id):
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify({'job_id': job_id, 'deleted': result_store.delete_job(job_id)})
+    try:
+        after = int(request.args.get('after', 0))
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'after and limit must be integers'}), 400
+    status = request.args.get('status')
+    if status not in (None, 'complete', 'error'):
+        return jsonify({'error': 'status must be complete or error'}), 400
+    rows, next_after = result_store.query(job_id, request.args.get('profile'), status, after, limit)
+    return jsonify({'job_id': job_id, 'results': rows, 'next_after': next_after})
+
+
+@app.route('/api/jobs/<job_id>/export')
+@limiter.limit(config.export_rate_limit)
+def export_job(job_id):
+    """Stream a job's stored results (?profile=&format=&gzip=1&base_path=) like /export."""
+    if not validate_job_id(job_id):
+        return jsonify({'error': 'Invalid job id'}), 400
+    profile_name = request.args.get('profile')
+    if not profile_name:
+        summary = result_store.summary(job_id)
+        if not summary:
+            return jsonify({'error': 'Job not found'}), 404
+        if len(summary['profiles']) > 1:
+            return jsonify({'error': 'Job has results for several profiles; pass ?profile='}), 400
+        profile_name = summary['profiles'][0]
+    if not validate_profile_name(profile_name):
+        return jsonify({'error': f'Invalid profile: {profile_name}'}), 400
+
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') in ('1', 'true')
+    columns = PROFILES[profile_name]['csv_columns']
+    items = track_exported((
+        {'full_path': row['image'], **row['metadata']}
+        for row in result_store.iter_results(job_id, profile_name)
+    ), columns)
+    try:
+        body = stream_export(items, columns,
+                             request.args.get('base_path', '').strip(), fmt, compress)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return export_response(body, profile_name, fmt, compress)
+
+
+def cache_request_counts():
+    counts = {}
+    for name, stats in (('metadata', metadata_cache.stats()), ('payload', payload_cache.stats() if payload_cache else None)):
+        if stats:
+            counts[(name, 'hit')] = stats['hits']
+            counts[(name, 'miss')] = stats['misses']
+    return counts
+
+
+def cache_hit_ratios():
+    counts = cache_request_counts()
+    ratios = {}
+    for name in {name for name, _ in counts}:
+        total = counts[(name, 'hit')] + counts[(name, 'miss')]
+        ratios[(name,)] = counts[(name, 'hit')] / total if total else 0.0
+    return ratios
+
+
+def queue_depths():
+    # ThreadPoolExecutor has no public queue size
+    work_queue = getattr(processing_executor, '_work_queue', None)
+    waiting = fair_queue.stats()['waiting']
+    return {
+        ('executor',): work_queue.qsize() if work_queue else 0,
+        ('interactive',): waiting['interactive'],
+        ('bulk',): waiting['bulk'],
+        ('batch_pending',): job_queue.stats()['pending'],
+        ('image_pool',): len(getattr(image_pool, '_pending_work_items', None) or {})
+    }
+
+
+def executor_saturation():
+    capacity = processing_capacity
+    in_flight = sum(value for _, value in metrics.images_in_flight.samples())
+    return in_flight / capacity if capacity else 0.0
+
+
+def rate_limit_totals():
+    stats = rate_scheduler.stats().values()
+    return {(name,): sum(s[name] for s in stats) for name in ('requests', 'retries', 'throttled', 'failed')}
+
+
+metrics.registry.gauge('mdr_cache_requests', 'Cache lookups by cache and result', labels=('cache', 'result'),
+                       callback=cache_request_counts)
+metrics.registry.gauge('mdr_cache_hit_ratio', 'Hits / lookups since start, per cache', labels=('cache',),
+                       callback=cache_hit_ratios)
+metrics.registry.gauge('mdr_queue_depth', 'Work waiting to start, per queue', labels=('queue',),
+                       callback=queue_depths)
+metrics.registry.gauge('mdr_executor_saturation', 'Images in flight / processing capacity',
+                       callback=executor_saturation)
+metrics.registry.gauge('mdr_openai_calls', 'OpenAI scheduler counters summed over API keys', labels=('counter',),
+                       callback=rate_limit_totals)
+
+
+@app.route('/metrics')
+@limiter.exempt
+def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 # Health check endpoint for monitoring
@@ -668,6 +1792,23 @@ def health_check():
                 'upload_dir_exists': os.path.isdir(app.config['UPLOAD_FOLDER']),
                 'upload_dir_writable': os.access(app.config['UPLOAD_FOLDER'], os.W_OK),
                 'profiles_loaded': len(PROFILES) > 0
+            },
+            'uploads': upload_catalog.stats(),
+            'cache': metadata_cache.stats(),
+            'payload_cache': payload_cache.stats() if payload_cache else None,
+            'near_duplicates': near_duplicate_index.stats() if near_duplicate_index else None,
+            'results': result_store.stats(),
+            'job_queue': job_queue.stats(),
+            'processing': {
+                'engine': config.processing_engine,
+                'image_workers': config.image_workers,
+                'max_workers': config.processing_workers,
+                'client_pool': client_pool.stats(),
+                'rate_limits': rate_scheduler.stats(),
+                'async': async_engine.stats() if async_engine else None,
+                'scheduling': fair_queue.stats(),
+                'grouping': request_grouper.stats(),
+                'coalescing': in_flight_requests.stats()
             }
         })
     except Exception as e:
@@ -677,6 +1818,19 @@ def health_check():
         }), 500
 
 
-if __name__ == '__main__':
+startup.mark('initialised')
+
+
+def warm_up():
+    """Load what the first generation needs (deferred at import to start faster) while the page renders."""
+    for module in ('httpx', 'openai', 'PIL.Image'):
+        importlib.import_module(module)
+
+
+def main():
+    """Run the development / desktop server (python app.py or python server.py)."""
+    recover_batch_jobs()
+    startup.mark('recovered jobs')
     print(f"Starting MetaData Refiner server on {config.host}:{config.port}")
+    startup.signal_ready(config.host, config.port, warm_up)
     socketio.run(app, host=config.host, port=config.port, debug=config.debug, allow_unsafe_werkzeug=True)
@@ -0,0 +1,94 @@
+"""Asyncio processing engine for MetaData Refiner."""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import OpenAIClientPool
+
+
+class AsyncEngine:
+    """Run generation coroutines on a dedicated event loop thread.
+
+    Network calls go through AsyncOpenAI, so hundreds of requests can be
+    in flight without a thread each; CPU-bound work such as image
+    encoding is pushed to a separate thread pool so it never stalls
+    the loop.
+    """
+
+    def __init__(self, concurrency, encode_workers, timeout, scheduler=None, base_url=None, keepalive_expiry=30.0,
+                 idle_ttl=600):
+        self.concurrency = concurrency
+        self.scheduler = scheduler
+        self.encode_workers = encode_workers
+        self.encode_executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix='encode')
+        self.loop = asyncio.new_event_loop()
+        # Per-key clients, keyed by a hash of the key and closed once idle; retries are left
+        # to the scheduler when one is attached
+        self.clients = OpenAIClientPool(
+            timeout=timeout,
+            max_connections=concurrency,
+            max_keepalive=concurrency,
+            keepalive_expiry=keepalive_expiry,
+            idle_ttl=idle_ttl,
+            http2=False,
+            max_retries=0 if scheduler else 2,
+            base_url=base_url,
+            loop=self.loop
+        )
+        self._in_flight = 0
+        self._thread = threading.Thread(target=self._run_loop, name='async-engine', daemon=True)
+        self._thread.start()
+        # Created on the loop so it binds to it
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(), self.loop).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    def submit(self, fn, *args):
+        """Schedule coroutine function fn(*args) and return a concurrent.futures.Future.
+
+        Mirrors Executor.submit so callers can swap the engine in for
+        processing_executor.
+        """
+        return asyncio.run_coroutine_threadsafe(fn(*args), self.loop)
+
+    async def run_cpu(self, fn, *args):
+        """Run CPU-bound fn on the encode pool."""
+        return await self.loop.run_in_executor(self.encode_executor, fn, *args)
+
+    async def run_blocking(self, fn, *args):
+        """Run blocking I/O (cache, disk) on the loop's default executor."""
+        return await self.loop.run_in_executor(None, fn, *args)
+
+    async def create_completion(self, api_key, estimated_tokens=0, **kwargs):
+        """Call chat.completions.create, bounded by the engine's concurrency.
+
+        With a scheduler attached the call also goes through its per-key
+        budgets and retry policy.
+        """
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                completions = self.clients.get(api_key).chat.completions
+                if self.scheduler:
+                    return await self.scheduler.acall(
+                        api_key, estimated_tokens, lambda: completions.with_raw_response.create(**kwargs)
+                    )
+                return await completions.create(**kwargs)
+            finally:
+                self._in_flight -= 1
+
+    def stats(self):
+        """Return concurrency settings and current in-flight count."""
+        return {
+            'engine': 'async',
+            'concurrency': self.concurrency,
+            'in_flight': self._in_flight,
+            'encode_workers': self.encode_workers,
+            'clients': self.clients.stats()
+        }
@@ -0,0 +1,163 @@
+"""Shared-state backends for running MetaData Refiner as several processes.
+
+Redis is the usual choice for both the Socket.IO message queue and the
+rate-limit store; these SQLite versions do the same job for processes
+on one host without another service to run.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+from socketio import PubSubManager
+
+
+def sqlite_path(url):
+    """Database path from a sqlite:///relative or sqlite:////absolute URL."""
+    path = urlparse(url).path
+    # sqlite:///data/x.db -> data/x.db, sqlite:////srv/x.db -> /srv/x.db
+    return path[1:] if path.startswith('/') else path
+
+
+class _Connections:
+    """Per-thread SQLite connections in WAL mode."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+
+class SQLiteManager(PubSubManager):
+    """Socket.IO client manager that relays emits between processes through SQLite.
+
+    Messages are appended to a table that every process polls every
+    poll_interval seconds; rows older than retention seconds are pruned.
+    Use as SocketIO(client_manager=SQLiteManager('sqlite:///data/socketio.db')).
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, url, channel='socketio', write_only=False, logger=None, poll_interval=0.05, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._db = _Connections(sqlite_path(url))
+        conn = self._db.get()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' channel TEXT NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' data BLOB NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created)')
+
+    def _publish(self, data):
+        conn = self._db.get()
+        with conn:
+            conn.execute('INSERT INTO messages (channel, created, data) VALUES (?, ?, ?)',
+                         (self.channel, time.time(), pickle.dumps(data)))
+
+    def _listen(self):
+        conn = self._db.get()
+        # Only messages published after this process started listening
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages').fetchone()[0]
+        next_prune = 0.0
+        while True:
+            rows = conn.execute(
+                'SELECT id, data FROM messages WHERE id > ? AND channel = ? ORDER BY id',
+                (last_id, self.channel)
+            ).fetchall()
+            # End the read transaction so WAL checkpoints are not held back
+            conn.commit()
+            for row_id, data in rows:
+                last_id = row_id
+                yield data
+            now = time.time()
+            if now >= next_prune:
+                with conn:
+                    conn.execute('DELETE FROM messages WHERE created < ?', (now - self.retention,))
+                next_prune = now + self.retention / 4
+            time.sleep(self.poll_interval)
+
+
+class SQLiteStorage(Storage):
+    """Fixed-window rate-limit counters in SQLite, shared by every process on the host.
+
+    Registered for sqlite:// URIs, so Flask-Limiter accepts
+    storage_uri='sqlite:///data/ratelimits.db'.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._db = _Connections(sqlite_path(uri))
+        self._next_sweep = 0.0
+        conn = self._db.get()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL,'
+                         ' expires REAL NOT NULL)')
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        conn = self._db.get()
+        if now >= self._next_sweep:
+            self._next_sweep = now + 60
+            with conn:
+                conn.execute('DELETE FROM counters WHERE expires <= ?', (now,))
+        with conn:
+            # An expired window restarts at amount; a live one is incremented in place
+            return conn.execute(
+                'INSERT INTO counters (key, value, expires) VALUES (?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET'
+                '  value = CASE WHEN expires <= ? THEN excluded.value ELSE value + excluded.value END,'
+                '  expires = CASE WHEN expires <= ? OR ? THEN excluded.expires ELSE expires END'
+                ' RETURNING value',
+                (key, amount, now + expiry, now, now, int(bool(elastic_expiry)))
+            ).fetchall()[0][0]
+
+    def get(self, key):
+        row = self._db.get().execute('SELECT value FROM counters WHERE key = ? AND expires > ?',
+                                     (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._db.get().execute('SELECT expires FROM counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._db.get().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        conn = self._db.get()
+        with conn:
+            return conn.execute('DELETE FROM counters').rowcount
+
+    def clear(self, key):
+        conn = self._db.get()
+        with conn:
+            conn.execute('DELETE FROM counters WHERE key = ?', (key,))
@@ -0,0 +1,371 @@
+"""Benchmark the upload, generation and export paths against a mock OpenAI API.
+
+Runs entirely offline: a local stand-in (mock_openai.py) answers chat
+completions with configurable latency, 429 rate and malformed-JSON
+injection, and the app runs in-process with a throwaway data folder.
+A synthetic corpus is uploaded through /upload, generated through the
+Socket.IO generate_metadata and generate_batch events (cold, then warm
+from the cache) and exported through /export. Reports images/sec,
+p50/p99 latency, CPU per image and peak RSS (including image workers).
+
+    python benchmarks/bench_pipeline.py [--corpus mixed] [--engine threads|async]
+    python benchmarks/bench_pipeline.py --save-baseline            # write benchmarks/baselines/<corpus>-<engine>.json
+    python benchmarks/bench_pipeline.py --compare                  # diff against that baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import mock_openai  # noqa: E402
+from bench_preprocess import make_image  # noqa: E402
+
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+API_KEY = 'sk-' + 'b' * 40
+
+CORPORA = {
+    # name: [(count, size, mode, format), ...]
+    'small': [(40, (800, 600), 'RGB', 'JPEG')],
+    'mixed': [
+        (24, (1200, 800), 'RGB', 'JPEG'),
+        (12, (2000, 2000), 'RGBA', 'PNG'),
+        (12, (1600, 1600), 'P', 'PNG'),
+        (12, (2400, 1600), 'RGB', 'WEBP'),
+    ],
+    'large': [(20, (6000, 4000), 'RGB', 'JPEG')],
+}
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+SCENARIOS = ('upload', 'socket_single', 'socket_batch', 'socket_batch_warm', 'export')
+# Lower is better for every reported metric except throughput
+METRICS = (('per_sec', 'img/s', True), ('p50_ms', 'p50 ms', False), ('p99_ms', 'p99 ms', False),
+           ('cpu_ms_per_image', 'cpu ms/img', False), ('peak_rss_mb', 'peak MB', False))
+
+
+def build_corpus(name):
+    """Render the corpus in memory; returns [(filename, bytes)]."""
+    files = []
+    seed = 0
+    for count, size, mode, fmt in CORPORA[name]:
+        for _ in range(count):
+            buffer = io.BytesIO()
+            make_image(size, mode, seed).save(buffer, format=fmt, quality=92)
+            files.append((f'bench-{seed:04d}{EXTENSIONS[fmt]}', buffer.getvalue()))
+            seed += 1
+    return files
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+class ResourceSampler:
+    """Track CPU time and peak RSS of this process plus its image workers.
+
+    Worker processes come from app.image_pool, so encode work done there
+    is counted too. Reads /proc on Linux; elsewhere only this process's
+    CPU and lifetime peak RSS are available.
+    """
+
+    def __init__(self, pool=None, interval=0.05):
+        self.pool = pool
+        self.interval = interval
+        self.peak_rss = 0
+        self._proc = os.path.isdir('/proc/self')
+        self._page = os.sysconf('SC_PAGE_SIZE') if self._proc else 0
+        self._ticks = os.sysconf('SC_CLK_TCK') if self._proc else 0
+        self._worker_cpu = {}
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._cpu_start = time.process_time()
+        self._worker_start = self._read_workers()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        self.cpu_seconds = time.process_time() - self._cpu_start + sum(
+            seconds - self._worker_start.get(pid, 0.0) for pid, seconds in self._worker_cpu.items()
+        )
+
+    def _workers(self):
+        processes = getattr(self.pool, '_processes', None) or {}
+        return list(processes)
+
+    def _read_workers(self):
+        cpu = {}
+        for pid in self._workers():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu[pid] = (int(fields[11]) + int(fields[12])) / self._ticks
+            except (OSError, IndexError, ValueError, ZeroDivisionError):
+                continue
+        return cpu
+
+    def _rss(self, pid):
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * self._page
+
+    def _sample(self):
+        if not self._proc:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_rss = max(self.peak_rss, peak if sys.platform == 'darwin' else peak * 1024)
+            return
+        total = 0
+        for pid in ['self'] + self._workers():
+            try:
+                total += self._rss(pid)
+            except (OSError, IndexError, ValueError):
+                continue
+        self.peak_rss = max(self.peak_rss, total)
+        self._worker_cpu.update(self._read_workers())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+class Bench:
+    def __init__(self, app_module, corpus, timeout):
+        self.app = app_module
+        self.corpus = corpus
+        self.timeout = timeout
+        self.http = app_module.app.test_client()
+        self.paths = []
+
+    def run(self, name, fn):
+        with ResourceSampler(self.app.image_pool) as sampler:
+            started = time.perf_counter()
+            count, latencies, failed = fn()
+            elapsed = time.perf_counter() - started
+        return {
+            'count': count,
+            'failed': failed,
+            'seconds': round(elapsed, 3),
+            'per_sec': round(count / elapsed, 2) if elapsed else None,
+            'p50_ms': _round(percentile(latencies, 50)),
+            'p99_ms': _round(percentile(latencies, 99)),
+            'cpu_ms_per_image': _round(sampler.cpu_seconds * 1000 / count if count else None),
+            'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1)
+        }
+
+    def reset_caches(self):
+        self.app.metadata_cache.clear()
+        if self.app.payload_cache:
+            self.app.payload_cache.clear()
+
+    def upload(self, per_request=10):
+        latencies, failed = [], 0
+        self.paths = []
+        for start in range(0, len(self.corpus), per_request):
+            chunk = self.corpus[start:start + per_request]
+            began = time.perf_counter()
+            response = self.http.post('/upload', data={
+                'images': [(io.BytesIO(data), name) for name, data in chunk]
+            }, content_type='multipart/form-data')
+            latencies.append((time.perf_counter() - began) * 1000)
+            if response.status_code != 200:
+                failed += len(chunk)
+                continue
+            uploaded = response.get_json()['images']
+            self.paths.extend(entry['full_path'] for entry in uploaded)
+            failed += len(chunk) - len(uploaded)
+        return len(self.corpus), latencies, failed
+
+    def socket_single(self):
+        client = self.app.socketio.test_client(self.app.app)
+        for path in self.paths:
+            client.emit('generate_metadata', {'full_path': path, 'profile': 'zedge', 'settings': {'apiKey': API_KEY}})
+        latencies, failed, seen = [], 0, 0
+        deadline = time.monotonic() + self.timeout
+        while seen < len(self.paths) and time.monotonic() < deadline:
+            for event in client.get_received():
+                payload = event['args'][0] if event['args'] else {}
+                if event['name'] == 'metadata_update':
+                    latencies.append(payload['timings']['total'])
+                elif event['name'] == 'error':
+                    failed += 1
+                else:
+                    continue
+                seen += 1
+            time.sleep(0.01)
+        client.disconnect()
+        return len(self.paths), latencies, failed + len(self.paths) - seen
+
+    def socket_batch(self):
+        client = self.app.socketio.test_client(self.app.app)
+        client.emit('generate_batch', {'images': self.paths, 'profile': 'zedge', 'settings': {'apiKey': API_KEY}})
+        latencies, failed, complete = [], 0, False
+        deadline = time.monotonic() + self.timeout
+        while not complete and time.monotonic() < deadline:
+            for event in client.get_received():
+                if event['name'] not in ('batch_progress', 'batch_complete'):
+                    continue
+                payload = event['args'][0]
+                latencies.extend(r['timings']['total'] for r in payload['results'] if 'timings' in r)
+                failed += len(payload['errors'])
+                complete = complete or event['name'] == 'batch_complete'
+            time.sleep(0.01)
+        client.disconnect()
+        # Images missing from the results failed or never finished
+        return len(self.paths), latencies, len(self.paths) - len(latencies)
+
+    def export(self, rows=20000):
+        data = [{
+            'full_path': f'/static/images/export-{i:06d}.jpg',
+            **mock_openai.METADATA
+        } for i in range(rows)]
+        latencies, failed = [], 0
+        for fmt, compress in (('csv', False), ('jsonl', False), ('csv', True)):
+            began = time.perf_counter()
+            response = self.http.post('/export', json={'data': data, 'profile': 'zedge', 'format': fmt,
+                                                       'gzip': compress, 'base_path': '/srv/images'})
+            size = sum(len(chunk) for chunk in response.response)
+            latencies.append((time.perf_counter() - began) * 1000)
+            if response.status_code != 200 or not size:
+                failed += rows
+        return rows * 3, latencies, failed
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def print_results(results, baseline=None):
+    print(f"\n{'scenario':<18} {'n':>5} {'fail':>5} " + ' '.join(f'{label:>11}' for _, label, _ in METRICS))
+    for scenario, row in results.items():
+        cells = []
+        for key, _, _ in METRICS:
+            cells.append(f"{'-' if row[key] is None else row[key]:>11}")
+        print(f"{scenario:<18} {row['count']:>5} {row['failed']:>5} " + ' '.join(cells))
+        previous = (baseline or {}).get(scenario)
+        if previous:
+            deltas = []
+            for key, _, higher_is_better in METRICS:
+                old, new = previous.get(key), row[key]
+                if not old or new is None:
+                    deltas.append(f"{'':>11}")
+                    continue
+                change = (new - old) / old * 100
+                better = change > 0 if higher_is_better else change < 0
+                deltas.append(f"{change:>+9.1f}%{'+' if better and abs(change) >= 5 else ' '}")
+            print(f"{'  vs baseline':<30} " + ' '.join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default='mixed', choices=sorted(CORPORA))
+    parser.add_argument('--engine', default='threads', choices=('threads', 'async'))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma-separated subset of {",".join(SCENARIOS)} (upload always runs)')
+    parser.add_argument('--group-size', type=int, default=1, help='images per OpenAI request for the benchmark profile')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds to wait for each generation scenario')
+    parser.add_argument('--save-baseline', nargs='?', const='', metavar='NAME',
+                        help='write results to benchmarks/baselines/NAME.json (default <corpus>-<engine>)')
+    parser.add_argument('--compare', nargs='?', const='', metavar='NAME', help='show deltas against a saved baseline')
+    mock_openai.add_arguments(parser)
+    args = parser.parse_args()
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    baseline_name = f'{args.corpus}-{args.engine}'
+
+    settings = mock_openai.settings_from_args(args)
+    server = mock_openai.start(settings)
+    workdir = tempfile.mkdtemp(prefix='mdr-bench-')
+    # The app reads its configuration at import time
+    os.environ.update({
+        'OPENAI_BASE_URL': mock_openai.base_url(server),
+        'DATA_FOLDER': os.path.join(workdir, 'data'),
+        'PROCESSING_ENGINE': args.engine,
+        'DEBUG_TIMINGS': '1',
+        'FLASK_DEBUG': '0'
+    })
+    print(f"Rendering {args.corpus} corpus...", file=sys.stderr, flush=True)
+    corpus = build_corpus(args.corpus)
+
+    # Keep the app's per-image logging out of the report
+    quiet = contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with quiet:
+        import app
+    # Measure the pipeline, not the per-client abuse limits
+    app.limiter.enabled = False
+    app.SOCKET_RATE_LIMIT = sys.maxsize
+    app.config.batch_max_images = max(app.config.batch_max_images, len(corpus))
+    if args.group_size > 1:
+        app.PROFILES['zedge']['group_size'] = args.group_size
+    upload_root = os.path.join(workdir, 'uploads')
+    app.app.config['UPLOAD_FOLDER'] = upload_root
+    app.upload_store.root = upload_root
+
+    bench = Bench(app, corpus, args.timeout)
+    results = {}
+    try:
+        with quiet:
+            for scenario in ('upload',) + tuple(s for s in SCENARIOS if s != 'upload'):
+                if scenario != 'upload' and scenario not in scenarios:
+                    continue
+                print(f"Running {scenario}...", file=sys.stderr, flush=True)
+                if scenario in ('socket_single', 'socket_batch'):
+                    bench.reset_caches()
+                results[scenario] = bench.run(scenario, getattr(bench, scenario.replace('_warm', '')))
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'corpus': args.corpus,
+        'engine': args.engine,
+        'group_size': args.group_size,
+        'images': len(corpus),
+        'mock': {'latency': args.latency, 'jitter': args.jitter, 'rate_429': args.rate_429,
+                 'malformed_rate': args.malformed_rate, 'seed': args.seed, **settings.counters},
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'results': results
+    }
+
+    baseline = None
+    if args.compare is not None:
+        path = os.path.join(BASELINE_DIR, f'{args.compare or baseline_name}.json')
+        try:
+            with open(path, encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+        except OSError:
+            print(f"No baseline at {path}", file=sys.stderr)
+    print(f"{args.corpus} corpus, {len(corpus)} images, {args.engine} engine, group size {args.group_size}, "
+          f"mock {args.latency}s +/- {args.jitter}s, 429 {args.rate_429:.0%}, malformed {args.malformed_rate:.0%}")
+    print(f"mock counters: {settings.counters}")
+    print_results(results, baseline)
+
+    if args.save_baseline is not None:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save_baseline or baseline_name}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved baseline to {path}")
+
+
+if __name__ == '__main__':
+    main()
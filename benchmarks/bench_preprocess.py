@@ -0,0 +1,90 @@
+"""Benchmark image preprocessing presets for MetaData Refiner.
+
+Generates a synthetic corpus, then reports decode+encode time and payload
+size for each preset in imaging.PRESETS.
+
+    python benchmarks/bench_preprocess.py [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+from imaging import PRESETS, encode_jpeg  # noqa: E402
+
+CORPUS = [
+    # name, size, mode, format
+    ('photo-24mp.jpg', (6000, 4000), 'RGB', 'JPEG'),
+    ('photo-12mp.jpg', (4000, 3000), 'RGB', 'JPEG'),
+    ('small.jpg', (900, 600), 'RGB', 'JPEG'),
+    ('art-alpha.png', (3000, 3000), 'RGBA', 'PNG'),
+    ('palette.png', (2000, 2000), 'P', 'PNG'),
+    ('photo.webp', (3000, 2000), 'RGB', 'WEBP'),
+]
+
+
+def make_image(size, mode, seed):
+    """Draw a noisy, detailed image so encoders have real work to do."""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(400):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(size[0] // 4), y0 + rng.randrange(size[1] // 4)
+        draw.ellipse((x0, y0, x1, y1), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    if mode == 'RGBA':
+        img.putalpha(Image.linear_gradient('L').resize(size))
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.Palette.ADAPTIVE)
+    return img
+
+
+def build_corpus(directory):
+    paths = []
+    for seed, (name, size, mode, fmt) in enumerate(CORPUS):
+        path = os.path.join(directory, name)
+        make_image(size, mode, seed).save(path, format=fmt, quality=92)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per image and preset')
+    parser.add_argument('--max-dimension', type=int, default=1024)
+    parser.add_argument('--quality', type=int, default=85)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = build_corpus(directory)
+        print(f"{'image':<16} {'input':>9} {'preset':<8} {'median ms':>10} {'payload':>9}")
+        totals = {preset: [0.0, 0] for preset in PRESETS}
+        for path in paths:
+            input_kb = os.path.getsize(path) / 1024
+            for preset in PRESETS:
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    payload = encode_jpeg(path, args.max_dimension, args.quality, preset)
+                    timings.append((time.perf_counter() - start) * 1000)
+                median = statistics.median(timings)
+                totals[preset][0] += median
+                totals[preset][1] += len(payload)
+                print(f"{os.path.basename(path):<16} {input_kb:>7.0f}KB {preset:<8} {median:>10.1f} {len(payload) / 1024:>7.0f}KB")
+
+        print()
+        for preset, (ms, size) in totals.items():
+            print(f"{preset:<8} total {ms:8.1f} ms  payload {size / 1024:8.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
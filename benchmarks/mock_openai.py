@@ -0,0 +1,181 @@
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Answers POST /v1/chat/completions with metadata that satisfies every
+profile (one entry per image ID for grouped requests) after a
+configurable delay, and can inject 429s and malformed JSON at fixed
+rates. Draws come from a seeded generator so runs are repeatable. Point the app at it with OPENAI_BASE_URL:
+
+    python benchmarks/mock_openai.py --port 8765 --latency 0.8 --rate-429 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METADATA = {
+    'title': 'Sunlit mountain lake',
+    'description': 'Calm water reflecting snowy peaks under a clear sky',
+    'tags': 'lake,mountain,reflection,snow,nature',
+    'keywords': 'lake,mountain,reflection,snow,nature',
+    'category': 'Nature'
+}
+
+
+class MockSettings:
+    def __init__(self, latency=0.5, jitter=0.1, rate_429=0.0, malformed_rate=0.0, retry_after_ms=200, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.malformed_rate = malformed_rate
+        self.retry_after_ms = retry_after_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'malformed': 0}
+
+    def draw(self):
+        """Return (delay seconds, outcome) for the next request."""
+        with self._lock:
+            self.counters['requests'] += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            roll = self._rng.random()
+            if roll < self.rate_429:
+                outcome = 'rate_limited'
+            elif roll < self.rate_429 + self.malformed_rate:
+                outcome = 'malformed'
+            else:
+                outcome = 'ok'
+            self.counters[outcome] += 1
+        return delay, outcome
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, as the real API
+    settings = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('content-length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            body = {}
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+        delay, outcome = self.settings.draw()
+        time.sleep(delay)
+        if outcome == 'rate_limited':
+            return self._send(429, {'error': {'message': 'Rate limit reached (mock)', 'type': 'requests',
+                                              'code': 'rate_limit_exceeded'}},
+                              {'retry-after-ms': str(self.settings.retry_after_ms)})
+
+        image_ids = grouped_image_ids(body)
+        if image_ids:
+            content = json.dumps({'results': [{'id': image_id, **METADATA} for image_id in image_ids]})
+        else:
+            content = json.dumps(METADATA)
+        if outcome == 'malformed':
+            # Truncated mid-object, as a cut-off completion would be
+            content = content[:len(content) // 2]
+        self._send(200, {
+            'id': 'chatcmpl-mock',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content}
+            }],
+            'usage': usage(max(1, len(image_ids)))
+        })
+
+    def _send(self, status, payload, headers=None):
+        out = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(out)))
+        # Generous limits so the scheduler only backs off on injected 429s
+        self.send_header('x-ratelimit-limit-requests', '100000')
+        self.send_header('x-ratelimit-remaining-requests', '99999')
+        self.send_header('x-ratelimit-reset-requests', '1s')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(out)
+
+
+def usage(images):
+    prompt, completion = 85 + 765 * images, 60 * images
+    return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+
+def grouped_image_ids(body):
+    """Image IDs announced in a multi-image request, in order (empty for single-image requests)."""
+    ids = []
+    for message in body.get('messages', []):
+        if isinstance(message.get('content'), list):
+            for part in message['content']:
+                text = part.get('text', '') if part.get('type') == 'text' else ''
+                if text.startswith('Image ID: '):
+                    ids.append(text[len('Image ID: '):])
+    return ids
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start(settings, host='127.0.0.1', port=0):
+    """Serve in a daemon thread; returns the server (port 0 picks a free one)."""
+    handler = type('BoundMockHandler', (MockHandler,), {'settings': settings})
+    server = MockServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mock-openai', daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}/v1'
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.5, help='mean response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.1, help='uniform +/- spread around the latency')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction answered with truncated JSON')
+    parser.add_argument('--retry-after-ms', type=int, default=200, help='retry-after-ms sent with 429s')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def settings_from_args(args):
+    return MockSettings(args.latency, args.jitter, args.rate_429, args.malformed_rate, args.retry_after_ms, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    settings = settings_from_args(args)
+    server = start(settings, args.host, args.port)
+    print(f"Mock OpenAI API at {base_url(server)}", flush=True)
+    try:
+        while True:
+            time.sleep(10)
+            print(f"  {settings.counters}", flush=True)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Offline bulk generation through the OpenAI Batch API for MetaData Refiner."""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+class BulkJob:
+    """A bulk run for one profile, split across one or more Batch API batches."""
+
+    def __init__(self, profile_name):
+        self.id = uuid.uuid4().hex
+        self.profile_name = profile_name
+        self.status = 'preparing'
+        self.created = time.time()
+        self.finished = None
+        self.batches = []
+        # custom_id -> image URLs sharing that content
+        self.items = {}
+        self.cached = 0
+        self.completed = 0
+        self.failed = 0
+        self.results = []
+        self.errors = []
+        self.answered = set()
+        self.collected_files = set()
+        self._lock = threading.Lock()
+
+    def record_error(self, images, message):
+        """Mark images as failed with a short message."""
+        with self._lock:
+            self.failed += len(images)
+            self.errors.extend({'image': image, 'message': message[:200]} for image in images)
+
+    def summary(self, include_results=False):
+        """Return job status, batch states and counters."""
+        with self._lock:
+            data = {
+                'job_id': self.id,
+                'profile': self.profile_name,
+                'status': self.status,
+                'images': sum(len(paths) for paths in self.items.values()) + self.cached,
+                'requests': len(self.items),
+                'cached': self.cached,
+                'completed': self.completed,
+                'failed': self.failed,
+                'batches': [dict(b) for b in self.batches]
+            }
+            if include_results:
+                data['results'] = list(self.results)
+                data['errors'] = list(self.errors)
+            return data
+
+
+class BulkRunner:
+    """Build JSONL batch files, submit them and collect validated results.
+
+    The OpenAI client is used only through files.* and batches.*, so
+    pointing it at a local stand-in via base_url is enough for testing.
+    A run can last up to a day, so each one gets its own client from
+    client_factory(api_key), closed when the run ends, rather than a
+    pooled client that may be closed as idle. A poll that still fails
+    after the client's own retries is tried again at the next interval,
+    up to max_poll_failures times in a row.
+    """
+
+    def __init__(self, work_dir, poll_interval, max_file_bytes, max_requests_per_file, client_factory,
+                 max_poll_failures=10):
+        self.work_dir = work_dir
+        self.poll_interval = poll_interval
+        self.max_file_bytes = max_file_bytes
+        self.max_requests_per_file = max_requests_per_file
+        self.client_factory = client_factory
+        self.max_poll_failures = max_poll_failures
+        self.jobs = {}
+
+    def start(self, job, api_key, requests, finish):
+        """Run a job on a background thread.
+
+        requests yields (custom_id, image_url, body) tuples, or
+        (None, image_url, None) for images already answered from cache.
+        finish(custom_id, content) validates and caches one result,
+        returning its metadata or raising ValueError.
+        """
+        self.jobs[job.id] = job
+        threading.Thread(target=self.run, args=(job, api_key, requests, finish), name=f'bulk-{job.id[:8]}', daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def run(self, job, api_key, requests, finish):
+        client = None
+        try:
+            client = self.client_factory(api_key)
+            paths = self._write_files(job, requests)
+            if not paths:
+                job.status = 'completed'
+                return
+            for path in paths:
+                self._submit(job, client, path)
+            job.status = 'in_progress'
+            self._poll(job, client, finish)
+            # Batches that failed or expired may leave requests without an output line
+            for custom_id, images in job.items.items():
+                if custom_id not in job.answered:
+                    job.record_error(images, 'No result returned by the batch')
+            job.status = 'completed' if all(b['status'] == 'completed' for b in job.batches) else 'partial'
+        except Exception as e:
+            print(f"Bulk job {job.id} failed: {e}", flush=True)
+            job.status = 'failed'
+            job.record_error([], str(e))
+        finally:
+            job.finished = time.time()
+            if client is not None:
+                client.close()
+
+    def _write_files(self, job, requests):
+        """Stream requests into JSONL files that respect the Batch API size limits."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        paths = []
+        handle = None
+        size = count = 0
+        try:
+            for custom_id, image_url, body in requests:
+                if custom_id is None:
+                    job.cached += 1
+                    continue
+                if custom_id in job.items:
+                    # Duplicate content: one request answers every copy
+                    job.items[custom_id].append(image_url)
+                    continue
+                line = json.dumps({
+                    'custom_id': custom_id,
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': body
+                }) + '\n'
+                encoded = line.encode('utf-8')
+                if handle is None or size + len(encoded) > self.max_file_bytes or count >= self.max_requests_per_file:
+                    if handle:
+                        handle.close()
+                    paths.append(os.path.join(self.work_dir, f'{job.id}-{len(paths)}.jsonl'))
+                    handle = open(paths[-1], 'wb')
+                    size = count = 0
+                handle.write(encoded)
+                size += len(encoded)
+                count += 1
+                job.items[custom_id] = [image_url]
+        finally:
+            if handle:
+                handle.close()
+        return paths
+
+    def _submit(self, job, client, path):
+        try:
+            with open(path, 'rb') as f:
+                uploaded = client.files.create(file=f, purpose='batch')
+        finally:
+            os.remove(path)
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h',
+            metadata={'job_id': job.id, 'profile': job.profile_name}
+        )
+        print(f"Bulk job {job.id} submitted batch {batch.id}", flush=True)
+        job.batches.append({'batch_id': batch.id, 'input_file_id': uploaded.id, 'status': batch.status})
+
+    def _poll(self, job, client, finish):
+        failures = 0
+        while True:
+            pending = [b for b in job.batches if b['status'] not in TERMINAL_STATUSES]
+            if not pending:
+                return
+            time.sleep(self.poll_interval)
+            for entry in pending:
+                try:
+                    self._check(job, client, entry, finish)
+                except Exception as e:
+                    failures += 1
+                    if failures >= self.max_poll_failures:
+                        raise
+                    print(f"Bulk job {job.id} poll failed ({failures}/{self.max_poll_failures}): {e}", flush=True)
+                    continue
+                failures = 0
+
+    def _check(self, job, client, entry, finish):
+        """Refresh one batch; once it has finished, collect its output and error files."""
+        batch = client.batches.retrieve(entry['batch_id'])
+        if batch.status in TERMINAL_STATUSES:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                # A file collected before a failed poll is not counted twice
+                if file_id and file_id not in job.collected_files:
+                    self._collect(job, client.files.content(file_id).text, finish)
+                    job.collected_files.add(file_id)
+            print(f"Bulk batch {batch.id} finished with status {batch.status}", flush=True)
+        entry['status'] = batch.status
+
+    def _collect(self, job, text, finish):
+        """Validate each output line and record results per image."""
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Its requests are reported as unanswered once the job ends
+                print(f"Bulk job {job.id} skipped a malformed output line", flush=True)
+                continue
+            if not isinstance(record, dict):
+                continue
+            custom_id = record.get('custom_id')
+            images = job.items.get(custom_id, [])
+            job.answered.add(custom_id)
+            try:
+                response = record.get('response') or {}
+                if record.get('error') or response.get('status_code') != 200:
+                    error = record.get('error') or (response.get('body') or {}).get('error') or {}
+                    raise ValueError(error.get('message') or f"Batch request failed with status {response.get('status_code')}")
+                content = response['body']['choices'][0]['message']['content']
+                metadata = finish(custom_id, content)
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                job.record_error(images, str(e))
+                continue
+            with job._lock:
+                job.completed += len(images)
+                job.results.extend({'image': image, 'metadata': metadata} for image in images)
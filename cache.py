@@ -0,0 +1,335 @@
+"""Metadata cache backends for MetaData Refiner."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryCache:
+    """In-process LRU cache with TTL, entry and byte limits."""
+
+    def __init__(self, ttl, max_entries=0, max_bytes=0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            if time.time() - entry['timestamp'] >= self.ttl:
+                self._remove(key)
+                self._counters['expired'] += 1
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return json.loads(entry['value'])
+
+    def set(self, key, value):
+        """Store value under key and evict least recently used entries over budget."""
+        payload = json.dumps(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'value': payload, 'timestamp': time.time(), 'size': len(payload)}
+            self._bytes += len(payload)
+            while self._entries and self._over_budget():
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters['evictions'] += 1
+
+    def delete(self, key):
+        """Remove a single entry."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def keys(self):
+        """Return all stored keys, including ones not yet swept."""
+        with self._lock:
+            return list(self._entries)
+
+    def delete_many(self, keys):
+        """Remove the given keys and return how many existed."""
+        removed = 0
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def sweep(self):
+        """Remove expired entries and return how many were dropped."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [k for k, e in self._entries.items() if e['timestamp'] <= cutoff]
+            for key in expired:
+                self._remove(key)
+            self._counters['expired'] += len(expired)
+        return len(expired)
+
+    def stats(self):
+        """Return entry count, size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                **self._counters
+            }
+
+    def _over_budget(self):
+        if self.max_entries and len(self._entries) > self.max_entries:
+            return True
+        return bool(self.max_bytes and self._bytes > self.max_bytes)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+
+class SQLiteCache:
+    """On-disk LRU cache shared by every server process on the host.
+
+    SQLite in WAL mode serializes writers across processes, so several
+    workers can point at the same file. Lookups are plain reads that
+    never take the write lock: access times and hit/miss counts are
+    gathered in process and written with the next set() or sweep(), so
+    counters in the database are host-wide once flushed.
+    """
+
+    def __init__(self, path, ttl, max_entries=0, max_bytes=0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._pending = {'hits': 0, 'misses': 0}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_created ON entries (created)')
+            # Running entry count and size, so set() and stats() need no table scan
+            conn.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0),'
+                         ' entries INTEGER NOT NULL, bytes INTEGER NOT NULL)')
+            # Caches created before totals were kept start from the rows already stored
+            conn.execute('INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN'
+                         ' UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size; END')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN'
+                         ' UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size; END')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN'
+                         ' UPDATE totals SET bytes = bytes - OLD.size + NEW.size; END')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.executemany(
+                'INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)',
+                [('hits',), ('misses',), ('evictions',), ('expired',)]
+            )
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired.
+
+        Expired rows are left for sweep() to delete.
+        """
+        now = time.time()
+        conn = self._connect().conn
+        row = conn.execute('SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+        hit = row is not None and now - row[1] < self.ttl
+        with self._lock:
+            self._pending['hits' if hit else 'misses'] += 1
+            if hit:
+                self._accessed[key] = now
+        return json.loads(row[0]) if hit else None
+
+    def set(self, key, value):
+        """Store value under key and evict least recently used entries over budget."""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._connect() as conn:
+            self._flush(conn)
+            conn.execute(
+                'INSERT INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size,'
+                ' created = excluded.created, accessed = excluded.accessed',
+                (key, payload, len(payload), now, now)
+            )
+            self._evict(conn)
+
+    def delete(self, key):
+        """Remove a single entry."""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def clear(self):
+        """Remove all entries."""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM entries')
+
+    def keys(self):
+        """Return all stored keys, including ones not yet swept."""
+        conn = self._connect().conn
+        return [row[0] for row in conn.execute('SELECT key FROM entries')]
+
+    def delete_many(self, keys):
+        """Remove the given keys and return how many existed."""
+        with self._connect() as conn:
+            return sum(conn.execute('DELETE FROM entries WHERE key = ?', (key,)).rowcount for key in keys)
+
+    def sweep(self):
+        """Remove expired entries and return how many were dropped."""
+        cutoff = time.time() - self.ttl
+        with self._connect() as conn:
+            self._flush(conn)
+            removed = conn.execute('DELETE FROM entries WHERE created <= ?', (cutoff,)).rowcount
+            _bump(conn, 'expired', removed)
+        return removed
+
+    def stats(self):
+        """Return entry count, size and hit/miss/eviction counters, including this process's unflushed ones."""
+        conn = self._connect().conn
+        entries, size = conn.execute('SELECT entries, bytes FROM totals').fetchone()
+        counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+        with self._lock:
+            for name, amount in self._pending.items():
+                counters[name] += amount
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'entries': entries,
+            'bytes': size,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            **counters
+        }
+
+    def _flush(self, conn):
+        """Write pending access times and hit/miss counts inside the caller's transaction."""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+        conn.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                         [(at, key) for key, at in accessed.items()])
+        for name, amount in pending.items():
+            _bump(conn, name, amount)
+
+    def _evict(self, conn):
+        """Drop least recently accessed rows until both budgets are met.
+
+        The budgets are checked against the trigger-maintained totals; the
+        access-time index is only walked when one is exceeded.
+        """
+        if not self.max_entries and not self.max_bytes:
+            return
+        entries, total = conn.execute('SELECT entries, bytes FROM totals').fetchone()
+        excess_entries = entries - self.max_entries if self.max_entries else 0
+        excess_bytes = total - self.max_bytes if self.max_bytes else 0
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+        victims = []
+        freed = 0
+        for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed ASC'):
+            if len(victims) >= excess_entries and freed >= excess_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        conn.executemany('DELETE FROM entries WHERE key = ?', victims)
+        _bump(conn, 'evictions', len(victims))
+
+
+class _Transaction:
+    """Run a block inside BEGIN IMMEDIATE ... COMMIT on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def _bump(conn, name, amount=1):
+    if amount:
+        conn.execute('UPDATE counters SET value = value + ? WHERE name = ?', (amount, name))
+
+
+def start_sweeper(cache, interval, label='Cache'):
+    """Periodically drop expired entries from cache (anything with sweep()) on a daemon thread."""
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                removed = cache.sweep()
+                if removed:
+                    print(f"{label} sweep removed {removed} expired entries", flush=True)
+            except Exception as e:
+                print(f"{label} sweep failed: {e}", flush=True)
+
+    thread = threading.Thread(target=run, name=f'{label.lower()}-sweeper', daemon=True)
+    thread.start()
+    return thread
+
+
+def create_cache(config):
+    """Build the metadata cache backend selected in config."""
+    if config.cache_backend == 'sqlite':
+        return SQLiteCache(
+            config.cache_path,
+            ttl=config.cache_ttl,
+            max_entries=config.cache_max_entries,
+            max_bytes=config.cache_max_bytes
+        )
+    if config.cache_backend == 'memory':
+        return MemoryCache(
+            ttl=config.cache_ttl,
+            max_entries=config.cache_max_entries,
+            max_bytes=config.cache_max_bytes
+        )
+    raise ValueError(f"Unknown cache backend: {config.cache_backend}")
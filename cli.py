@@ -0,0 +1,195 @@
+"""Generate metadata for a directory tree without the web UI.
+
+Runs every image through the same cache, preprocessing, OpenAI call and
+validation as the server, appending rows to a CSV in the profile's
+csv_columns. Progress is checkpointed, so re-running the same command
+after an interruption skips images that already finished.
+
+    python cli.py IMAGES_DIR --profile zedge --output metadata.csv [--concurrency 16]
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from exporters import export_rows
+from jobs import BatchJob, JobManager
+
+
+def discover(root, extensions):
+    """Yield image paths under root relative to it, in a stable order."""
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                yield os.path.relpath(os.path.join(directory, name), root)
+
+
+def load_checkpoint(path, retry_failed):
+    """Return relative paths recorded as finished (and failed, unless retrying them)."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn final line from an interrupted run
+                continue
+            if entry.get('status') == 'complete' or not retry_failed:
+                done.add(entry['path'])
+    return done
+
+
+class RunWriter:
+    """Append results to the CSV and checkpoint as JobManager flushes progress.
+
+    Only the job's feeder thread calls emit, so writes need no locking.
+    Each CSV row is flushed before its checkpoint line, so a crash can at
+    worst repeat an image, never drop one.
+    """
+
+    def __init__(self, output, checkpoint, columns, base_path, total):
+        self.columns = columns
+        self.base_path = base_path
+        self.total = total
+        self.started = time.monotonic()
+        self.finished = threading.Event()
+        self.summary = None
+        new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+        self._csv_file = open(output, 'a', newline='', encoding='utf-8')
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=columns, lineterminator='\n')
+        if new_file:
+            self._csv.writeheader()
+        self._checkpoint = open(checkpoint, 'a', encoding='utf-8')
+
+    def emit(self, event, payload, sid):
+        rows = ({'full_path': r['image'], **r['metadata']} for r in payload['results'])
+        for row in export_rows(rows, self.columns, self.base_path, keep_tree=True):
+            self._csv.writerow(row)
+        self._csv_file.flush()
+        for result in payload['results']:
+            self._record(result['image'], 'complete')
+        for error in payload['errors']:
+            self._record(error['image'], 'error', error.get('message'))
+        self._checkpoint.flush()
+
+        done = payload['completed'] + payload['failed']
+        elapsed = time.monotonic() - self.started
+        print(f"[{done}/{self.total}] {payload['completed']} ok ({payload['cached']} cached), "
+              f"{payload['failed']} failed, {done / elapsed if elapsed else 0:.1f} img/s",
+              file=sys.stderr, flush=True)
+        for error in payload['errors']:
+            print(f"  failed {error['image']}: {error.get('message')}", file=sys.stderr, flush=True)
+        if event == 'batch_complete':
+            self.summary = payload
+            self.finished.set()
+
+    def close(self):
+        self._csv_file.close()
+        self._checkpoint.close()
+
+    def _record(self, path, status, message=None):
+        entry = {'path': path, 'status': status}
+        if message:
+            entry['message'] = message
+        self._checkpoint.write(json.dumps(entry) + '\n')
+
+
+def print_summary(writer, skipped, elapsed):
+    import app
+
+    summary = writer.summary or {'completed': 0, 'failed': 0, 'cached': 0}
+    processed = summary['completed'] + summary['failed']
+    generated = summary['completed'] - summary['cached']
+    stats = app.rate_scheduler.stats()
+    retries = sum(s['retries'] for s in stats.values())
+    throttled = sum(s['throttled'] for s in stats.values())
+    print(
+        f"\nProcessed {processed} images in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} img/s)\n"
+        f"  generated {generated}, cached {summary['cached']}, failed {summary['failed']}, "
+        f"skipped {skipped} from checkpoint\n"
+        f"  OpenAI retries {retries}, rate-limited {throttled}",
+        file=sys.stderr, flush=True
+    )
+
+
+def main():
+    # Imported here, not at module level: spawned image pool workers re-import this script
+    import app
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='root of the image tree')
+    parser.add_argument('--profile', default='zedge', choices=sorted(app.PROFILES))
+    parser.add_argument('--output', required=True, help='CSV file to append rows to')
+    parser.add_argument('--checkpoint', help='progress file (default: <output>.checkpoint)')
+    parser.add_argument('--concurrency', type=int, default=config.batch_max_in_flight,
+                        help='images in flight at once')
+    parser.add_argument('--base-path', default='', help='rewrite full_path onto this prefix')
+    parser.add_argument('--api-key', default=os.getenv('OPENAI_API_KEY'), help='default: $OPENAI_API_KEY')
+    parser.add_argument('--retry-failed', action='store_true', help='retry images that failed in earlier runs')
+    parser.add_argument('--verbose', action='store_true', help='show per-image pipeline logs')
+    args = parser.parse_args()
+
+    if not app.validate_api_key_format(args.api_key):
+        parser.error('a valid OpenAI API key is required (--api-key or OPENAI_API_KEY)')
+    root = os.path.realpath(args.directory)
+    if not os.path.isdir(root):
+        parser.error(f'not a directory: {args.directory}')
+    checkpoint = args.checkpoint or f'{args.output}.checkpoint'
+
+    done = load_checkpoint(checkpoint, args.retry_failed)
+    items = [
+        {'full_path': rel, 'file_path': os.path.join(root, rel)}
+        for rel in discover(root, set(config.allowed_extensions))
+        if rel not in done
+    ]
+    skipped = len(done)
+    print(f"{len(items)} images to process, {skipped} already done", file=sys.stderr, flush=True)
+
+    profile = app.PROFILES[args.profile]
+    writer = RunWriter(args.output, checkpoint, profile['csv_columns'], args.base_path, len(items))
+    started = time.monotonic()
+    executor = None
+    try:
+        if app.async_engine:
+            async def worker(job, item):
+                return await app.generate_metadata_async(item, job.profile_name, job.api_key, item['file_path'],
+                                                         item.get('queued_at'))
+            executor = app.async_engine
+        else:
+            def worker(job, item):
+                return app.generate_metadata(item, job.profile_name, job.api_key, item['file_path'],
+                                             item.get('queued_at'))
+            executor = ThreadPoolExecutor(max_workers=args.concurrency)
+
+        manager = JobManager(executor, max_in_flight=args.concurrency,
+                             flush_interval=config.batch_flush_interval, emit=writer.emit)
+        job = BatchJob(None, args.profile, args.api_key, items)
+        # Pipeline logging goes to stdout; keep the terminal for progress unless asked
+        log_target = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+        with log_target:
+            manager.submit(job, worker, app.classify_failure)
+            while not writer.finished.wait(1.0):
+                pass
+    except KeyboardInterrupt:
+        print("\nInterrupted; re-run the same command to resume.", file=sys.stderr, flush=True)
+        return 130
+    finally:
+        writer.close()
+        print_summary(writer, skipped, time.monotonic() - started)
+        if isinstance(executor, ThreadPoolExecutor):
+            executor.shutdown(wait=False, cancel_futures=True)
+    return 1 if writer.summary and writer.summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Pooled OpenAI clients for MetaData Refiner."""
+
+import asyncio
+import hashlib
+import importlib.util
+import threading
+import time
+
+
+class OpenAIClientPool:
+    """Keep one keep-alive OpenAI client per API key.
+
+    Reusing the client keeps TLS connections warm across images instead
+    of paying a handshake per request. Clients unused for idle_ttl
+    seconds are closed the next time the pool is touched. The OpenAI SDK
+    is only imported when the first client is created, as it takes about
+    half a second to load.
+
+    With loop set the pool hands out AsyncOpenAI clients instead, to be
+    used on that event loop, which also closes them.
+    """
+
+    def __init__(self, timeout, max_connections, max_keepalive, keepalive_expiry, idle_ttl, http2=True, max_retries=2,
+                 base_url=None, loop=None):
+        self.timeout = timeout
+        self.loop = loop
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.idle_ttl = idle_ttl
+        # HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keep-alive without it
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._counters = {'created': 0, 'reused': 0, 'expired': 0}
+
+    def get(self, api_key):
+        """Return the shared client for api_key, creating it on first use."""
+        key_id = _key_id(api_key)
+        now = time.time()
+        with self._lock:
+            self._expire_idle(now)
+            entry = self._clients.get(key_id)
+            if entry is None:
+                import httpx
+                import openai
+
+                # Do not pass deprecated 'proxies' arg; env vars will be respected by httpx automatically
+                http_class, client_class = (httpx.Client, openai.OpenAI) if self.loop is None else (
+                    httpx.AsyncClient, openai.AsyncOpenAI)
+                http_client = http_class(
+                    timeout=httpx.Timeout(self.timeout),
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive,
+                        keepalive_expiry=self.keepalive_expiry
+                    ),
+                    http2=self.http2,
+                    follow_redirects=True
+                )
+                entry = {
+                    'client': client_class(
+                        api_key=api_key,
+                        http_client=http_client,
+                        max_retries=self.max_retries,
+                        base_url=self.base_url
+                    ),
+                    'http_client': http_client,
+                    'created': now,
+                    'last_used': now,
+                    'requests': 0
+                }
+                self._clients[key_id] = entry
+                self._counters['created'] += 1
+            else:
+                self._counters['reused'] += 1
+            entry['last_used'] = now
+            entry['requests'] += 1
+            return entry['client']
+
+    def close_all(self):
+        """Close every pooled client."""
+        with self._lock:
+            for entry in self._clients.values():
+                self._close(entry)
+            self._clients.clear()
+
+    def stats(self):
+        """Return pool limits, counters and per-client usage."""
+        now = time.time()
+        with self._lock:
+            self._expire_idle(now)
+            clients = [
+                {
+                    'key_id': key_id,
+                    'requests': entry['requests'],
+                    'idle_seconds': round(now - entry['last_used'], 1),
+                    'age_seconds': round(now - entry['created'], 1),
+                    'open_connections': _connection_count(entry['http_client'])
+                }
+                for key_id, entry in self._clients.items()
+            ]
+            return {
+                'clients': len(self._clients),
+                'http2': self.http2,
+                'max_connections': self.max_connections,
+                'max_keepalive_connections': self.max_keepalive,
+                'keepalive_expiry': self.keepalive_expiry,
+                'idle_ttl': self.idle_ttl,
+                **self._counters,
+                'per_client': clients
+            }
+
+    def _expire_idle(self, now):
+        expired = [k for k, e in self._clients.items() if now - e['last_used'] > self.idle_ttl]
+        for key_id in expired:
+            self._close(self._clients.pop(key_id))
+        self._counters['expired'] += len(expired)
+
+    def _close(self, entry):
+        try:
+            if self.loop is None:
+                entry['http_client'].close()
+            else:
+                asyncio.run_coroutine_threadsafe(entry['http_client'].aclose(), self.loop)
+        except Exception:
+            pass
+
+
+def _key_id(api_key):
+    """Stable, non-reversible identifier for an API key."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+
+def _connection_count(http_client):
+    """Best-effort count of open pooled connections (httpx does not expose this publicly)."""
+    pool = getattr(getattr(http_client, '_transport', None), '_pool', None)
+    connections = getattr(pool, 'connections', None)
+    return len(connections) if connections is not None else None
@@ -15,34 +15,136 @@ class AppConfig:
     port: int = field(default_factory=lambda: int(os.getenv('PORT', '5001')))
     debug: bool = field(default_factory=lambda: os.getenv('FLASK_DEBUG', '1') == '1')
 
+    # Multi-process deployment (gunicorn.conf.py): worker processes sharing one port
+    server_workers: int = field(default_factory=lambda: int(os.getenv('WEB_CONCURRENCY', '1')))
+    # Relays Socket.IO emits between workers: redis://host:6379/0 or sqlite:///path (unset = single process)
+    socketio_message_queue: Optional[str] = field(default_factory=lambda: os.getenv('SOCKETIO_MESSAGE_QUEUE') or None)
+    # Clients skip long-polling, whose requests must all reach the same worker
+    socketio_websocket_only: bool = field(default_factory=lambda: os.getenv('SOCKETIO_WEBSOCKET_ONLY', '0') == '1')
+
     # Security
     secret_key: str = field(default_factory=lambda: os.getenv('SECRET_KEY') or secrets.token_hex(32))
 
     # File upload settings
     max_file_size: int = 10 * 1024 * 1024  # 10MB
+    upload_chunk_size: int = 1024 * 1024  # bytes read per chunk while streaming uploads to disk
     allowed_extensions: tuple = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+    # Upload folder quota (0 = unbounded); exported images are evicted least recently used first
+    upload_max_bytes: int = field(default_factory=lambda: int(os.getenv('UPLOAD_MAX_BYTES', '0')))
+    upload_max_files: int = field(default_factory=lambda: int(os.getenv('UPLOAD_MAX_FILES', '0')))
+    upload_evict_min_idle: int = 600  # seconds an image must go unused before it can be evicted
 
-    # Rate limiting
+    # Rate limiting; the store is shared by every worker when set to redis:// or sqlite:///path
+    rate_limit_storage_uri: str = field(default_factory=lambda: os.getenv('RATELIMIT_STORAGE_URI', 'memory://'))
     default_rate_limits: List[str] = field(default_factory=lambda: ["200 per day", "50 per hour"])
     upload_rate_limit: str = "30 per minute"
     export_rate_limit: str = "20 per minute"
     socket_rate_limit: int = 60  # requests per minute per client
     socket_rate_window: int = 60  # seconds
 
+    # Batch jobs
+    batch_max_images: int = 10000  # images accepted per generate_batch request
+    batch_max_in_flight: int = 8  # items per batch job queued or running on the processing executor
+    batch_flush_interval: float = 1.0  # seconds between aggregated progress events
+
+    # Bulk (Batch API) runs
+    bulk_poll_interval: int = 60  # seconds between batch status checks
+    bulk_max_file_bytes: int = 190 * 1024 * 1024  # Batch API input files are capped at 200MB
+    bulk_max_requests_per_file: int = 50000
+
     # API settings
     openai_api_key: Optional[str] = field(default_factory=lambda: os.getenv('OPENAI_API_KEY'))
     openai_model: str = "gpt-5-nano-2025-08-07"
+    # Point at a local stand-in for testing; None uses the SDK default (or OPENAI_BASE_URL)
+    openai_base_url: Optional[str] = field(default_factory=lambda: os.getenv('OPENAI_BASE_URL') or None)
     openai_timeout: float = 60.0
+    openai_max_connections: int = 20  # per API key; keep >= processing_workers
+    openai_max_keepalive: int = 10
+    openai_keepalive_expiry: float = 30.0  # seconds an idle connection stays open
+    openai_client_idle_ttl: int = 600  # seconds before an unused per-key client is closed
+    openai_requests_per_minute: int = field(default_factory=lambda: int(os.getenv('OPENAI_RPM', '0')))  # 0 = learn from headers
+    openai_tokens_per_minute: int = field(default_factory=lambda: int(os.getenv('OPENAI_TPM', '0')))  # 0 = learn from headers
+    openai_initial_concurrency: int = 8  # starting per-key in-flight limit, adapted on success/429
+    openai_max_concurrency: int = 256
+    openai_max_retries: int = 4  # retries for retryable error categories
+    openai_backoff_base: float = 1.0  # seconds, doubled per attempt with full jitter
+    openai_backoff_max: float = 30.0
+    openai_http2: bool = field(default_factory=lambda: os.getenv('OPENAI_HTTP2', '1') == '1')
+
+    # Grouped requests: profiles with group_size > 1 share one call between that many images
+    max_group_size: int = 10
+    group_linger_ms: int = field(default_factory=lambda: int(os.getenv('GROUP_LINGER_MS', '50')))  # wait for a group to fill
+
+    # Attach per-stage timings (ms) to metadata_update payloads
+    debug_timings: bool = field(default_factory=lambda: os.getenv('DEBUG_TIMINGS', '0') == '1')
+
+    # Processing
+    processing_engine: str = field(default_factory=lambda: os.getenv('PROCESSING_ENGINE', 'threads'))  # threads or async
+    processing_workers: int = field(default_factory=lambda: int(os.getenv('PROCESSING_WORKERS', '4')))
+    async_concurrency: int = field(default_factory=lambda: int(os.getenv('ASYNC_CONCURRENCY', '200')))  # OpenAI calls in flight
+    image_workers: int = field(default_factory=lambda: int(os.getenv('IMAGE_WORKERS', str(os.cpu_count() or 2))))  # 0 = encode in-process
+    encode_workers: int = field(default_factory=lambda: int(os.getenv('ENCODE_WORKERS', str(os.cpu_count() or 4))))
+    # Items one client may run while others wait; 0 = half the processing capacity
+    client_max_in_flight: int = field(default_factory=lambda: int(os.getenv('CLIENT_MAX_IN_FLIGHT', '0')))
+    # Queued items before single-image requests are rejected and batch items held back (0 = unbounded)
+    queue_max_waiting: int = field(default_factory=lambda: int(os.getenv('QUEUE_MAX_WAITING', '1000')))
+    # Seconds after a disconnect before the client's unfinished work is cancelled (0 = never)
+    disconnect_grace_period: int = field(default_factory=lambda: int(os.getenv('DISCONNECT_GRACE_PERIOD', '120')))
 
     # Caching
     cache_ttl: int = 3600  # 1 hour
+    cache_backend: str = field(default_factory=lambda: os.getenv('CACHE_BACKEND', 'sqlite'))  # sqlite or memory
+    cache_max_entries: int = field(default_factory=lambda: int(os.getenv('CACHE_MAX_ENTRIES', '100000')))
+    cache_max_bytes: int = field(default_factory=lambda: int(os.getenv('CACHE_MAX_BYTES', str(256 * 1024 * 1024))))
+    cache_sweep_interval: int = 300  # seconds between expired-entry sweeps
     max_image_dimension: int = 1024
     jpeg_quality: int = 85
+    image_preset: str = field(default_factory=lambda: os.getenv('IMAGE_PRESET', 'quality'))  # quality or fast
+    payload_cache_max_bytes: int = field(default_factory=lambda: int(os.getenv('PAYLOAD_CACHE_MAX_BYTES', str(512 * 1024 * 1024))))  # 0 disables
+
+    # Near-duplicate reuse: max Hamming distance between 64-bit dHashes (0 disables)
+    near_duplicate_threshold: int = field(default_factory=lambda: int(os.getenv('NEAR_DUPLICATE_THRESHOLD', '4')))
+
+    # Durable batch queue: leases per item before it is failed; seconds finished jobs are kept
+    job_max_attempts: int = field(default_factory=lambda: int(os.getenv('JOB_MAX_ATTEMPTS', '3')))
+    job_retention: int = 86400
+
+    # Server-side results: days to keep per-job results (0 keeps them forever)
+    results_retention_days: int = field(default_factory=lambda: int(os.getenv('RESULTS_RETENTION_DAYS', '30')))
 
     # Paths
     upload_folder: str = field(default_factory=lambda: os.path.join(
         os.path.dirname(os.path.abspath(__file__)), 'static/images/'
     ))
+    data_folder: str = field(default_factory=lambda: os.getenv('DATA_FOLDER') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data'
+    ))
+
+    def __post_init__(self):
+        # An unknown preset falls back to 'quality' rather than failing every generation; validate() reports it
+        self.unknown_image_preset = None
+        if self.image_preset not in ('quality', 'fast'):
+            self.unknown_image_preset, self.image_preset = self.image_preset, 'quality'
+
+    @property
+    def cache_path(self) -> str:
+        """Path of the on-disk metadata cache database."""
+        return os.path.join(self.data_folder, 'metadata_cache.db')
+
+    @property
+    def job_queue_path(self) -> str:
+        """Path of the durable batch job queue database."""
+        return os.path.join(self.data_folder, 'jobs.db')
+
+    @property
+    def results_path(self) -> str:
+        """Path of the per-job results database."""
+        return os.path.join(self.data_folder, 'results.db')
+
+    @property
+    def uploads_path(self) -> str:
+        """Path of the upload folder's usage catalog."""
+        return os.path.join(self.data_folder, 'uploads.db')
 
     @property
     def is_production(self) -> bool:
@@ -67,9 +169,23 @@ class AppConfig:
             if self.is_production:
                 warnings.append("WARNING: Using generated SECRET_KEY. Set SECRET_KEY environment variable for deployed servers.")
 
+        if self.server_workers > 1:
+            if not os.getenv('SECRET_KEY'):
+                warnings.append("WARNING: Several workers need a shared SECRET_KEY; each worker generated its own.")
+            if not self.socketio_message_queue:
+                warnings.append("WARNING: SOCKETIO_MESSAGE_QUEUE is not set; events from other workers will not arrive.")
+            if self.rate_limit_storage_uri.startswith('memory://'):
+                warnings.append("WARNING: RATELIMIT_STORAGE_URI is in-memory; each worker enforces its own limits.")
+            if self.cache_backend == 'memory':
+                warnings.append("WARNING: CACHE_BACKEND=memory is per worker; use sqlite to share cached metadata.")
+
         if not self.openai_api_key:
             warnings.append("NOTE: OPENAI_API_KEY not set. Users must provide API key via Settings.")
 
+        if self.unknown_image_preset:
+            warnings.append(f"WARNING: Unknown IMAGE_PRESET '{self.unknown_image_preset}'; using 'quality'. "
+                            "Use 'quality' or 'fast'.")
+
         if self.max_file_size > 50 * 1024 * 1024:
             warnings.append("WARNING: Max file size is very large (>50MB). Consider reducing for better performance.")
 
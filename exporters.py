@@ -0,0 +1,151 @@
+"""Streaming metadata export for MetaData Refiner."""
+
+import csv
+import io
+import json
+import os
+import zlib
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+# Rows buffered before a chunk is handed to the response
+CHUNK_ROWS = 500
+
+
+def export_rows(items, columns, base_path='', keep_tree=False):
+    """Yield one dict per item restricted to columns, rewriting full_path onto base_path.
+
+    Uploads keep only their file name; with keep_tree full_path is taken
+    to be relative to a scanned root and its directories are kept.
+    """
+    for item in items:
+        row = {}
+        for col in columns:
+            value = item.get(col, '')
+            if col == 'full_path' and base_path:
+                # Convert /static/images/file.jpg to base_path/file.jpg, or sub/file.jpg to base_path/sub/file.jpg
+                value = os.path.join(base_path, value if keep_tree else os.path.basename(value))
+            row[col] = '' if value is None else value
+        yield row
+
+
+def stream_csv(rows, columns):
+    """Yield CSV bytes in chunks of CHUNK_ROWS rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator='\n')
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % CHUNK_ROWS == 0:
+            yield _take(buffer).encode('utf-8')
+    yield _take(buffer).encode('utf-8')
+
+
+def stream_jsonl(rows, columns):
+    """Yield one JSON object per line, in chunks of CHUNK_ROWS rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def stream_parquet(rows, columns, row_group_size=10000):
+    """Yield a Parquet file one row group at a time; every column is stored as a string."""
+    schema = pyarrow.schema([(col, pyarrow.string()) for col in columns])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema)
+    batch = {col: [] for col in columns}
+    size = 0
+    for row in rows:
+        for col in columns:
+            batch[col].append(str(row[col]))
+        size += 1
+        if size >= row_group_size:
+            writer.write_table(pyarrow.table(batch, schema=schema))
+            batch = {col: [] for col in columns}
+            size = 0
+            yield sink.take()
+    if size:
+        writer.write_table(pyarrow.table(batch, schema=schema))
+    writer.close()
+    yield sink.take()
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip-compress a stream of byte chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(items, columns, base_path='', fmt='csv', compress=False):
+    """Return an iterator of export bytes for items in the requested format.
+
+    Raises ValueError for an unknown format, or when Parquet is requested
+    without pyarrow installed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported export format: {fmt}')
+    if fmt == 'parquet' and pyarrow is None:
+        raise ValueError('Parquet export requires pyarrow')
+    writer = {'csv': stream_csv, 'jsonl': stream_jsonl, 'parquet': stream_parquet}[fmt]
+    chunks = writer(export_rows(items, columns, base_path), columns)
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(profile_name, fmt='csv', compress=False):
+    name = f'metadata_{profile_name}.{FORMATS[fmt][1]}'
+    return name + '.gz' if compress else name
+
+
+def _take(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last take()."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
@@ -0,0 +1,291 @@
+"""Fair scheduling of processing work for MetaData Refiner."""
+
+import contextvars
+import inspect
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# In priority order: single-image requests run ahead of batch items
+LANES = ('interactive', 'bulk')
+
+# Cancel event of the item running in the current thread or task
+_current_cancel = contextvars.ContextVar('current_cancel', default=None)
+
+
+class Cancelled(Exception):
+    """Raised by check_cancelled() inside work that was cancelled while running."""
+
+
+def check_cancelled():
+    """Raise Cancelled if the queue item running here has been cancelled.
+
+    Threaded work calls this between stages and before each API attempt;
+    coroutines are cancelled outright, which also aborts their HTTP calls.
+    """
+    event = _current_cancel.get()
+    if event is not None and event.is_set():
+        raise Cancelled('Cancelled by the client')
+
+
+class FairQueue:
+    """Share a processing executor fairly between clients.
+
+    Work waits here rather than in the executor's FIFO queue, and at most
+    capacity items are handed to the executor at once. Each free slot
+    goes to the interactive lane before the bulk lane, and within a lane
+    to the waiting clients in round-robin order. A client already running
+    client_limit items is passed over while any other client has work
+    waiting, so one large batch cannot hold every slot.
+
+    Items may name a waiter (e.g. the socket to update) and a tag;
+    cancel() drops a waiter's queued items and aborts its running ones.
+    Every update_interval seconds on_wait(waiter, info) reports the
+    waiters whose queue position changed. Once max_waiting items are
+    queued, full() is true so callers can reject or defer new work.
+    """
+
+    def __init__(self, executor, capacity, client_limit, max_waiting=0, on_wait=None, update_interval=1.0):
+        self.executor = executor
+        self.capacity = capacity
+        self.client_limit = client_limit
+        self.max_waiting = max_waiting
+        self.on_wait = on_wait
+        self.update_interval = update_interval
+        # Per lane: client -> deque of waiting items; dict order is the rotation
+        self._lanes = {lane: OrderedDict() for lane in LANES}
+        self._waiting = 0
+        self._running = {}
+        self._active = set()
+        self._reported = {}
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._counters = {'submitted': 0, 'started': 0, 'over_limit': 0, 'cancelled': 0}
+        if on_wait:
+            threading.Thread(target=self._report_loop, name='fair-queue', daemon=True).start()
+
+    def submit(self, client, lane, fn, *args, waiter=None, tag=None):
+        """Queue fn(*args) for client in lane; returns a Future of its result.
+
+        The Future is cancelled if the item is cancelled before it finishes.
+        """
+        item = _Item(fn, args, waiter, tag)
+        with self._lock:
+            self._lanes[lane].setdefault(client, deque()).append(item)
+            self._waiting += 1
+            self._counters['submitted'] += 1
+        self._dispatch()
+        return item.future
+
+    def client(self, client, lane, waiter=None):
+        """Executor-style view that submits on behalf of one client, e.g. for JobManager."""
+        return _ClientExecutor(self, client, lane, waiter)
+
+    def full(self):
+        return bool(self.max_waiting) and self._waiting >= self.max_waiting
+
+    def wait_for_room(self, timeout):
+        """Block until fewer than max_waiting items are queued; False on timeout."""
+        with self._room:
+            return self._room.wait_for(lambda: not self.full(), timeout)
+
+    def cancel(self, waiter, tags=None):
+        """Cancel waiter's items (only those tagged with one of tags, if given).
+
+        Queued items are dropped; running ones are signalled through
+        check_cancelled() and their executor future is cancelled, which
+        stops coroutines at once. Returns {'queued': n, 'running': n}.
+        """
+        matches = lambda item: item.waiter == waiter and (tags is None or item.tag in tags)
+        dropped = []
+        with self._lock:
+            for clients in self._lanes.values():
+                for client, entries in list(clients.items()):
+                    kept = deque(item for item in entries if not matches(item))
+                    if len(kept) == len(entries):
+                        continue
+                    dropped.extend(item for item in entries if matches(item))
+                    if kept:
+                        clients[client] = kept
+                    else:
+                        del clients[client]
+            self._waiting -= len(dropped)
+            running = [item for item in self._active if matches(item) and not item.cancel_event.is_set()]
+            self._counters['cancelled'] += len(dropped) + len(running)
+            self._room.notify_all()
+        for item in dropped:
+            item.future.cancel()
+        for item in running:
+            item.cancel_event.set()
+            if item.inner is not None:
+                item.inner.cancel()
+        return {'queued': len(dropped), 'running': len(running)}
+
+    def positions(self):
+        """Map each waiter with queued items to {'lane', 'ahead', 'queued'}.
+
+        ahead counts the items expected to start before the waiter's first
+        one under round-robin, ignoring per-client limits.
+        """
+        result = {}
+        with self._lock:
+            ahead_of_lane = 0
+            for lane in LANES:
+                queues = list(self._lanes[lane].values())
+                sizes = [len(entries) for entries in queues]
+                for rank, entries in enumerate(queues):
+                    for index, item in enumerate(entries):
+                        if item.waiter is None:
+                            continue
+                        if item.waiter in result:
+                            result[item.waiter]['queued'] += 1
+                            continue
+                        # Each other client starts up to index items first, one more if earlier in the rotation
+                        served = sum(min(size, index + (other < rank))
+                                     for other, size in enumerate(sizes) if other != rank)
+                        result[item.waiter] = {'lane': lane, 'ahead': ahead_of_lane + served + index, 'queued': 1}
+                ahead_of_lane += sum(sizes)
+        return result
+
+    def stats(self):
+        with self._lock:
+            waiting = {lane: sum(len(entries) for entries in clients.values())
+                       for lane, clients in self._lanes.items()}
+            return {
+                'capacity': self.capacity,
+                'client_limit': self.client_limit,
+                'max_waiting': self.max_waiting,
+                'running': len(self._active),
+                'waiting': waiting,
+                'clients': len(set(self._running).union(*self._lanes.values())),
+                **self._counters
+            }
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                picked = self._next()
+            if picked is None:
+                return
+            client, item = picked
+            try:
+                item.inner = self.executor.submit(*item.call())
+            except Exception as e:
+                self._release(client, item)
+                item.future.set_exception(e)
+                continue
+            item.inner.add_done_callback(lambda f, client=client, item=item: self._finished(client, item))
+
+    def _next(self):
+        """Take the next item to run, or None; caller holds the lock."""
+        if len(self._active) >= self.capacity:
+            return None
+        # Limits apply only while someone under their limit is waiting
+        for enforce_limit in (True, False):
+            for lane in LANES:
+                clients = self._lanes[lane]
+                for client, entries in clients.items():
+                    running = self._running.get(client, 0)
+                    if enforce_limit and running >= self.client_limit:
+                        continue
+                    item = entries.popleft()
+                    # Move the client to the back of the rotation (or drop it when drained)
+                    del clients[client]
+                    if entries:
+                        clients[client] = entries
+                    self._waiting -= 1
+                    self._running[client] = running + 1
+                    self._active.add(item)
+                    self._counters['started'] += 1
+                    if not enforce_limit:
+                        self._counters['over_limit'] += 1
+                    self._room.notify_all()
+                    return client, item
+        return None
+
+    def _release(self, client, item):
+        with self._lock:
+            self._active.discard(item)
+            self._running[client] -= 1
+            if not self._running[client]:
+                del self._running[client]
+
+    def _finished(self, client, item):
+        self._release(client, item)
+        self._dispatch()
+        try:
+            item.future.set_result(item.inner.result())
+        except BaseException as e:
+            if item.cancel_event.is_set():
+                item.future.cancel()
+            else:
+                item.future.set_exception(e)
+
+    def _report_loop(self):
+        while True:
+            time.sleep(self.update_interval)
+            current = self.positions()
+            for waiter, info in current.items():
+                if self._reported.get(waiter) != info:
+                    self._notify(waiter, info)
+            # Tell waiters whose items have all started
+            for waiter in self._reported.keys() - current.keys():
+                self._notify(waiter, {**self._reported[waiter], 'ahead': 0, 'queued': 0})
+            self._reported = current
+
+    def _notify(self, waiter, info):
+        try:
+            self.on_wait(waiter, info)
+        except Exception as e:
+            print(f"Error reporting queue position: {e}", flush=True)
+
+
+class _Item:
+    __slots__ = ('fn', 'args', 'waiter', 'tag', 'future', 'inner', 'cancel_event')
+
+    def __init__(self, fn, args, waiter, tag):
+        self.fn = fn
+        self.args = args
+        self.waiter = waiter
+        self.tag = tag
+        self.future = Future()
+        self.inner = None
+        self.cancel_event = threading.Event()
+
+    def call(self):
+        """Executor submit() arguments that run fn with this item's cancel event in context."""
+        if inspect.iscoroutinefunction(self.fn):
+            return (_run_async, self.cancel_event, self.fn, self.args)
+        return (_run, self.cancel_event, self.fn, self.args)
+
+
+def _run(cancel_event, fn, args):
+    token = _current_cancel.set(cancel_event)
+    try:
+        return fn(*args)
+    finally:
+        _current_cancel.reset(token)
+
+
+async def _run_async(cancel_event, fn, args):
+    # Each task runs in its own copy of the context
+    _current_cancel.set(cancel_event)
+    return await fn(*args)
+
+
+class _ClientExecutor:
+    def __init__(self, queue, client, lane, waiter):
+        self.queue = queue
+        self.client = client
+        self.lane = lane
+        self.waiter = waiter
+
+    def submit(self, fn, *args):
+        return self.queue.submit(self.client, self.lane, fn, *args, waiter=self.waiter)
+
+    def wait_for_room(self, timeout):
+        return self.queue.wait_for_room(timeout)
+
+    def cancel(self):
+        return self.queue.cancel(self.waiter)
@@ -0,0 +1,83 @@
+"""Multi-image request grouping for MetaData Refiner."""
+
+import threading
+from concurrent.futures import Future
+
+
+class RequestGrouper:
+    """Pack concurrent single-image requests into shared chat completions.
+
+    Requests are collected per key (API key plus profile version, so only
+    compatible images share a call). A group is sent once it holds its
+    profile's group size, or linger seconds after its first image arrived,
+    whichever comes first. dispatch(context, payloads) sends one group and
+    returns a Future of one outcome per payload: the result, or the
+    exception for that payload.
+    """
+
+    def __init__(self, dispatch, linger=0.05):
+        self.dispatch = dispatch
+        self.linger = linger
+        self._groups = {}
+        self._lock = threading.Lock()
+        self._counters = {'groups': 0, 'images': 0, 'partial': 0}
+
+    def add(self, key, size, context, payload):
+        """Queue payload in key's open group and return a Future for its own outcome."""
+        future = Future()
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {'context': context, 'entries': []}
+                timer = threading.Timer(self.linger, self._expire, args=(key, group))
+                timer.daemon = True
+                timer.start()
+                group['timer'] = timer
+            group['entries'].append((payload, future))
+            full = len(group['entries']) >= size
+            if full:
+                del self._groups[key]
+        if full:
+            group['timer'].cancel()
+            self._send(group)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {'linger': self.linger, 'open_groups': len(self._groups), **self._counters}
+
+    def _expire(self, key, group):
+        with self._lock:
+            if self._groups.get(key) is not group:
+                # Already sent when it filled up
+                return
+            del self._groups[key]
+            self._counters['partial'] += 1
+        self._send(group)
+
+    def _send(self, group):
+        entries = group['entries']
+        with self._lock:
+            self._counters['groups'] += 1
+            self._counters['images'] += len(entries)
+        try:
+            outcome = self.dispatch(group['context'], [payload for payload, _ in entries])
+        except Exception as e:
+            for _, future in entries:
+                future.set_exception(e)
+            return
+        outcome.add_done_callback(lambda f: _settle(entries, f))
+
+
+def _settle(entries, outcome):
+    try:
+        results = outcome.result()
+    except Exception as e:
+        results = [e] * len(entries)
+    if len(results) != len(entries):
+        results = [ValueError('Grouped response did not cover every image')] * len(entries)
+    for (_, future), result in zip(entries, results):
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
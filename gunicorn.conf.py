@@ -0,0 +1,50 @@
+"""Gunicorn settings for running MetaData Refiner as several worker processes.
+
+    WEB_CONCURRENCY=4 gunicorn -c gunicorn.conf.py app:app
+
+Workers are threaded (gthread) rather than eventlet: the pipeline runs on
+thread and process pools and an asyncio engine, which monkey-patching
+would break. Each open WebSocket holds one thread, hence the generous
+thread count. With more than one worker, the Socket.IO message queue and
+rate-limit store default to SQLite files in the data folder (set
+SOCKETIO_MESSAGE_QUEUE / RATELIMIT_STORAGE_URI to redis:// URLs to use
+Redis instead), and browsers connect over WebSocket only, since
+long-polling would need sticky sessions.
+"""
+
+import fcntl
+import os
+import time
+
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'gthread'
+threads = int(os.getenv('SERVER_THREADS', '100'))
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5001')}"
+timeout = 120
+
+# Read before config is imported, since each worker builds its own AppConfig from the environment
+data_folder = os.getenv('DATA_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def on_starting(server):
+    os.environ['MDR_SERVER_STARTED'] = str(time.time())
+    if workers > 1:
+        os.environ.setdefault('SOCKETIO_MESSAGE_QUEUE', f'sqlite:///{os.path.join(data_folder, "socketio.db")}')
+        os.environ.setdefault('RATELIMIT_STORAGE_URI', f'sqlite:///{os.path.join(data_folder, "ratelimits.db")}')
+        os.environ.setdefault('SOCKETIO_WEBSOCKET_ONLY', '1')
+
+
+def post_worker_init(worker):
+    # One worker recovers jobs left unfinished before this server started; the
+    # lock is held for the worker's lifetime so restarted siblings skip it too
+    os.makedirs(data_folder, exist_ok=True)
+    lock = open(os.path.join(data_folder, 'recovery.lock'), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return
+    worker.recovery_lock = lock
+
+    import app
+    app.recover_batch_jobs(before=float(os.environ['MDR_SERVER_STARTED']))
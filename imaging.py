@@ -0,0 +1,246 @@
+"""Image preprocessing and payload caching for MetaData Refiner."""
+
+import base64
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+
+# Preprocessing presets. Both shrink before flattening alpha or converting
+# modes, so large inputs are never converted at full resolution.
+#   draft_gap: JPEG scale-on-decode headroom passed to thumbnail's reducing_gap
+#     (Image.draft decodes at 1/2, 1/4 or 1/8 scale; lower = more reduction
+#     before resampling)
+#   passthrough_max_bytes: send small RGB JPEGs that already fit unchanged
+# resample names an Image.Resampling filter; Pillow is imported on first use
+PRESETS = {
+    'quality': {
+        'resample': 'LANCZOS',
+        'draft_gap': 2.0,
+        'optimize': True,
+        'progressive': True,
+        'passthrough_max_bytes': 0
+    },
+    'fast': {
+        'resample': 'BICUBIC',
+        'draft_gap': 1.0,
+        'optimize': False,
+        'progressive': False,
+        'passthrough_max_bytes': 1024 * 1024
+    }
+}
+
+
+def encode_jpeg(image_path, max_dimension, quality, preset='quality'):
+    """Flatten, resize and JPEG-encode an image for the API, returning the JPEG bytes."""
+    from PIL import Image
+
+    options = PRESETS[preset]
+    with Image.open(image_path) as img:
+        if _can_pass_through(img, image_path, max_dimension, options['passthrough_max_bytes']):
+            with open(image_path, 'rb') as f:
+                return f.read()
+
+        # Palette images resample poorly; expand them before resizing
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+
+        # Resize intelligently - maintain aspect ratio. For JPEGs, thumbnail
+        # uses Image.draft to decode at a reduced scale before resampling.
+        if max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling[options['resample']],
+                          reducing_gap=options['draft_gap'])
+
+        # Convert to RGB if necessary (for PNG with transparency, etc.)
+        if img.mode in ('RGBA', 'LA'):
+            # Create white background
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # Optimize for API transmission
+        buffered = BytesIO()
+        img.save(buffered, format='JPEG', quality=quality,
+                 optimize=options['optimize'], progressive=options['progressive'])
+        return buffered.getvalue()
+
+
+def _can_pass_through(img, image_path, max_dimension, max_bytes):
+    """True for baseline-compatible RGB JPEGs that already fit the size limits."""
+    if not max_bytes or img.format != 'JPEG' or img.mode != 'RGB':
+        return False
+    if max(img.size) > max_dimension:
+        return False
+    try:
+        return os.path.getsize(image_path) <= max_bytes
+    except OSError:
+        return False
+
+
+def payload_key(image_hash, max_dimension, quality, preset='quality'):
+    """Cache key for an encoded payload: content hash plus preprocessing parameters."""
+    return f"{image_hash}-{max_dimension}-q{quality}-{preset}"
+
+
+class PayloadCache:
+    """On-disk store of encoded JPEG payloads with a byte budget.
+
+    Files are written atomically, so several processes can share the
+    directory. Hits refresh the file's mtime, and when the budget is
+    exceeded the least recently used files are removed until usage
+    drops to 90% of the budget. The running byte total only covers this
+    process's writes, so eviction and sweep() rescan the directory to
+    pick up what other processes stored.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._scan())
+
+    def get(self, key):
+        """Return cached JPEG bytes for key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+        with self._lock:
+            self._counters['hits'] += 1
+        return data
+
+    def put(self, key, data):
+        """Store JPEG bytes under key, evicting old payloads over budget."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._bytes += len(data) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        """Return size, budget and hit/miss/eviction counters.
+
+        bytes is the running total as of the last rescan plus this process's writes since.
+        """
+        with self._lock:
+            return {'directory': self.directory, 'bytes': self._bytes, 'max_bytes': self.max_bytes, **self._counters}
+
+    def sweep(self):
+        """Resync the byte total with the directory, evicting if over budget; returns files evicted."""
+        with self._lock:
+            before = self._counters['evictions']
+            self._bytes = sum(size for _, size, _ in self._scan())
+            if self._bytes > self.max_bytes:
+                self._evict()
+            return self._counters['evictions'] - before
+
+    def clear(self):
+        """Remove every stored payload."""
+        with self._lock:
+            for path, _, _ in list(self._scan()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            self._bytes = 0
+
+    def _path(self, key):
+        # Shard by the first two hash characters to keep directories small
+        return os.path.join(self.directory, key[:2], f'{key}.jpg')
+
+    def _scan(self):
+        """Yield (path, size, mtime) for every stored payload."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.jpg'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Rescan rather than trust the running total: other processes share the directory
+        entries = sorted(self._scan(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._counters['evictions'] += 1
+        self._bytes = total
+
+
+# Payload cache opened inside each image pool worker process
+_worker_cache = None
+
+
+def _init_worker(cache_dir, cache_max_bytes):
+    global _worker_cache
+    if cache_dir and cache_max_bytes:
+        _worker_cache = PayloadCache(cache_dir, cache_max_bytes)
+
+
+def build_payload(image_path, max_dimension, quality, preset='quality', cache_key=None, cache=None):
+    """Encode an image to base64 JPEG, storing the JPEG under cache_key when given.
+
+    Runs inline or inside the image process pool; only the file path goes
+    in and the compressed payload comes out, so no pixel data is pickled.
+    """
+    jpeg_bytes = encode_jpeg(image_path, max_dimension, quality, preset)
+    cache = cache or _worker_cache
+    if cache_key and cache:
+        try:
+            cache.put(cache_key, jpeg_bytes)
+        except OSError as e:
+            print(f"Payload cache write failed for {image_path}: {e}", flush=True)
+    return base64.b64encode(jpeg_bytes).decode('utf-8')
+
+
+def create_image_pool(workers, cache_dir=None, cache_max_bytes=0):
+    """Create a process pool for CPU-bound image work; workers start on first use.
+
+    Workers are spawned on every platform: forking would copy the server's
+    threads and open SQLite handles. Spawned workers import only this
+    module and the launching script, so entry scripts must keep their
+    setup under an ``if __name__ == '__main__'`` guard (see server.py).
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(cache_dir, cache_max_bytes)
+    )
@@ -0,0 +1,241 @@
+"""Durable batch job queue for MetaData Refiner."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class JobQueue:
+    """SQLite (WAL) record of every batch job and the state of each item.
+
+    Items move pending -> leased -> done | failed (or cancelled, with
+    their job), with an attempt count bumped on every lease. State changes are queued and written in
+    batches by a background thread, so the scheduler never waits on disk;
+    a crash can lose the last flush interval of updates, which only means
+    those items run again (and are usually answered from the cache).
+
+    Several server processes may share a queue file, but only one should
+    call recover() at startup, and only for jobs created before any of
+    them started: every lease it finds on those jobs is treated as
+    abandoned.
+    """
+
+    def __init__(self, path, retention=86400, flush_interval=0.5):
+        self.path = path
+        self.retention = retention
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held across taking and writing a batch, so batches commit in the order they were queued
+        self._flush_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' profile TEXT NOT NULL,'
+                ' results_id TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' finished REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                ' job_id TEXT NOT NULL,'
+                ' seq INTEGER NOT NULL,'
+                ' item TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' cached INTEGER NOT NULL DEFAULT 0,'
+                ' leased_at REAL,'
+                ' error TEXT,'
+                ' PRIMARY KEY (job_id, seq))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_items_status ON items (job_id, status)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, finished)')
+        threading.Thread(target=self._run, name='job-queue-writer', daemon=True).start()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, job):
+        """Persist a new job and its items; numbers each item with a 'seq' key."""
+        for seq, item in enumerate(job.items):
+            item['seq'] = seq
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO jobs (id, profile, results_id, status, created) VALUES (?, ?, ?, ?, ?)',
+                (job.id, job.profile_name, job.results_id, 'running', job.created)
+            )
+            conn.executemany(
+                "INSERT INTO items (job_id, seq, item, status) VALUES (?, ?, ?, 'pending')",
+                ((job.id, item['seq'], json.dumps(item)) for item in job.items)
+            )
+
+    def lease(self, job_id, seq):
+        self._queue("UPDATE items SET status = 'leased', attempts = attempts + 1, leased_at = ?"
+                    ' WHERE job_id = ? AND seq = ?', (time.time(), job_id, seq))
+
+    def done(self, job_id, seq, cached=False):
+        self._queue("UPDATE items SET status = 'done', cached = ?, error = NULL WHERE job_id = ? AND seq = ?",
+                    (int(bool(cached)), job_id, seq))
+
+    def fail(self, job_id, seq, message):
+        self._queue("UPDATE items SET status = 'failed', error = ? WHERE job_id = ? AND seq = ?",
+                    ((message or '')[:500], job_id, seq))
+
+    def finish(self, job_id):
+        self._queue("UPDATE jobs SET status = 'complete', finished = ? WHERE id = ?", (time.time(), job_id))
+
+    def cancel(self, job_id):
+        """End a job as cancelled; its unsettled items are never recovered."""
+        self._queue("UPDATE items SET status = 'cancelled' WHERE job_id = ? AND status IN ('pending', 'leased')",
+                    (job_id,))
+        self._queue("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ?", (time.time(), job_id))
+
+    def recover(self, max_attempts, before=None):
+        """Reclaim leases left by a previous process and return unfinished jobs.
+
+        Items that have already been leased max_attempts times are failed
+        rather than retried, so an image that crashes the server cannot
+        do so forever. before (a timestamp) limits recovery to jobs created
+        earlier, leaving jobs that sibling processes have just started
+        alone. Returns dicts with the job row, its remaining items and the
+        counts already settled.
+        """
+        self.flush()
+        before = time.time() if before is None else before
+        conn = self._connect()
+        stale_jobs = "job_id IN (SELECT id FROM jobs WHERE status = 'running' AND created < ?)"
+        with conn:
+            reclaimed = conn.execute(
+                f"UPDATE items SET status = 'pending' WHERE status = 'leased' AND {stale_jobs}", (before,)
+            ).rowcount
+            abandoned = conn.execute(
+                "UPDATE items SET status = 'failed', error = ?"
+                f" WHERE status = 'pending' AND attempts >= ? AND {stale_jobs}",
+                (f'Abandoned after {max_attempts} attempts', max_attempts, before)
+            ).rowcount
+        if reclaimed or abandoned:
+            print(f"Job queue recovery: {reclaimed} leases reclaimed, {abandoned} items abandoned", flush=True)
+
+        jobs = []
+        for job_id, profile, results_id, created in conn.execute(
+            "SELECT id, profile, results_id, created FROM jobs WHERE status = 'running' AND created < ? ORDER BY created",
+            (before,)
+        ).fetchall():
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status', (job_id,)
+            ).fetchall())
+            cached = conn.execute(
+                "SELECT COUNT(*) FROM items WHERE job_id = ? AND status = 'done' AND cached = 1", (job_id,)
+            ).fetchone()[0]
+            items = [
+                json.loads(row[0]) for row in conn.execute(
+                    "SELECT item FROM items WHERE job_id = ? AND status = 'pending' ORDER BY seq", (job_id,)
+                )
+            ]
+            jobs.append({
+                'id': job_id,
+                'profile': profile,
+                'results_id': results_id,
+                'created': created,
+                'items': items,
+                'completed': counts.get('done', 0),
+                'failed': counts.get('failed', 0),
+                'cached': cached
+            })
+        return jobs
+
+    def summary(self, job_id):
+        """Return job counters as BatchJob.summary() would, or None for an unknown job.
+
+        For jobs run by another process, whose latest updates may not be
+        flushed yet.
+        """
+        self.flush()
+        conn = self._connect()
+        row = conn.execute('SELECT profile, results_id, status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        counts = dict(conn.execute(
+            'SELECT status, COUNT(*) FROM items WHERE job_id = ? GROUP BY status', (job_id,)
+        ).fetchall())
+        cached = conn.execute(
+            "SELECT COUNT(*) FROM items WHERE job_id = ? AND status = 'done' AND cached = 1", (job_id,)
+        ).fetchone()[0]
+        return {
+            'job_id': job_id,
+            'results_id': row[1],
+            'status': row[2],
+            'profile': row[0],
+            'total': sum(counts.values()),
+            'completed': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'cached': cached,
+            'cancelled': counts.get('cancelled', 0)
+        }
+
+    def sweep(self):
+        """Drop jobs that finished before the retention window; return how many."""
+        self.flush()
+        cutoff = time.time() - self.retention
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "DELETE FROM items WHERE job_id IN (SELECT id FROM jobs WHERE status != 'running' AND finished <= ?)",
+                (cutoff,)
+            )
+            return conn.execute("DELETE FROM jobs WHERE status != 'running' AND finished <= ?", (cutoff,)).rowcount
+
+    def stats(self):
+        self.flush()
+        counts = dict(self._connect().execute(
+            "SELECT status, COUNT(*) FROM items WHERE job_id IN (SELECT id FROM jobs WHERE status = 'running')"
+            ' GROUP BY status'
+        ).fetchall())
+        jobs = self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+        return {'path': self.path, 'running_jobs': jobs, **{status: counts.get(status, 0)
+                                                            for status in ('pending', 'leased', 'done', 'failed')}}
+
+    def flush(self):
+        """Write queued state changes now."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            conn = self._connect()
+            try:
+                with conn:
+                    for sql, params in pending:
+                        conn.execute(sql, params)
+            except sqlite3.Error:
+                # Keep the updates for the next attempt
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+    def _queue(self, sql, params):
+        with self._lock:
+            self._pending.append((sql, params))
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Job queue flush failed: {e}", flush=True)
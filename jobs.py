@@ -0,0 +1,303 @@
+"""Server-side batch jobs for MetaData Refiner."""
+
+import threading
+import time
+import uuid
+
+
+class BatchJob:
+    """A batch of images for one profile, with aggregated progress."""
+
+    def __init__(self, sid, profile_name, api_key, items, results_id=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        # Result-store key; several runs may share one result set
+        self.results_id = results_id or self.id
+        self.sid = sid
+        self.profile_name = profile_name
+        self.api_key = api_key
+        self.items = items
+        self.total = len(items)
+        self.completed = 0
+        self.failed = 0
+        self.cached = 0
+        # Items dropped by a cancel before they finished
+        self.cancelled = 0
+        self.cancel_requested = False
+        self.status = 'queued'
+        self.created = time.time()
+        self.finished = None
+        self._pending_results = []
+        self._pending_errors = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def recovered(cls, record, api_key):
+        """Rebuild a job from JobQueue.recover() output, keeping its settled counts."""
+        job = cls(None, record['profile'], api_key, record['items'],
+                  results_id=record['results_id'], job_id=record['id'])
+        job.created = record['created']
+        job.completed = record['completed']
+        job.failed = record['failed']
+        job.cached = record['cached']
+        job.total += job.completed + job.failed
+        return job
+
+    def record_result(self, result):
+        """Record a successful metadata_update payload."""
+        with self._lock:
+            self.completed += 1
+            if result.get('cached'):
+                self.cached += 1
+            entry = {
+                'image': result['image'],
+                'cached': result.get('cached', False),
+                'metadata': result['metadata']
+            }
+            if 'timings' in result:
+                entry['timings'] = result['timings']
+            self._pending_results.append(entry)
+
+    def record_error(self, image, error_info):
+        """Record a failed item with its classified error."""
+        with self._lock:
+            self.failed += 1
+            self._pending_errors.append({'image': image, **error_info})
+
+    def record_cancelled(self, count=1):
+        with self._lock:
+            self.cancelled += count
+
+    @property
+    def done(self):
+        return self.completed + self.failed + self.cancelled >= self.total
+
+    def drain(self):
+        """Return a progress payload with results gathered since the last drain."""
+        with self._lock:
+            payload = {
+                'job_id': self.id,
+                'status': self.status,
+                'total': self.total,
+                'completed': self.completed,
+                'failed': self.failed,
+                'cached': self.cached,
+                'cancelled': self.cancelled,
+                'results': self._pending_results,
+                'errors': self._pending_errors
+            }
+            self._pending_results = []
+            self._pending_errors = []
+        return payload
+
+    def summary(self):
+        """Return job counters without draining pending results."""
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'results_id': self.results_id,
+                'status': self.status,
+                'profile': self.profile_name,
+                'total': self.total,
+                'completed': self.completed,
+                'failed': self.failed,
+                'cached': self.cached,
+                'cancelled': self.cancelled
+            }
+
+
+class JobManager:
+    """Schedule batch items onto an executor through a bounded in-flight window.
+
+    Each job gets a feeder thread that submits items only while fewer than
+    max_in_flight of its items are outstanding, so a 10k-image batch never
+    floods the executor queue. Progress is flushed through emit every flush_interval
+    seconds as one aggregated event. When a result store is given, every
+    outcome is also persisted under the job's results_id; with a durable
+    queue, item state is tracked so unfinished jobs survive a restart.
+    """
+
+    def __init__(self, executor, max_in_flight, flush_interval, emit, retention=3600, store=None, queue=None):
+        self.executor = executor
+        self.flush_interval = flush_interval
+        self.emit = emit
+        self.retention = retention
+        self.store = store
+        self.queue = queue
+        self.jobs = {}
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+
+    def submit(self, job, worker, on_error, executor=None):
+        """Persist (when a durable queue is set) and start a job.
+
+        worker(job, item) returns a metadata_update payload or raises;
+        on_error(exception) maps a failure to the error payload fields.
+        executor overrides the manager's default for this job; anything
+        with an Executor-style submit() returning a Future works.
+        """
+        if self.queue:
+            self.queue.create(job)
+        return self.start(job, worker, on_error, executor)
+
+    def start(self, job, worker, on_error, executor=None):
+        """Feed a job whose items are already persisted."""
+        with self._lock:
+            self._prune()
+            self.jobs[job.id] = job
+        threading.Thread(
+            target=self._feed,
+            args=(job, worker, on_error, executor or self.executor),
+            name=f'batch-{job.id[:8]}',
+            daemon=True
+        ).start()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def running(self):
+        """Jobs that have not finished, including paused ones."""
+        with self._lock:
+            return [job for job in self.jobs.values() if not job.finished]
+
+    def hold(self, job):
+        """Register a recovered job without running it; resume() starts it later."""
+        job.status = 'paused'
+        with self._lock:
+            self.jobs[job.id] = job
+
+    def cancel(self, job):
+        """Stop a job; returns False if it already finished or is stopping.
+
+        The feeder stops submitting items, cancels the outstanding ones
+        through the executor's cancel() when it has one, and ends the job
+        as 'cancelled' once they settle. A paused job ends at once.
+        """
+        with self._lock:
+            if job.finished or job.cancel_requested:
+                return False
+            job.cancel_requested = True
+            paused = job.status == 'paused'
+            if paused:
+                job.status = 'cancelled'
+        if paused:
+            job.record_cancelled(len(job.items))
+            self._finish(job)
+        return True
+
+    def resume(self, job, worker, on_error, executor=None):
+        """Start a paused job; returns False if it was already resumed."""
+        with self._lock:
+            if job.status != 'paused':
+                return False
+            job.status = 'queued'
+        self.start(job, worker, on_error, executor)
+        return True
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window."""
+        cutoff = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+            del self.jobs[job_id]
+
+    def _feed(self, job, worker, on_error, executor):
+        job.status = 'running'
+        all_done = threading.Event()
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+
+        def finished(item, future):
+            try:
+                if future.cancelled():
+                    job.record_cancelled()
+                else:
+                    self._record_result(job, item, future.result())
+            except Exception as e:
+                self._record_error(job, item, on_error(e))
+            finally:
+                slots.release()
+                if job.done:
+                    all_done.set()
+
+        if not job.items:
+            all_done.set()
+        wait_for_room = getattr(executor, 'wait_for_room', None)
+        submitted = 0
+        last_flush = time.monotonic()
+        for item in job.items:
+            # Keep streaming progress while waiting for a free slot, then for room
+            # in the executor's queue when it applies backpressure
+            while not job.cancel_requested and not slots.acquire(timeout=self.flush_interval):
+                self._flush(job, 'batch_progress')
+                last_flush = time.monotonic()
+            while not job.cancel_requested and wait_for_room and not wait_for_room(self.flush_interval):
+                self._flush(job, 'batch_progress')
+                last_flush = time.monotonic()
+            if job.cancel_requested:
+                break
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush(job, 'batch_progress')
+                last_flush = time.monotonic()
+            if self.queue:
+                self.queue.lease(job.id, item['seq'])
+            # Lets the worker measure how long the item waited in the executor
+            item['queued_at'] = time.perf_counter()
+            submitted += 1
+            try:
+                future = executor.submit(worker, job, item)
+                future.add_done_callback(lambda f, item=item: finished(item, f))
+            except Exception as e:
+                slots.release()
+                self._record_error(job, item, on_error(e))
+                if job.done:
+                    all_done.set()
+
+        stopping = False
+        while True:
+            if job.cancel_requested and not stopping:
+                stopping = True
+                job.record_cancelled(len(job.items) - submitted)
+                cancel = getattr(executor, 'cancel', None)
+                if cancel:
+                    cancel()
+                if job.done:
+                    all_done.set()
+            if all_done.wait(self.flush_interval):
+                break
+            self._flush(job, 'batch_progress')
+        self._finish(job)
+
+    def _finish(self, job):
+        job.status = 'cancelled' if job.cancel_requested else 'complete'
+        job.finished = time.time()
+        if self.queue:
+            if job.cancel_requested:
+                self.queue.cancel(job.id)
+            else:
+                self.queue.finish(job.id)
+        self._flush(job, 'batch_complete')
+        # Results have been delivered; drop the item list to free memory
+        job.items = []
+
+    def _record_result(self, job, item, result):
+        job.record_result(result)
+        if self.store:
+            self.store.add_result(job.results_id, job.profile_name, result)
+        if self.queue:
+            self.queue.done(job.id, item['seq'], result.get('cached'))
+
+    def _record_error(self, job, item, error_info):
+        job.record_error(item.get('full_path'), error_info)
+        if self.store:
+            self.store.add_error(job.results_id, job.profile_name, item.get('full_path'), error_info.get('message'))
+        if self.queue:
+            self.queue.fail(job.id, item['seq'], error_info.get('message'))
+
+    def _flush(self, job, event):
+        payload = job.drain()
+        if event == 'batch_progress' and not payload['results'] and not payload['errors']:
+            return
+        try:
+            self.emit(event, payload, job.sid)
+        except Exception as e:
+            print(f"Error emitting {event} for job {job.id}: {e}", flush=True)
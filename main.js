@@ -8,6 +8,14 @@ const net = require('net');
 let mainWindow;
 let flaskProcess;
 let serverPort = 5001;
+let stoppingFlask = false;
+let flaskRestarts = 0;
+const MAX_FLASK_RESTARTS = 5;
+// Set while startFlaskServer waits for the backend's readiness line (printed by startup.py)
+let resolveFlaskReady = null;
+const FLASK_READY_PREFIX = 'MDR_READY';
+// Longer than startup.py's 60s listen deadline, after which the server exits and is restarted
+const FLASK_READY_TIMEOUT = 90000;
 let tray = null;
 
 // Check if port is available
@@ -39,49 +47,79 @@ async function startFlaskServer() {
   try {
     serverPort = await findAvailablePort();
     console.log(`Starting Flask server on port ${serverPort}`);
-    
-    const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
-    const appPath = app.isPackaged ? 
-      path.join(process.resourcesPath, 'app') : 
-      __dirname;
-    
-    // Set environment variables
-    const env = {
-      ...process.env,
-      FLASK_ENV: 'production',
-      FLASK_DEBUG: '0',
-      PORT: serverPort.toString()
-    };
-    
-    flaskProcess = spawn(pythonExecutable, [path.join(appPath, 'app.py')], {
-      env,
-      cwd: appPath,
-      stdio: ['ignore', 'pipe', 'pipe']
-    });
-
-    flaskProcess.stdout.on('data', (data) => {
-      console.log(`Flask stdout: ${data}`);
-    });
-
-    flaskProcess.stderr.on('data', (data) => {
-      console.error(`Flask stderr: ${data}`);
-    });
-
-    flaskProcess.on('close', (code) => {
-      console.log(`Flask process exited with code ${code}`);
-    });
+    const ready = waitForFlaskReady();
+    spawnFlask();
 
-    // Wait a bit for server to start
-    await new Promise(resolve => setTimeout(resolve, 3000));
-    
+    // The server prints a readiness line as soon as it accepts connections
+    if (!await ready) {
+      console.warn(`Flask server did not report ready within ${FLASK_READY_TIMEOUT / 1000}s; loading anyway`);
+    }
   } catch (error) {
     console.error('Error starting Flask server:', error);
     throw error;
   }
 }
 
+function waitForFlaskReady() {
+  return new Promise((resolve) => {
+    const timer = setTimeout(() => {
+      resolveFlaskReady = null;
+      resolve(false);
+    }, FLASK_READY_TIMEOUT);
+    resolveFlaskReady = () => {
+      clearTimeout(timer);
+      resolveFlaskReady = null;
+      resolve(true);
+    };
+  });
+}
+
+function spawnFlask() {
+  const pythonExecutable = process.platform === 'win32' ? 'python' : 'python3';
+  const appPath = app.isPackaged ? 
+    path.join(process.resourcesPath, 'app') : 
+    __dirname;
+  
+  // Set environment variables
+  const env = {
+    ...process.env,
+    FLASK_ENV: 'production',
+    FLASK_DEBUG: '0',
+    PORT: serverPort.toString()
+  };
+  
+  flaskProcess = spawn(pythonExecutable, [path.join(appPath, 'server.py')], {
+    env,
+    cwd: appPath,
+    stdio: ['ignore', 'pipe', 'pipe']
+  });
+
+  flaskProcess.stdout.on('data', (data) => {
+    console.log(`Flask stdout: ${data}`);
+    if (resolveFlaskReady && data.toString().includes(FLASK_READY_PREFIX)) {
+      resolveFlaskReady();
+    }
+  });
+
+  flaskProcess.stderr.on('data', (data) => {
+    console.error(`Flask stderr: ${data}`);
+  });
+
+  flaskProcess.on('close', (code) => {
+    console.log(`Flask process exited with code ${code}`);
+    // Restart on the same port after a crash; the server recovers queued
+    // batch jobs and the page reattaches when its socket reconnects
+    if (!stoppingFlask && flaskRestarts < MAX_FLASK_RESTARTS) {
+      flaskRestarts++;
+      console.log(`Restarting Flask server (attempt ${flaskRestarts} of ${MAX_FLASK_RESTARTS})`);
+      setTimeout(spawnFlask, 1000);
+    }
+  });
+}
+
 // Stop Flask server
 function stopFlaskServer() {
+  stoppingFlask = true;
   if (flaskProcess) {
     console.log('Stopping Flask server...');
     flaskProcess.kill();
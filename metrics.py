@@ -0,0 +1,202 @@
+"""In-process metrics with Prometheus text exposition for MetaData Refiner."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cache hit (sub-millisecond) to a slow, retried API call
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    """Monotonic total per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + self._format_labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, optionally read from a callback at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback:
+            try:
+                values = self.callback()
+            except Exception as e:
+                print(f"Metric {self.name} callback failed: {e}", flush=True)
+                return []
+            # A callback returns a number, or {label value tuple: number}
+            if not isinstance(values, dict):
+                values = {(): values}
+            return [(self.name + self._format_labels(key), value) for key, value in values.items()]
+        with self._lock:
+            return [(self.name + self._format_labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append((self.name + '_bucket' + self._format_labels(key, [('le', _format_value(bound))]),
+                                  bucket_count))
+                lines.append((self.name + '_bucket' + self._format_labels(key, [('le', '+Inf')]), count))
+                lines.append((self.name + '_sum' + self._format_labels(key), total))
+                lines.append((self.name + '_count' + self._format_labels(key), count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), callback=None):
+        return self.register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name, help_text, labels=(), buckets=STAGE_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        out = []
+        for metric in metrics:
+            out.append(f'# HELP {metric.name} {metric.help}')
+            out.append(f'# TYPE {metric.name} {metric.kind}')
+            out.extend(f'{name} {_format_value(value)}' for name, value in metric.samples())
+        return '\n'.join(out) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'mdr_stage_seconds', 'Time spent in each pipeline stage', labels=('stage',))
+images_total = registry.counter(
+    'mdr_images_total', 'Images finished, by outcome (generated, cached, near_duplicate, coalesced, failed)', labels=('outcome',))
+errors_total = registry.counter(
+    'mdr_errors_total', 'Failed images by classify_error category', labels=('category',))
+images_in_flight = registry.gauge(
+    'mdr_images_in_flight', 'Images currently between dequeue and result')
+request_bytes_total = registry.counter(
+    'mdr_openai_request_bytes_total', 'Bytes of prompt and base64 image payload sent to OpenAI')
+tokens_total = registry.counter(
+    'mdr_openai_tokens_total', 'Tokens reported in response.usage', labels=('kind',))
+
+
+@contextmanager
+def stage(name, timings=None):
+    """Time a block into mdr_stage_seconds, also storing milliseconds in timings when given."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start, timings)
+
+
+def observe_stage(name, seconds, timings=None):
+    stage_seconds.observe(seconds, stage=name)
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0) + seconds * 1000, 2)
+
+
+def observe_usage(response):
+    """Count prompt and completion tokens from a chat completion's usage block."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        value = getattr(usage, kind, None)
+        if value:
+            tokens_total.inc(value, kind=kind.split('_')[0])
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
@@ -0,0 +1,155 @@
+"""Perceptual-hash index for reusing metadata across near-duplicate images."""
+
+import os
+import sqlite3
+import threading
+
+# dHashes with almost all bits equal come from flat or near-blank images,
+# which would match each other regardless of content
+MIN_HASH_BITS = 4
+
+
+def dhash(image_path, size=8):
+    """64-bit difference hash plus the image's aspect ratio.
+
+    Robust to re-encoding, resizing and format changes; Image.draft keeps
+    the decode of large JPEGs cheap.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        aspect = img.width / img.height if img.height else 0.0
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        img.thumbnail((size * 8, size * 8))
+        # Transparent areas hash as white, matching how payloads are flattened
+        if img.mode in ('RGBA', 'LA'):
+            background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+            background.alpha_composite(img.convert('RGBA'))
+            img = background
+        gray = img.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS)
+        pixels = list(gray.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value, aspect
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance for radius queries."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return [(distance, item)] for every item within max_distance."""
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            # Triangle inequality prunes children outside [d - r, d + r]
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results, key=lambda r: r[0])
+
+
+class NearDuplicateIndex:
+    """Persistent dHash index keyed by content hash.
+
+    Hashes are stored in SQLite so they survive restarts and are shared
+    with other server processes; each process mirrors the table into an
+    in-memory BK-tree and picks up rows added elsewhere before searching.
+    """
+
+    def __init__(self, path, threshold, max_aspect_delta=0.02):
+        self.path = path
+        self.threshold = threshold
+        self.max_aspect_delta = max_aspect_delta
+        self._tree = BKTree()
+        self._entries = {}
+        self._last_rowid = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS dhashes ('
+            ' content_hash TEXT PRIMARY KEY,'
+            ' dhash INTEGER NOT NULL,'
+            ' aspect REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def lookup(self, content_hash, image_path, hash_fn=dhash):
+        """Register the image and return content hashes of near-duplicates, closest first."""
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(content_hash)
+        if entry is None:
+            value, aspect = hash_fn(image_path)
+            # SQLite integers are signed 64-bit
+            stored = value - (1 << 64) if value >= (1 << 63) else value
+            with self._lock:
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO dhashes (content_hash, dhash, aspect) VALUES (?, ?, ?)',
+                    (content_hash, stored, aspect)
+                )
+                self._conn.commit()
+                self._sync()
+                entry = self._entries.get(content_hash, (value, aspect))
+
+        value, aspect = entry
+        if not MIN_HASH_BITS <= bin(value).count('1') <= 64 - MIN_HASH_BITS:
+            return []
+        with self._lock:
+            matches = self._tree.search(value, self.threshold)
+        return [
+            other for _, (other, other_aspect) in matches
+            if other != content_hash and abs(other_aspect - aspect) <= self.max_aspect_delta
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'threshold': self.threshold}
+
+    def _sync(self):
+        """Load rows added since the last sync, including ones from other processes."""
+        rows = self._conn.execute(
+            'SELECT rowid, content_hash, dhash, aspect FROM dhashes WHERE rowid > ? ORDER BY rowid',
+            (self._last_rowid,)
+        ).fetchall()
+        for rowid, content_hash, value, aspect in rows:
+            if content_hash not in self._entries:
+                value %= 1 << 64
+                self._entries[content_hash] = (value, aspect)
+                self._tree.add(value, (content_hash, aspect))
+            self._last_rowid = rowid
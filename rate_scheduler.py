@@ -0,0 +1,335 @@
+"""Rate-limit-aware scheduling of OpenAI requests for MetaData Refiner."""
+
+import asyncio
+import email.utils
+import hashlib
+import random
+import re
+import threading
+import time
+
+# HTTP statuses worth sending again; other 4xx responses fail the same way every time
+RETRY_STATUSES = frozenset({408, 409, 429})
+
+
+class TokenBucket:
+    """Refilling budget of `capacity` units per minute; 0 disables the limit."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount is available (0 when it already is)."""
+        if not self.capacity or self.level >= min(amount, self.capacity):
+            return 0.0
+        return (min(amount, self.capacity) - self.level) * 60.0 / self.capacity
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+    def clamp(self, remaining):
+        """Lower the level to what the provider reports as remaining."""
+        if self.capacity:
+            self.level = min(self.level, float(remaining))
+
+
+class KeyState:
+    """Budgets and adaptive concurrency for one API key."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, concurrency):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.counters = {'requests': 0, 'retries': 0, 'throttled': 0, 'failed': 0}
+
+
+class RateLimitScheduler:
+    """Gate chat completion calls per API key.
+
+    Each key gets request and token buckets, an AIMD concurrency limit
+    (grow by one slot per window of successes, halve on 429), and a
+    blocked-until time fed by Retry-After and x-ratelimit-* headers.
+    Transient failures (see is_transient) are retried with jittered
+    exponential backoff; the final failure is re-raised. classify also
+    flags quota errors, which halve the concurrency limit.
+    """
+
+    def __init__(self, classify, requests_per_minute=0, tokens_per_minute=0, initial_concurrency=8,
+                 min_concurrency=1, max_concurrency=256, max_retries=4, backoff_base=1.0, backoff_max=30.0):
+        self.classify = classify
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._states = {}
+        # (loop, asyncio.Event) pairs of coroutines waiting for a concurrency slot
+        self._async_waiters = []
+        self._cond = threading.Condition()
+
+    def call(self, api_key, estimated_tokens, fn):
+        """Run fn() under the key's budgets, retrying retryable failures.
+
+        fn must return a raw response (``with_raw_response``) so rate-limit
+        headers can be read; the parsed response is returned.
+        """
+        state = self._state(api_key)
+        attempt = 0
+        while True:
+            self._acquire(state, estimated_tokens)
+            try:
+                raw = fn()
+            except Exception as e:
+                delay = self._on_failure(state, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._abandon(state)
+                raise
+            return self._on_success(state, raw, estimated_tokens)
+
+    async def acall(self, api_key, estimated_tokens, fn):
+        """Async counterpart of call(); fn is a coroutine function."""
+        state = self._state(api_key)
+        attempt = 0
+        while True:
+            await self._acquire_async(state, estimated_tokens)
+            try:
+                raw = await fn()
+            except Exception as e:
+                delay = self._on_failure(state, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # asyncio.CancelledError when fair_queue cancels the item mid-call
+                self._abandon(state)
+                raise
+            return self._on_success(state, raw, estimated_tokens)
+
+    def stats(self):
+        """Return per-key limits, budgets and counters."""
+        now = time.monotonic()
+        with self._cond:
+            return {
+                key_id: {
+                    'concurrency_limit': round(state.limit, 2),
+                    'in_flight': state.in_flight,
+                    'requests_available': round(state.requests.level, 1) if state.requests.capacity else None,
+                    'tokens_available': round(state.tokens.level) if state.tokens.capacity else None,
+                    'blocked_for': round(max(0.0, state.blocked_until - now), 2),
+                    **state.counters
+                }
+                for key_id, state in self._states.items()
+            }
+
+    def _state(self, api_key):
+        key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+        with self._cond:
+            state = self._states.get(key_id)
+            if state is None:
+                state = KeyState(self.requests_per_minute, self.tokens_per_minute, self.initial_concurrency)
+                self._states[key_id] = state
+            return state
+
+    def _acquire(self, state, tokens):
+        with self._cond:
+            while True:
+                wait = self._try_acquire_locked(state, tokens)
+                if wait == 0:
+                    return
+                # None means waiting on a concurrency slot; releases notify the condition
+                self._cond.wait(timeout=wait if wait is not None else 1.0)
+
+    async def _acquire_async(self, state, tokens):
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = None
+            with self._cond:
+                wait = self._try_acquire_locked(state, tokens)
+                if wait == 0:
+                    return
+                if wait is None:
+                    waiter = (loop, asyncio.Event())
+                    self._async_waiters.append(waiter)
+            if waiter is None:
+                await asyncio.sleep(wait)
+                continue
+            # Woken by _release; the timeout covers a blocked_until set meanwhile
+            try:
+                await asyncio.wait_for(waiter[1].wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def _try_acquire_locked(self, state, tokens):
+        """Reserve a slot and budget; return 0 on success, else seconds to wait (None = until a release)."""
+        now = time.monotonic()
+        if state.blocked_until > now:
+            return state.blocked_until - now
+        if state.in_flight >= int(state.limit):
+            return None
+        state.requests.refill(now)
+        state.tokens.refill(now)
+        wait = max(state.requests.wait_time(1), state.tokens.wait_time(tokens))
+        if wait > 0:
+            return wait
+        state.requests.take(1)
+        state.tokens.take(tokens)
+        state.in_flight += 1
+        state.counters['requests'] += 1
+        return 0
+
+    def _release(self, state):
+        state.in_flight -= 1
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def _abandon(self, state):
+        """Give back the slot of a call interrupted by cancellation or shutdown."""
+        with self._cond:
+            self._release(state)
+
+    def _on_success(self, state, raw, estimated_tokens):
+        with self._cond:
+            self._release(state)
+            # Additive increase: roughly one extra slot per window of successes
+            state.limit = min(self.max_concurrency, state.limit + 1.0 / max(state.limit, 1.0))
+            self._apply_headers(state, raw.headers)
+        response = raw.parse()
+        actual = getattr(getattr(response, 'usage', None), 'total_tokens', None)
+        if actual:
+            with self._cond:
+                # Reconcile the estimate with what was actually billed
+                state.tokens.take(actual - estimated_tokens)
+        return response
+
+    def _on_failure(self, state, exception, attempt):
+        """Record a failure and return the retry delay, or None to give up."""
+        info = self.classify(exception)
+        rate_limited = getattr(exception, 'status_code', None) == 429 or info['category'] == 'quota'
+        headers = getattr(getattr(exception, 'response', None), 'headers', None) or {}
+        with self._cond:
+            self._release(state)
+            delay = None
+            if rate_limited:
+                state.counters['throttled'] += 1
+                # Multiplicative decrease
+                state.limit = max(self.min_concurrency, state.limit / 2.0)
+                delay = self._apply_headers(state, headers)
+            retryable = (
+                is_transient(exception)
+                and 'insufficient_quota' not in str(exception).lower()
+                and attempt < self.max_retries
+            )
+            if not retryable:
+                state.counters['failed'] += 1
+                return None
+            state.counters['retries'] += 1
+        backoff = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # Full jitter keeps many workers from retrying in lockstep
+        jittered = random.uniform(0, backoff)
+        print(f"Retrying OpenAI request after {info['category']} error (attempt {attempt + 1})", flush=True)
+        return max(delay or 0.0, jittered)
+
+    def _apply_headers(self, state, headers):
+        """Fold Retry-After and x-ratelimit-* headers into the key state; return the implied wait."""
+        now = time.monotonic()
+        wait = retry_after_seconds(headers) or 0.0
+        remaining_requests = _int_header(headers, 'x-ratelimit-remaining-requests')
+        remaining_tokens = _int_header(headers, 'x-ratelimit-remaining-tokens')
+        if remaining_requests is not None:
+            state.requests.clamp(remaining_requests)
+            if remaining_requests <= 0:
+                wait = max(wait, parse_duration(headers.get('x-ratelimit-reset-requests')))
+        if remaining_tokens is not None:
+            state.tokens.clamp(remaining_tokens)
+            if remaining_tokens <= 0:
+                wait = max(wait, parse_duration(headers.get('x-ratelimit-reset-tokens')))
+        if wait > 0:
+            state.blocked_until = max(state.blocked_until, now + wait)
+        return wait
+
+
+def is_transient(exception):
+    """True for failures a retry can fix: 408/409/429/5xx responses, timeouts and connection errors."""
+    status = getattr(exception, 'status_code', None)
+    if status is not None:
+        return status in RETRY_STATUSES or status >= 500
+    import openai
+
+    return isinstance(exception, (openai.APITimeoutError, openai.APIConnectionError))
+
+
+def estimate_request_tokens(prompt, images=1, image_tokens=765, completion_tokens=300):
+    """Rough token cost of a request, used to draw from the token bucket up front."""
+    return len(prompt) // 4 + images * image_tokens + completion_tokens
+
+
+def retry_after_seconds(headers):
+    """Parse retry-after-ms / Retry-After (seconds or HTTP date) into seconds."""
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, when.timestamp() - time.time())
+
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_duration(value):
+    """Parse OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    if not value:
+        return 0.0
+    scale = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+    return sum(float(amount) * scale[unit] for amount, unit in _DURATION_PART.findall(value))
+
+
+def _int_header(headers, name):
+    value = headers.get(name) if headers else None
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,211 @@
+"""Server-side store of generated metadata for MetaData Refiner."""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResultStore:
+    """Persist per-image outcomes keyed by (job_id, image, profile) in SQLite.
+
+    Writes are queued and flushed in batches by a background thread, so
+    recording a result never blocks a worker or the async engine's loop
+    on disk I/O. Reads flush the queue first and page by row id, which
+    keeps pagination stable while a job is still adding rows.
+    """
+
+    def __init__(self, path, retention=30 * 86400, flush_interval=0.5, flush_size=500):
+        self.path = path
+        self.retention = retention
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._local = threading.local()
+        self._pending = []
+        self._lock = threading.Lock()
+        # Held across taking and writing a batch, so batches commit in the order they were queued
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            table = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'results'").fetchone()
+            if table and 'UNIQUE (job_id, image))' in table[0]:
+                # Stores created before results were keyed by profile too
+                conn.execute('ALTER TABLE results RENAME TO results_old')
+                for index in ('idx_results_job', 'idx_results_profile', 'idx_results_updated'):
+                    conn.execute(f'DROP INDEX IF EXISTS {index}')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' job_id TEXT NOT NULL,'
+                ' image TEXT NOT NULL,'
+                ' profile TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' cached INTEGER NOT NULL DEFAULT 0,'
+                ' metadata TEXT,'
+                ' error TEXT,'
+                ' updated REAL NOT NULL,'
+                ' UNIQUE (job_id, image, profile))'
+            )
+            if table and 'UNIQUE (job_id, image))' in table[0]:
+                conn.execute('INSERT INTO results SELECT * FROM results_old')
+                conn.execute('DROP TABLE results_old')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_job ON results (job_id, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_profile ON results (profile, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_updated ON results (updated)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_results_image ON results (image, profile)')
+        threading.Thread(target=self._run, name='result-writer', daemon=True).start()
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add_result(self, job_id, profile_name, result):
+        """Queue a metadata_update payload for job_id."""
+        self._queue((
+            job_id, result['image'], profile_name, 'complete', int(bool(result.get('cached'))),
+            json.dumps(result['metadata']), None, time.time()
+        ))
+
+    def add_error(self, job_id, profile_name, image, message):
+        """Queue a failure; it never replaces a completed result for the same image and profile."""
+        self._queue((job_id, image, profile_name, 'error', 0, None, (message or '')[:500], time.time()))
+
+    def query(self, job_id=None, profile_name=None, status=None, after=0, limit=100):
+        """Return (rows, next cursor) for rows with id > after, oldest first.
+
+        The cursor is None once the last page has been returned.
+        """
+        self.flush()
+        clauses, params = ['id > ?'], [after]
+        for column, value in (('job_id', job_id), ('profile', profile_name), ('status', status)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        rows = self._connect().execute(
+            'SELECT id, job_id, image, profile, status, cached, metadata, error, updated FROM results'
+            f' WHERE {" AND ".join(clauses)} ORDER BY id LIMIT ?',
+            (*params, limit + 1)
+        ).fetchall()
+        page = [_row_dict(row) for row in rows[:limit]]
+        return page, page[-1]['id'] if len(rows) > limit else None
+
+    def iter_results(self, job_id, profile_name=None, status='complete', page_size=1000):
+        """Yield every matching row, one page at a time, without holding a read transaction open."""
+        after = 0
+        while after is not None:
+            rows, after = self.query(job_id, profile_name, status, after, page_size)
+            yield from rows
+
+    def completed_images(self, images, profile_name, chunk_size=500):
+        """Return the subset of images with a completed result for profile_name in any job."""
+        self.flush()
+        images = list(dict.fromkeys(images))
+        found = set()
+        conn = self._connect()
+        for start in range(0, len(images), chunk_size):
+            chunk = images[start:start + chunk_size]
+            found.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT image FROM results WHERE profile = ? AND status = 'complete'"
+                f" AND image IN ({','.join('?' * len(chunk))})",
+                (profile_name, *chunk)
+            ))
+        return found
+
+    def summary(self, job_id):
+        """Return per-status counts and profiles for a job, or None if it has no rows."""
+        self.flush()
+        rows = self._connect().execute(
+            'SELECT profile, status, COUNT(*), SUM(cached) FROM results WHERE job_id = ? GROUP BY profile, status',
+            (job_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        summary = {'job_id': job_id, 'profiles': sorted({r[0] for r in rows}), 'completed': 0, 'failed': 0, 'cached': 0}
+        for _, status, count, cached in rows:
+            summary['completed' if status == 'complete' else 'failed'] += count
+            summary['cached'] += cached or 0
+        return summary
+
+    def delete_job(self, job_id):
+        self.flush()
+        conn = self._connect()
+        with conn:
+            return conn.execute('DELETE FROM results WHERE job_id = ?', (job_id,)).rowcount
+
+    def sweep(self):
+        """Remove rows older than the retention window and return how many were dropped."""
+        if not self.retention:
+            return 0
+        self.flush()
+        conn = self._connect()
+        with conn:
+            return conn.execute('DELETE FROM results WHERE updated <= ?', (time.time() - self.retention,)).rowcount
+
+    def stats(self):
+        self.flush()
+        rows, jobs = self._connect().execute('SELECT COUNT(*), COUNT(DISTINCT job_id) FROM results').fetchone()
+        return {'path': self.path, 'rows': rows, 'jobs': jobs}
+
+    def flush(self):
+        """Write queued rows now."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO results (job_id, image, profile, status, cached, metadata, error, updated)'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+                        ' ON CONFLICT (job_id, image, profile) DO UPDATE SET'
+                        '  status = excluded.status, cached = excluded.cached,'
+                        '  metadata = excluded.metadata, error = excluded.error, updated = excluded.updated'
+                        " WHERE excluded.status = 'complete' OR results.status != 'complete'",
+                        pending
+                    )
+            except sqlite3.Error:
+                # Keep the rows for the next attempt
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+    def _queue(self, row):
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.flush_size:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Result store flush failed: {e}", flush=True)
+
+
+def _row_dict(row):
+    row_id, job_id, image, profile, status, cached, metadata, error, updated = row
+    return {
+        'id': row_id,
+        'job_id': job_id,
+        'image': image,
+        'profile': profile,
+        'status': status,
+        'cached': bool(cached),
+        'metadata': json.loads(metadata) if metadata else None,
+        'error': error,
+        'updated': updated
+    }
@@ -0,0 +1,10 @@
+"""Entry point for the development and desktop server: python server.py (python app.py also works).
+
+Image pool workers are spawned, and spawn re-imports the launching
+script in every worker, so app is only imported under the main guard.
+"""
+
+if __name__ == '__main__':
+    import app
+
+    app.main()
@@ -0,0 +1,46 @@
+"""In-flight request coalescing for MetaData Refiner."""
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Let concurrent callers with the same key share one computation.
+
+    The first caller to claim a key becomes its leader and must call
+    finish() with the outcome; callers arriving before then get the
+    leader's Future to wait on instead of repeating the work. The key
+    is released as soon as the leader finishes, so later callers start
+    fresh (and normally hit the cache the leader filled).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'followers': 0}
+
+    def claim(self, key):
+        """Return (future, is_leader) for key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._counters['followers'] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self._counters['leaders'] += 1
+            return future, True
+
+    def finish(self, key, result=None, exception=None):
+        """Publish the leader's outcome to every follower and release the key."""
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future is None:
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), **self._counters}
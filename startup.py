@@ -0,0 +1,96 @@
+"""Startup timing and readiness signalling for MetaData Refiner.
+
+main.js waits for the line printed by signal_ready() instead of sleeping
+a fixed time. With MDR_STARTUP_REPORT=1 the server also prints how long
+each startup phase and each slow top-level import took:
+
+    MDR_STARTUP_REPORT=1 python app.py
+"""
+
+import builtins
+import os
+import socket
+import sys
+import threading
+import time
+
+READY_PREFIX = 'MDR_READY'
+
+started = time.perf_counter()
+report_enabled = os.getenv('MDR_STARTUP_REPORT', '0') == '1'
+_phases = []
+_imports = []
+_import_depth = [0]
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = _import_depth[0]
+    _import_depth[0] += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _import_depth[0] = depth
+        _imports.append((depth, name, time.perf_counter() - start))
+
+
+if report_enabled:
+    # Installed when this module is imported, so app.py imports it first
+    builtins.__import__ = _timed_import
+
+
+def mark(phase):
+    """Record that startup has reached phase."""
+    _phases.append((phase, time.perf_counter()))
+
+
+def signal_ready(host, port, warm_up=None, timeout=60):
+    """Print the readiness line once host:port accepts connections, then run warm_up in the background.
+
+    Runs on its own thread because the server's run() call blocks. If the
+    port is still refusing connections after timeout seconds the process
+    exits with status 1, so a supervisor such as main.js restarts it.
+    """
+    def wait():
+        address = ('127.0.0.1' if host in ('0.0.0.0', '') else host, port)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection(address, timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    print(f"Server did not accept connections on {address[0]}:{port} within {timeout}s; exiting",
+                          file=sys.stderr, flush=True)
+                    # The main thread is blocked in the server's run() call
+                    os._exit(1)
+                time.sleep(0.01)
+        mark('listening')
+        print(f"{READY_PREFIX} http://{address[0]}:{port} ({time.perf_counter() - started:.2f}s)", flush=True)
+        if report_enabled:
+            builtins.__import__ = _original_import
+            report()
+        if warm_up:
+            start = time.perf_counter()
+            warm_up()
+            if report_enabled:
+                print(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.0f} ms", flush=True)
+
+    threading.Thread(target=wait, name='startup-ready', daemon=True).start()
+
+
+def report(limit=12):
+    """Print phase durations and the slowest top-level imports."""
+    print("Startup report (ms since app.py started loading):", flush=True)
+    previous = started
+    for phase, at in _phases:
+        print(f"  {phase:<24} {(at - started) * 1000:8.0f}  (+{(at - previous) * 1000:.0f})", flush=True)
+        previous = at
+    slowest = sorted((entry for entry in _imports if entry[0] == 0), key=lambda entry: -entry[2])[:limit]
+    if slowest:
+        print("Slowest imports (ms, including their own imports):", flush=True)
+        for _, name, seconds in slowest:
+            print(f"  {name:<40} {seconds * 1000:8.1f}", flush=True)
@@ -0,0 +1,379 @@
+"""Content-addressed upload storage for MetaData Refiner."""
+
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class StorageFull(Exception):
+    """Raised by UploadStore.save() when reserve() refuses room for new content."""
+
+
+def new_hasher():
+    """Return the fastest available 128-bit content hasher.
+
+    Prefers BLAKE3, then xxh3-128, then the stdlib's BLAKE2b; all produce
+    32 hex characters so stored paths and cache keys keep one shape.
+    """
+    if blake3 is not None:
+        return _Blake3Hasher()
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+class _Blake3Hasher:
+    def __init__(self):
+        self._hasher = blake3.blake3()
+
+    def update(self, data):
+        self._hasher.update(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest(length=16)
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Hash a file in chunks without reading it into memory."""
+    hasher = new_hasher()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class UploadStore:
+    """Store uploads at <root>/<hash[:2]>/<hash>/<filename>.
+
+    The upload is hashed while it streams to disk, so it is written once
+    and never re-read for a cache key. Identical content uploaded under
+    another name is hard-linked into the existing blob directory instead
+    of stored again, and same-named files with different content no
+    longer overwrite each other.
+    """
+
+    def __init__(self, root, chunk_size=1024 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def save(self, stream, filename, max_bytes, verify=None, reserve=None):
+        """Stream an upload into the store.
+
+        Returns (content_hash, path, duplicate). Raises ValueError when the
+        upload exceeds max_bytes or verify(path) rejects it. For content not
+        already stored, reserve(size) is asked for room first and StorageFull
+        is raised if it returns False.
+        """
+        incoming = os.path.join(self.root, '.incoming')
+        os.makedirs(incoming, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            hasher = new_hasher()
+            size = 0
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError('File too large')
+                    hasher.update(chunk)
+                    out.write(chunk)
+            content_hash = hasher.hexdigest()
+
+            blob_dir = self.blob_dir(content_hash)
+            target = os.path.join(blob_dir, filename)
+            existing = self._existing_blob(blob_dir)
+            if existing:
+                if existing != target and not os.path.exists(target):
+                    _link_or_copy(existing, target)
+                return content_hash, target, True
+
+            if verify:
+                verify(tmp_path)
+            if reserve and not reserve(size):
+                raise StorageFull('Upload storage is full')
+            os.makedirs(blob_dir, exist_ok=True)
+            os.replace(tmp_path, target)
+            return content_hash, target, False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def blob_dir(self, content_hash):
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def hash_from_path(self, path):
+        """Return the content hash encoded in a stored path, or None for legacy flat files."""
+        rel = os.path.relpath(os.path.realpath(path), os.path.realpath(self.root))
+        parts = rel.split(os.sep)
+        if len(parts) == 3 and HASH_PATTERN.match(parts[1]) and parts[1][:2] == parts[0]:
+            return parts[1]
+        return None
+
+    def _existing_blob(self, blob_dir):
+        try:
+            names = sorted(os.listdir(blob_dir))
+        except FileNotFoundError:
+            return None
+        return os.path.join(blob_dir, names[0]) if names else None
+
+
+class UploadCatalog:
+    """Track the upload store's disk use in SQLite and keep it within a quota.
+
+    Each stored image (a blob directory, or a legacy flat file at the top
+    of the store) has a row with its size, file count (hard-linked names of
+    one upload count once), last use and
+    whether its metadata has been exported. make_room() evicts exported
+    images, least recently used first, until the store fits max_bytes and
+    max_files; images not yet exported are never evicted, and neither are
+    ones used in the last min_idle seconds. Running totals are kept by
+    triggers, so every worker process sees the same figures.
+    """
+
+    def __init__(self, store, path, max_bytes=0, max_files=0, min_idle=600, touch_interval=60):
+        self.store = store
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.min_idle = min_idle
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._counters = {'evicted': 0, 'evicted_bytes': 0, 'rejected': 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS uploads ('
+                ' key TEXT PRIMARY KEY,'
+                ' bytes INTEGER NOT NULL,'
+                ' files INTEGER NOT NULL,'
+                ' last_used REAL NOT NULL,'
+                ' exported INTEGER NOT NULL DEFAULT 0)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_uploads_evictable ON uploads (exported, last_used)')
+            conn.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0),'
+                         ' bytes INTEGER NOT NULL, files INTEGER NOT NULL, images INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO totals VALUES (0, 0, 0, 0)')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS uploads_insert AFTER INSERT ON uploads BEGIN'
+                         ' UPDATE totals SET bytes = bytes + NEW.bytes, files = files + NEW.files,'
+                         ' images = images + 1; END')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS uploads_delete AFTER DELETE ON uploads BEGIN'
+                         ' UPDATE totals SET bytes = bytes - OLD.bytes, files = files - OLD.files,'
+                         ' images = images - 1; END')
+            conn.execute('CREATE TRIGGER IF NOT EXISTS uploads_update AFTER UPDATE OF bytes, files ON uploads BEGIN'
+                         ' UPDATE totals SET bytes = bytes - OLD.bytes + NEW.bytes,'
+                         ' files = files - OLD.files + NEW.files; END')
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def key_for(self, path):
+        """Catalog key for a stored path: 'ab/<hash>' for blobs, the filename for legacy files, else None."""
+        content_hash = self.store.hash_from_path(path)
+        if content_hash:
+            return f'{content_hash[:2]}/{content_hash}'
+        rel = os.path.relpath(os.path.realpath(path), os.path.realpath(self.store.root))
+        if os.sep in rel or rel.startswith('.'):
+            return None
+        return rel
+
+    def record(self, path):
+        """Count a just-saved upload; a re-upload makes an exported image pending again."""
+        key = self.key_for(path)
+        if key is None:
+            return
+        size, files = self._usage(key)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO uploads (key, bytes, files, last_used, exported) VALUES (?, ?, ?, ?, 0)'
+                ' ON CONFLICT (key) DO UPDATE SET bytes = excluded.bytes, files = excluded.files,'
+                '  last_used = excluded.last_used, exported = 0',
+                (key, size, files, time.time())
+            )
+
+    def touch(self, path):
+        """Note that an upload is in use; writes at most once per touch_interval per image."""
+        key = self.key_for(path)
+        now = time.time()
+        if key is None or now - self._touched.get(key, 0) < self.touch_interval:
+            return
+        self._touched[key] = now
+        if len(self._touched) > 10000:
+            self._touched = {k: at for k, at in self._touched.items() if now - at < self.touch_interval}
+        conn = self._connect()
+        with conn:
+            conn.execute('UPDATE uploads SET last_used = ? WHERE key = ?', (now, key))
+
+    def mark_exported(self, paths):
+        """Make the uploads at paths eligible for eviction once their metadata has been exported."""
+        keys = {key for key in map(self.key_for, paths) if key}
+        if not keys:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany('UPDATE uploads SET exported = 1 WHERE key = ?', ((key,) for key in keys))
+
+    def make_room(self, incoming_bytes=0, incoming_files=0):
+        """Evict exported images until the incoming upload fits the quota; False if it still does not."""
+        if not self.max_bytes and not self.max_files:
+            return True
+        with self._lock:
+            conn = self._connect()
+            while True:
+                size, files = conn.execute('SELECT bytes, files FROM totals').fetchone()
+                excess_bytes = size + incoming_bytes - self.max_bytes if self.max_bytes else 0
+                excess_files = files + incoming_files - self.max_files if self.max_files else 0
+                if excess_bytes <= 0 and excess_files <= 0:
+                    return True
+                rows = conn.execute(
+                    'SELECT key, bytes, files FROM uploads WHERE exported = 1 AND last_used < ?'
+                    ' ORDER BY last_used LIMIT 100',
+                    (time.time() - self.min_idle,)
+                ).fetchall()
+                if not rows:
+                    break
+                victims = []
+                for key, victim_bytes, victim_files in rows:
+                    victims.append(key)
+                    excess_bytes -= victim_bytes
+                    excess_files -= victim_files
+                    if excess_bytes <= 0 and excess_files <= 0:
+                        break
+                if not self._evict(conn, victims):
+                    break
+            if incoming_bytes or incoming_files:
+                self._counters['rejected'] += 1
+            return False
+
+    def sweep(self):
+        """Bring the store back within its quota; returns the number of images evicted."""
+        before = self._counters['evicted']
+        self.make_room()
+        return self._counters['evicted'] - before
+
+    def scan(self):
+        """Catalog images already on disk and forget ones removed outside the store.
+
+        Rows added here take the file's modification time as their last use.
+        """
+        root = self.store.root
+        found = {}
+        try:
+            entries = list(os.scandir(root))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_file():
+                found[entry.name] = entry.stat().st_mtime
+            elif entry.is_dir() and len(entry.name) == 2:
+                for blob in os.scandir(entry.path):
+                    if blob.is_dir() and HASH_PATTERN.match(blob.name) and blob.name[:2] == entry.name:
+                        found[f'{entry.name}/{blob.name}'] = blob.stat().st_mtime
+        conn = self._connect()
+        known = {row[0] for row in conn.execute('SELECT key FROM uploads')}
+        added = []
+        for key in found.keys() - known:
+            size, files = self._usage(key)
+            if files:
+                added.append((key, size, files, found[key]))
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO uploads (key, bytes, files, last_used) VALUES (?, ?, ?, ?)', added)
+            conn.executemany('DELETE FROM uploads WHERE key = ?', ((key,) for key in known - found.keys()))
+        return len(added)
+
+    def stats(self):
+        conn = self._connect()
+        size, files, images = conn.execute('SELECT bytes, files, images FROM totals').fetchone()
+        exported, exported_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM uploads WHERE exported = 1'
+        ).fetchone()
+        return {
+            'bytes': size,
+            'files': files,
+            'images': images,
+            'exported': exported,
+            'exported_bytes': exported_bytes,
+            'max_bytes': self.max_bytes,
+            'max_files': self.max_files,
+            'bytes_used': round(size / self.max_bytes, 3) if self.max_bytes else None,
+            'files_used': round(files / self.max_files, 3) if self.max_files else None,
+            **self._counters
+        }
+
+    def _usage(self, key):
+        """Return (bytes, files) for a catalog key; hard-linked names are counted once."""
+        path = os.path.join(self.store.root, key)
+        try:
+            if not os.path.isdir(path):
+                return os.path.getsize(path), 1
+            inodes = {}
+            for entry in os.scandir(path):
+                if entry.is_file():
+                    stat = entry.stat()
+                    inodes[stat.st_ino] = stat.st_size
+            return sum(inodes.values()), len(inodes)
+        except FileNotFoundError:
+            return 0, 0
+
+    def _evict(self, conn, keys):
+        """Delete keys' files and rows; returns how many were removed."""
+        removed = 0
+        evicted_bytes = 0
+        for key in keys:
+            path = os.path.join(self.store.root, key)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not evict upload {key}: {e}", flush=True)
+                continue
+            with conn:
+                row = conn.execute('SELECT bytes FROM uploads WHERE key = ?', (key,)).fetchone()
+                deleted = conn.execute('DELETE FROM uploads WHERE key = ?', (key,)).rowcount
+            removed += 1
+            if row and deleted:
+                evicted_bytes += row[0]
+                self._counters['evicted'] += 1
+        self._counters['evicted_bytes'] += evicted_bytes
+        return removed
+
+
+def _link_or_copy(source, target):
+    """Hard-link target to source, copying when the filesystem cannot link."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Set before any test imports config, whose shared instance reads the environment once
+os.environ['DATA_FOLDER'] = tempfile.mkdtemp(prefix='mdr-test-data-')
+os.environ.setdefault('FLASK_DEBUG', '0')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app module, imported once with its stores in a temporary data folder."""
+    import app
+
+    return app
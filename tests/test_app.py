@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from fair_queue import Cancelled
+
+
+@pytest.fixture
+def emitted(app_module, monkeypatch):
+    events = []
+    monkeypatch.setattr(app_module.socketio, 'emit', lambda event, data=None, **kwargs: events.append(event))
+    monkeypatch.setattr(app_module, 'resolve_image_path', lambda data: '/tmp/image.jpg')
+    return events
+
+
+def item():
+    return {'full_path': '/static/images/ab/' + 'ab' * 16 + '/a.jpg'}
+
+
+@pytest.mark.parametrize('exception', [Cancelled('Cancelled by the client'), asyncio.CancelledError()])
+def test_cancelled_coroutine_sends_no_error(app_module, emitted, monkeypatch, exception):
+    async def generate(*args):
+        raise exception
+
+    monkeypatch.setattr(app_module, 'generate_metadata_async', generate)
+    try:
+        asyncio.run(app_module.process_image_coro(item(), 'sid', 'zedge', 'sk-test'))
+    except asyncio.CancelledError:
+        pass
+    assert emitted == ['processing_start']
+
+
+def test_cancelled_thread_work_sends_no_error(app_module, emitted, monkeypatch):
+    def generate(*args):
+        raise Cancelled('Cancelled by the client')
+
+    monkeypatch.setattr(app_module, 'generate_metadata', generate)
+    app_module.process_image_async(item(), 'sid', 'zedge', 'sk-test')
+    assert emitted == ['processing_start']
+
+
+def test_failures_still_send_an_error(app_module, emitted, monkeypatch):
+    async def generate(*args):
+        raise ValueError('bad response')
+
+    monkeypatch.setattr(app_module, 'generate_metadata_async', generate)
+    asyncio.run(app_module.process_image_coro(item(), 'sid', 'zedge', 'sk-test'))
+    assert 'error' in emitted
+
+
+@pytest.mark.parametrize('method, url', [
+    ('GET', '/api/jobs/{}'),
+    ('GET', '/api/jobs/{}/results'),
+    ('DELETE', '/api/jobs/{}/results'),
+    ('GET', '/api/jobs/{}/export'),
+])
+def test_job_routes_reject_invalid_ids(app_module, method, url):
+    response = app_module.app.test_client().open(url.format('bad.id'), method=method)
+    assert response.status_code == 400
+
+
+def test_deleting_results_of_unknown_job_is_not_found(app_module):
+    response = app_module.app.test_client().delete('/api/jobs/unknown-job-0001/results')
+    assert response.status_code == 404
+
+
+def test_export_only_marks_images_with_stored_results(app_module, monkeypatch):
+    marked = []
+    monkeypatch.setattr(app_module.upload_catalog, 'mark_exported', marked.extend)
+    stored, foreign = item()['full_path'], '/static/images/cd/' + 'cd' * 16 + '/b.jpg'
+    app_module.result_store.add_result('export-test-job', 'zedge', {'image': stored, 'metadata': {}})
+    columns = ['full_path', 'title']
+    rows = [{'full_path': stored, 'title': 'A'}, {'full_path': foreign, 'title': 'B'}]
+    assert len(list(app_module.track_exported(rows, columns, 'zedge'))) == 2
+    assert marked == [app_module.upload_path_from_url(stored)]
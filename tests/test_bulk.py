@@ -0,0 +1,69 @@
+import json
+from types import SimpleNamespace
+
+from bulk import BulkJob, BulkRunner
+
+
+def output_line(custom_id, content):
+    return json.dumps({'custom_id': custom_id, 'response': {
+        'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}}})
+
+
+class FakeClient:
+    """files/batches stand-in whose retrieve() fails the first `failures` times."""
+
+    def __init__(self, output, failures=0):
+        self.output = output
+        self.failures = failures
+        self.closed = False
+        self.files = SimpleNamespace(create=self._create_file, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve)
+
+    def _create_file(self, file, purpose):
+        return SimpleNamespace(id='file-in')
+
+    def _create_batch(self, **kwargs):
+        return SimpleNamespace(id='batch-1', status='validating')
+
+    def _retrieve(self, batch_id):
+        if self.closed:
+            raise RuntimeError('Cannot send a request, as the client has been closed.')
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('connection reset')
+        return SimpleNamespace(id=batch_id, status='completed', output_file_id='file-out', error_file_id=None)
+
+    def _content(self, file_id):
+        return SimpleNamespace(text=self.output)
+
+    def close(self):
+        self.closed = True
+
+
+def run(tmp_path, client, **options):
+    runner = BulkRunner(str(tmp_path), poll_interval=0, max_file_bytes=10 ** 6, max_requests_per_file=100,
+                        client_factory=lambda api_key: client, **options)
+    job = BulkJob('zedge')
+    requests = [('a', '/static/images/a.jpg', {}), ('b', '/static/images/b.jpg', {})]
+    runner.run(job, 'sk-test', iter(requests), lambda custom_id, content: {'title': content})
+    return job
+
+
+def test_transient_poll_failures_are_retried(tmp_path):
+    client = FakeClient(output_line('a', 'A') + '\n' + output_line('b', 'B'), failures=2)
+    job = run(tmp_path, client)
+    assert job.status == 'completed'
+    assert job.completed == 2
+    assert client.closed
+
+
+def test_repeated_poll_failures_fail_the_job(tmp_path):
+    job = run(tmp_path, FakeClient('', failures=5), max_poll_failures=3)
+    assert job.status == 'failed'
+
+
+def test_malformed_output_line_only_loses_that_line(tmp_path):
+    job = run(tmp_path, FakeClient(output_line('a', 'A') + '\n{"custom_id": "b", trunc'))
+    assert job.completed == 1
+    assert [error['image'] for error in job.errors] == ['/static/images/b.jpg']
+    assert job.status == 'completed'
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+from cache import SQLiteCache
+
+
+def test_get_does_not_take_the_write_lock(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60)
+    cache.set('k', {'title': 'x'})
+
+    writer = sqlite3.connect(str(tmp_path / 'cache.db'), isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        results = []
+        reader = threading.Thread(target=lambda: results.append(cache.get('k')))
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+        assert results == [{'title': 'x'}]
+    finally:
+        writer.execute('ROLLBACK')
+
+
+def test_hits_and_misses_are_flushed_by_sweep(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60)
+    cache.set('k', 1)
+    cache.get('k')
+    cache.get('missing')
+    assert cache.stats()['hits'] == 1
+    cache.sweep()
+    other = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60)
+    stats = other.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=0)
+    cache.set('k', 1)
+    assert cache.get('k') is None
+    assert cache.sweep() == 1
+
+
+def test_totals_follow_every_write(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60, max_entries=3, max_bytes=40)
+    for key in 'abcde':
+        cache.set(key, key * 5)
+    cache.set('e', 'e')
+    cache.delete('d')
+    cache.delete_many(['c', 'missing'])
+    conn = sqlite3.connect(str(tmp_path / 'cache.db'))
+    assert conn.execute('SELECT COUNT(*), SUM(size) FROM entries').fetchone() == (1, 3)
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (1, 3, 2)
+    cache.clear()
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == (0, 0)
+
+
+def test_totals_are_backfilled_for_existing_caches(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,'
+                 ' created REAL NOT NULL, accessed REAL NOT NULL)')
+    conn.execute("INSERT INTO entries VALUES ('k', '1', 1, 0, 0), ('j', '22', 2, 0, 1)")
+    conn.commit()
+    cache = SQLiteCache(path, ttl=1e12, max_entries=2)
+    assert (cache.stats()['entries'], cache.stats()['bytes']) == (2, 3)
+    cache.set('new', 1)
+    assert sorted(cache.keys()) == ['j', 'new']
+    assert cache.stats()['evictions'] == 1
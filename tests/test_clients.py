@@ -0,0 +1,45 @@
+import asyncio
+import threading
+
+import pytest
+
+from clients import OpenAIClientPool
+
+pytest.importorskip('openai')
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(2)
+
+
+def pool(**options):
+    return OpenAIClientPool(timeout=5, max_connections=4, max_keepalive=4, keepalive_expiry=5,
+                            http2=False, base_url='http://127.0.0.1:9/v1', **options)
+
+
+def test_async_clients_are_keyed_by_hash_and_closed_when_idle(loop):
+    import openai
+
+    clients = pool(idle_ttl=0, loop=loop)
+    secret = 'sk-' + 'a' * 40
+    client = clients.get(secret)
+    assert isinstance(client, openai.AsyncOpenAI)
+    assert secret not in clients._clients
+    http_client = clients._clients[next(iter(clients._clients))]['http_client']
+
+    stats = clients.stats()
+    assert stats['clients'] == 0 and stats['expired'] == 1
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), loop).result(2)
+    assert http_client.is_closed
+
+
+def test_sync_clients_are_reused():
+    clients = pool(idle_ttl=600)
+    assert clients.get('sk-' + 'b' * 40) is clients.get('sk-' + 'b' * 40)
+    assert clients.stats()['reused'] == 1
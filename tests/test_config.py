@@ -0,0 +1,15 @@
+from config import AppConfig
+
+
+def test_unknown_image_preset_falls_back_to_quality(monkeypatch):
+    monkeypatch.setenv('IMAGE_PRESET', 'turbo')
+    config = AppConfig()
+    assert config.image_preset == 'quality'
+    assert any("IMAGE_PRESET 'turbo'" in warning for warning in config.validate())
+
+
+def test_known_image_preset_is_kept(monkeypatch):
+    monkeypatch.setenv('IMAGE_PRESET', 'fast')
+    config = AppConfig()
+    assert config.image_preset == 'fast'
+    assert not any('IMAGE_PRESET' in warning for warning in config.validate())
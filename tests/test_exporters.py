@@ -0,0 +1,12 @@
+from exporters import export_rows
+
+
+def test_uploads_keep_only_their_file_name():
+    rows = export_rows([{'full_path': '/static/images/ab/cd/a.jpg'}], ['full_path'], '/photos')
+    assert list(rows) == [{'full_path': '/photos/a.jpg'}]
+
+
+def test_scanned_trees_keep_their_directories():
+    items = [{'full_path': 'cats/a.jpg'}, {'full_path': 'dogs/a.jpg'}]
+    rows = export_rows(items, ['full_path'], '/photos', keep_tree=True)
+    assert [row['full_path'] for row in rows] == ['/photos/cats/a.jpg', '/photos/dogs/a.jpg']
@@ -0,0 +1,26 @@
+from imaging import PayloadCache
+
+
+def test_stats_do_not_rescan(tmp_path, monkeypatch):
+    cache = PayloadCache(str(tmp_path), max_bytes=10 ** 6)
+    cache.put('ab-1', b'x' * 100)
+    monkeypatch.setattr(cache, '_scan', lambda: (_ for _ in ()).throw(AssertionError('rescanned')))
+    assert cache.stats()['bytes'] == 100
+
+
+def test_overwriting_a_key_does_not_grow_the_total(tmp_path):
+    cache = PayloadCache(str(tmp_path), max_bytes=10 ** 6)
+    cache.put('ab-1', b'x' * 100)
+    cache.put('ab-1', b'y' * 60)
+    assert cache.stats()['bytes'] == 60
+
+
+def test_sweep_picks_up_other_writers_and_evicts(tmp_path):
+    cache = PayloadCache(str(tmp_path), max_bytes=250)
+    other = PayloadCache(str(tmp_path), max_bytes=250)
+    cache.put('ab-1', b'x' * 100)
+    other.put('cd-2', b'x' * 100)
+    other.put('ef-3', b'x' * 100)
+    assert cache.stats()['bytes'] == 100
+    assert cache.sweep() == 1
+    assert cache.stats()['bytes'] == 200
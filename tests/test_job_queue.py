@@ -0,0 +1,79 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from job_queue import JobQueue
+from results import ResultStore
+
+
+class SlowConnection:
+    """Delays the first write of a flush so another flush can overtake it."""
+
+    def __init__(self, conn, started):
+        self.conn = conn
+        self.started = started
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+    def execute(self, sql, params=()):
+        self._stall()
+        return self.conn.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        self._stall()
+        return self.conn.executemany(sql, rows)
+
+    def _stall(self):
+        self.started.set()
+        time.sleep(0.3)
+
+
+def overtake(store, first, second):
+    """Queue and flush first on a slowed thread, then queue and flush second while it is writing."""
+    started = threading.Event()
+    connect = store._connect
+    slowed = threading.local()
+
+    def slow_connect():
+        return SlowConnection(connect(), started) if getattr(slowed, 'on', False) else connect()
+
+    store._connect = slow_connect
+
+    def flush_first():
+        slowed.on = True
+        first()
+        store.flush()
+
+    thread = threading.Thread(target=flush_first)
+    thread.start()
+    assert started.wait(5)
+    second()
+    store.flush()
+    thread.join(5)
+    store._connect = connect
+
+
+def test_later_updates_commit_after_earlier_ones(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), flush_interval=3600)
+    job = SimpleNamespace(id='job', profile_name='zedge', results_id='job', created=time.time(),
+                          items=[{'full_path': '/static/images/a.jpg'}])
+    queue.create(job)
+
+    overtake(queue, lambda: queue.lease('job', 0), lambda: queue.done('job', 0))
+
+    status = queue._connect().execute("SELECT status FROM items WHERE job_id = 'job'").fetchone()[0]
+    assert status == 'done'
+
+
+def test_results_commit_in_queue_order(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'), flush_interval=3600)
+    image = '/static/images/a.jpg'
+
+    overtake(store, lambda: store.add_result('job', 'zedge', {'image': image, 'metadata': {'title': 'first'}}),
+             lambda: store.add_result('job', 'zedge', {'image': image, 'metadata': {'title': 'regenerated'}}))
+
+    assert [row['metadata']['title'] for row in store.iter_results('job')] == ['regenerated']
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_scheduler import RateLimitScheduler, is_transient
+
+openai = pytest.importorskip('openai')
+httpx = pytest.importorskip('httpx')
+
+REQUEST = httpx.Request('POST', 'http://127.0.0.1/v1/chat/completions')
+
+
+def status_error(cls, status):
+    return cls('error', response=httpx.Response(status, request=REQUEST), body=None)
+
+
+def classify(exception):
+    return {'category': 'server'}
+
+
+class Raw:
+    headers = {}
+
+    def parse(self):
+        return 'parsed'
+
+
+def scheduler(**options):
+    return RateLimitScheduler(classify, max_retries=3, backoff_base=0, **options)
+
+
+def failing(exception):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise exception
+    return fn, calls
+
+
+@pytest.mark.parametrize('exception', [
+    status_error(openai.BadRequestError, 400),
+    status_error(openai.PermissionDeniedError, 403),
+    status_error(openai.APIStatusError, 413),
+])
+def test_client_errors_are_not_retried(exception):
+    fn, calls = failing(exception)
+    with pytest.raises(type(exception)):
+        scheduler().call('sk-test', 0, fn)
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize('exception', [
+    status_error(openai.InternalServerError, 500),
+    status_error(openai.APIStatusError, 408),
+    openai.APIConnectionError(request=REQUEST),
+    openai.APITimeoutError(request=REQUEST),
+])
+def test_transient_errors_are_retried(exception):
+    fn, calls = failing(exception)
+    with pytest.raises(type(exception)):
+        scheduler().call('sk-test', 0, fn)
+    assert len(calls) == 4
+
+
+def test_is_transient_ignores_message_text():
+    assert not is_transient(status_error(openai.BadRequestError, 400))
+    assert is_transient(status_error(openai.RateLimitError, 429))
+
+
+def test_async_waiters_are_woken_on_release():
+    rate = scheduler(initial_concurrency=1, max_concurrency=1)
+    waiting = []
+
+    async def slow():
+        await asyncio.sleep(0.2)
+        waiting.append(len(rate._async_waiters))
+        return Raw()
+
+    async def run():
+        start = time.monotonic()
+        results = await asyncio.gather(rate.acall('sk-test', 0, slow), rate.acall('sk-test', 0, slow))
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(run())
+    assert results == ['parsed', 'parsed']
+    # The second call waited on an event rather than polling, and started as soon as the first finished
+    assert waiting[0] == 1
+    assert elapsed < 0.6
+    assert rate._async_waiters == []
+
+
+def test_cancelled_async_calls_release_their_slots():
+    rate = scheduler(initial_concurrency=2, max_concurrency=2)
+
+    async def hang():
+        await asyncio.sleep(60)
+
+    async def quick():
+        return Raw()
+
+    async def run():
+        calls = [asyncio.ensure_future(rate.acall('sk-test', 0, hang)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+        assert next(iter(rate.stats().values()))['in_flight'] == 0
+        return await asyncio.wait_for(rate.acall('sk-test', 0, quick), 2)
+
+    assert asyncio.run(run()) == 'parsed'
@@ -0,0 +1,49 @@
+import sqlite3
+
+from results import ResultStore
+
+
+def result(image, title):
+    return {'image': image, 'metadata': {'title': title}}
+
+
+def test_same_image_under_two_profiles_keeps_both(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    store.add_result('job', 'zedge', result('/static/images/a.jpg', 'Z'))
+    store.add_result('job', 'stock', result('/static/images/a.jpg', 'S'))
+    assert [row['metadata']['title'] for row in store.iter_results('job', 'zedge')] == ['Z']
+    assert [row['metadata']['title'] for row in store.iter_results('job', 'stock')] == ['S']
+
+
+def test_error_does_not_replace_completed_result(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    store.add_result('job', 'zedge', result('/static/images/a.jpg', 'Z'))
+    store.add_error('job', 'zedge', '/static/images/a.jpg', 'boom')
+    assert store.summary('job')['completed'] == 1
+    assert store.summary('job')['failed'] == 0
+
+
+def test_old_stores_are_migrated(tmp_path):
+    path = str(tmp_path / 'results.db')
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE results (id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, image TEXT NOT NULL,'
+        ' profile TEXT NOT NULL, status TEXT NOT NULL, cached INTEGER NOT NULL DEFAULT 0, metadata TEXT,'
+        ' error TEXT, updated REAL NOT NULL, UNIQUE (job_id, image))'
+    )
+    conn.execute("INSERT INTO results VALUES (1, 'job', 'a.jpg', 'zedge', 'complete', 0, '{\"title\": \"Z\"}', NULL, 1)")
+    conn.commit()
+    conn.close()
+
+    store = ResultStore(path)
+    store.add_result('job', 'stock', result('a.jpg', 'S'))
+    assert sorted(store.summary('job')['profiles']) == ['stock', 'zedge']
+
+
+def test_completed_images_ignores_errors_and_other_profiles(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    store.add_result('job', 'zedge', result('/static/images/a.jpg', 'Z'))
+    store.add_result('sid', 'stock', result('/static/images/b.jpg', 'S'))
+    store.add_error('sid', 'zedge', '/static/images/c.jpg', 'boom')
+    images = ['/static/images/a.jpg', '/static/images/b.jpg', '/static/images/c.jpg', '/static/images/d.jpg']
+    assert store.completed_images(images, 'zedge') == {'/static/images/a.jpg'}
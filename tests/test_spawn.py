@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+import threading
+
+from imaging import create_image_pool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe():
+    return {'app_imported': 'app' in sys.modules, 'threads': [t.name for t in threading.enumerate()]}
+
+
+def test_image_pool_workers_do_not_import_app():
+    pool = create_image_pool(1)
+    try:
+        result = pool.submit(probe).result(timeout=60)
+    finally:
+        pool.shutdown()
+    assert not result['app_imported']
+    assert result['threads'] == ['MainThread']
+
+
+def test_entry_scripts_are_side_effect_free_when_reimported():
+    # What a spawned worker does with the launching script
+    code = (
+        'import runpy, sys\n'
+        'for script in ("server.py", "cli.py"):\n'
+        '    runpy.run_path(script, run_name="__mp_main__")\n'
+        'assert "app" not in sys.modules, "app imported"\n'
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, timeout=60)
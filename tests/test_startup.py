@@ -0,0 +1,34 @@
+import os
+import socket
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_signal_ready(port, listen):
+    code = (
+        'import socket, time, startup\n'
+        f'server = socket.create_server(("127.0.0.1", {port})) if {listen} else None\n'
+        f'startup.signal_ready("127.0.0.1", {port}, timeout=0.5)\n'
+        'time.sleep(3)\n'
+    )
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=30)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def test_no_ready_line_and_nonzero_exit_when_port_never_opens():
+    result = run_signal_ready(free_port(), listen=False)
+    assert result.returncode == 1
+    assert 'MDR_READY' not in result.stdout
+
+
+def test_ready_line_once_port_accepts_connections():
+    result = run_signal_ready(free_port(), listen=True)
+    assert result.returncode == 0
+    assert result.stdout.startswith('MDR_READY http://127.0.0.1:')
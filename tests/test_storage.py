@@ -0,0 +1,63 @@
+import io
+import os
+
+import pytest
+
+from storage import StorageFull, UploadCatalog, UploadStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / 'images'))
+
+
+def catalog(store, tmp_path, **quota):
+    return UploadCatalog(store, str(tmp_path / 'uploads.db'), min_idle=0, **quota)
+
+
+def upload(store, uploads, content, name):
+    content_hash, path, duplicate = store.save(io.BytesIO(content), name, 10 ** 6,
+                                               reserve=lambda size: uploads.make_room(size, 1))
+    uploads.record(path)
+    return path, duplicate
+
+
+def test_reupload_needs_no_room_and_evicts_nothing(store, tmp_path):
+    uploads = catalog(store, tmp_path, max_files=2)
+    exported, _ = upload(store, uploads, b'a' * 100, 'a.jpg')
+    kept, _ = upload(store, uploads, b'b' * 100, 'b.jpg')
+    uploads.mark_exported([exported])
+
+    path, duplicate = upload(store, uploads, b'b' * 100, 'b-again.jpg')
+    assert duplicate
+    assert os.path.exists(exported)
+    stats = uploads.stats()
+    assert (stats['files'], stats['bytes'], stats['evicted'], stats['rejected']) == (2, 200, 0, 0)
+
+
+def test_new_content_evicts_exported_images_first(store, tmp_path):
+    uploads = catalog(store, tmp_path, max_bytes=250)
+    exported, _ = upload(store, uploads, b'a' * 100, 'a.jpg')
+    kept, _ = upload(store, uploads, b'b' * 100, 'b.jpg')
+    uploads.mark_exported([exported])
+
+    upload(store, uploads, b'c' * 100, 'c.jpg')
+    assert not os.path.exists(exported)
+    assert os.path.exists(kept)
+    assert uploads.stats()['bytes'] == 200
+
+
+def test_new_content_is_refused_when_nothing_can_be_evicted(store, tmp_path):
+    uploads = catalog(store, tmp_path, max_bytes=150)
+    upload(store, uploads, b'a' * 100, 'a.jpg')
+    with pytest.raises(StorageFull):
+        upload(store, uploads, b'c' * 100, 'c.jpg')
+    assert uploads.stats()['rejected'] == 1
+    assert not os.listdir(os.path.join(store.root, '.incoming'))
+
+
+def test_scan_catalogs_existing_uploads(store, tmp_path):
+    path, _ = upload(store, UploadCatalog(store, str(tmp_path / 'old.db')), b'a' * 100, 'a.jpg')
+    uploads = catalog(store, tmp_path)
+    assert uploads.scan() == 1
+    assert uploads.stats()['bytes'] == 100